@@ -0,0 +1,75 @@
+"""Пропускная способность эндпоинтов WeatherViewSet на попаданиях в кэш.
+
+Заглушка OpenWeatherMap отвечает только на первый запрос каждого режима,
+дальше ответы идут из кэша, и разница между режимами - это стоимость
+сериализации: стандартный JSONRenderer DRF, FastJSONRenderer и
+FastJSONRenderer с готовым JSON в кэше. Запросы выполняются в процессе
+через тестовый клиент DRF, без сети и без базы данных.
+
+Запуск: python -m benchmarks.api_throughput --requests 2000
+"""
+import argparse
+import time
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import start_stub_server
+
+ENDPOINTS = (
+    ("current", "/api/weather/search/?q=Moscow"),
+    ("forecast", "/api/weather/forecast/?city=Moscow"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server()
+    setup_django(OPENWEATHERMAP_BASE_URL=base_url, ALLOWED_HOSTS=["*"])
+
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.test import APIClient
+
+    from weather import results
+    from weather.cache import get_weather_cache
+    from weather.renderers import FastJSONRenderer
+    from weather.views import WeatherViewSet
+
+    # Без троттлинга и обращений к сессии в БД
+    WeatherViewSet.throttle_classes = []
+    client = APIClient()
+    client.force_authenticate(user=User(username="benchmark"))
+
+    modes = (
+        ("drf JSONRenderer", JSONRenderer, False),
+        ("FastJSONRenderer", FastJSONRenderer, False),
+        ("fast + cached JSON", FastJSONRenderer, True),
+    )
+    encoder = "orjson" if results.orjson is not None else "stdlib json"
+    try:
+        for name, path in ENDPOINTS:
+            for label, renderer, encoded in modes:
+                WeatherViewSet.renderer_classes = [renderer]
+                settings.WEATHER_CACHE_ENCODED_RESPONSES = encoded
+                get_weather_cache().clear()
+                client.get(path)  # заполнение кэша
+
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    response = client.get(path)
+                elapsed = time.perf_counter() - start
+                assert response.status_code == 200, response.content
+                print(
+                    f"{name:8} {label:19}: {args.requests / elapsed:7.0f} req/s, "
+                    f"{elapsed / args.requests * 1e6:6.0f}us/req ({encoder})"
+                )
+        print(f"upstream calls: {state.calls}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Цена соединения с PostgreSQL: новое на каждый запрос, постоянное и пул.
+
+Имитирует HTTP-запросы так, как их обслуживает Django: сигналы
+request_started/request_finished вызывают close_if_unusable_or_obsolete(),
+между ними - несколько коротких запросов к базе. Для каждого режима -
+отдельное подключение с тем же DATABASES['default'] (POSTGRES_* из
+окружения), но своими CONN_MAX_AGE и OPTIONS['pool']. Режим pool требует
+psycopg 3 и psycopg_pool и без них пропускается. Нужен работающий
+PostgreSQL.
+
+Запуск: python -m benchmarks.db_connections --requests 500 --queries 3
+"""
+import argparse
+import copy
+import importlib.util
+import time
+
+from benchmarks.django_setup import setup_django
+
+
+def mode_settings(base, mode):
+    settings = copy.deepcopy(base)
+    settings["OPTIONS"].pop("pool", None)
+    settings["CONN_MAX_AGE"] = 60 if mode == "persistent" else 0
+    if mode == "pool":
+        settings["OPTIONS"]["pool"] = {"min_size": 1, "max_size": 4}
+    return settings
+
+
+def run_mode(connection, requests, queries):
+    """Время на HTTP-запрос и число подключений (для пула - выдач соединения)"""
+    from django.db.backends.signals import connection_created
+
+    connects = []
+
+    def count(sender, **kwargs):
+        connects.append(kwargs["connection"].alias)
+
+    connection_created.connect(count)
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        connection.close_if_unusable_or_obsolete()
+        with connection.cursor() as cursor:
+            for _ in range(queries):
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        connection.close_if_unusable_or_obsolete()
+        timings.append(time.perf_counter() - start)
+    connection.close()
+    connection_created.disconnect(count)
+    timings.sort()
+    return {
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "p99_ms": timings[int(len(timings) * 0.99)] * 1000,
+        "connects": connects.count(connection.alias),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=3, help="запросов к базе на HTTP-запрос")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db.utils import ConnectionHandler
+
+    modes = ["direct", "persistent"]
+    if importlib.util.find_spec("psycopg_pool") is not None:
+        modes.append("pool")
+    else:
+        print("psycopg_pool не установлен, режим pool пропущен")
+
+    base = settings.DATABASES["default"]
+    handler = ConnectionHandler({mode: mode_settings(base, mode) for mode in modes})
+    results = {}
+    try:
+        for mode in modes:
+            results[mode] = run_mode(handler[mode], args.requests, args.queries)
+    finally:
+        for mode in modes:
+            if mode == "pool":
+                handler[mode].close_pool()
+
+    print(f"{args.requests} requests, {args.queries} queries each, {base['HOST']}:{base['PORT']}")
+    print(f"{'mode':12} {'p50 ms':>8} {'p99 ms':>8} {'connects':>8}")
+    for mode, row in results.items():
+        print(f"{mode:12} {row['p50_ms']:8.2f} {row['p99_ms']:8.2f} {row['connects']:8}")
+
+
+if __name__ == "__main__":
+    main()
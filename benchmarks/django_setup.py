@@ -0,0 +1,19 @@
+import os
+
+import django
+
+
+def setup_django(**overrides) -> None:
+    """Инициализация Django для бенчмарков с переопределением настроек.
+
+    Настройки меняются до django.setup(), чтобы их видели и подключения
+    к базе данных, которые читают DATABASES при первом обращении.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "weather_project.settings")
+    os.environ.setdefault("OPENWEATHERMAP_API_KEY", "benchmark")
+
+    from django.conf import settings
+
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
@@ -0,0 +1,194 @@
+"""Сравнение агрегации прогноза по дням: прежние _format_forecast и
+process_forecast_data против ForecastAggregator.
+
+Синтетические прогнозы разного размера (у OpenWeatherMap 40 слотов, большие
+размеры показывают асимптотику). Django не нужен.
+
+ForecastAggregator кроме сводки строит 3-часовые слоты каждого дня, поэтому
+одиночный разбор ответа OpenWeatherMap (40 слотов) у него медленнее прежнего
+_format_forecast, примерно в 1,6 раза, и медленнее двух прежних разборов для
+сводки и первых слотов (pipeline): это регрессия. Выигрыш - линейный выбор самого
+частого описания (distinct).
+
+Запуск: python -m benchmarks.forecast_aggregation --slots 40 4000 40000
+"""
+import argparse
+import timeit
+from datetime import datetime, timezone
+
+from benchmarks.stub_server import forecast_payload
+from weather.forecast import DEFAULT_AGGREGATES, Aggregate, ForecastAggregator
+
+# Тот же набор агрегатов, что считал прежний _format_forecast
+LEGACY_AGGREGATES = [
+    aggregate
+    for aggregate in DEFAULT_AGGREGATES
+    if aggregate.field
+    in ("avg_temperature", "avg_humidity", "avg_pressure", "avg_wind_speed", "avg_clouds", "description")
+] + [Aggregate("icon", "icon", "first")]
+
+
+def legacy_format_forecast(data):
+    """Реализация WeatherService._format_forecast до перехода на столбцы"""
+    daily_forecasts = {}
+
+    for item in data["list"]:
+        date = item["dt_txt"].split()[0]
+        if date not in daily_forecasts:
+            daily_forecasts[date] = {
+                "date": date,
+                "city": data["city"]["name"],
+                "country": data["city"]["country"],
+                "temperatures": [],
+                "descriptions": [],
+                "icons": [],
+                "humidity": [],
+                "pressure": [],
+                "wind_speed": [],
+                "clouds": [],
+            }
+
+        forecast = daily_forecasts[date]
+        forecast["temperatures"].append(round(item["main"]["temp"]))
+        forecast["descriptions"].append(item["weather"][0]["description"])
+        forecast["icons"].append(item["weather"][0]["icon"])
+        forecast["humidity"].append(item["main"]["humidity"])
+        forecast["pressure"].append(item["main"]["pressure"])
+        forecast["wind_speed"].append(item["wind"]["speed"])
+        forecast["clouds"].append(item["clouds"]["all"])
+
+    for date, forecast in daily_forecasts.items():
+        forecast["avg_temperature"] = round(
+            sum(forecast["temperatures"]) / len(forecast["temperatures"])
+        )
+        forecast["avg_humidity"] = round(sum(forecast["humidity"]) / len(forecast["humidity"]))
+        forecast["avg_pressure"] = round(sum(forecast["pressure"]) / len(forecast["pressure"]))
+        forecast["avg_wind_speed"] = round(
+            sum(forecast["wind_speed"]) / len(forecast["wind_speed"]), 1
+        )
+        forecast["avg_clouds"] = round(sum(forecast["clouds"]) / len(forecast["clouds"]))
+        forecast["description"] = max(
+            set(forecast["descriptions"]), key=forecast["descriptions"].count
+        )
+        forecast["icon"] = forecast["icons"][0]
+
+        del forecast["temperatures"]
+        del forecast["descriptions"]
+        del forecast["icons"]
+        del forecast["humidity"]
+        del forecast["pressure"]
+        del forecast["wind_speed"]
+        del forecast["clouds"]
+
+    return {
+        "city": data["city"]["name"],
+        "country": data["city"]["country"],
+        "forecasts": list(daily_forecasts.values()),
+    }
+
+
+def legacy_process_forecast_data(forecast_data):
+    """Прежний WeatherService.process_forecast_data: второй независимый разбор payload"""
+    processed_forecast = []
+    current_date = None
+    daily_forecast = None
+
+    for item in forecast_data["list"]:
+        date = datetime.fromtimestamp(item["dt"]).date()
+        if current_date != date:
+            if daily_forecast:
+                processed_forecast.append(daily_forecast)
+            current_date = date
+            daily_forecast = {
+                "date": date,
+                "temperature": item["main"]["temp"],
+                "feels_like": item["main"]["feels_like"],
+                "humidity": item["main"]["humidity"],
+                "pressure": item["main"]["pressure"],
+                "wind_speed": item["wind"]["speed"],
+                "description": item["weather"][0]["description"],
+                "icon": item["weather"][0]["icon"],
+            }
+
+    if daily_forecast:
+        processed_forecast.append(daily_forecast)
+    return processed_forecast[:7]
+
+
+def pipeline(requests: int, repeat: int) -> None:
+    """Один ответ API, обработанный для сводки и для первых слотов дня несколько раз
+    (обновление, пакетный запрос, страница прогноза)"""
+    payload = forecast_payload()
+
+    def legacy():
+        for _ in range(requests):
+            legacy_format_forecast(payload)
+            legacy_process_forecast_data(payload)
+
+    def unified():
+        aggregator = ForecastAggregator()
+        for _ in range(requests):
+            days = aggregator.aggregate(payload)["forecasts"]
+            [day["slots"][0] for day in days]
+        return aggregator.get_stats()
+
+    legacy_time = min(timeit.repeat(legacy, number=1, repeat=repeat))
+    unified_time = min(timeit.repeat(unified, number=1, repeat=repeat))
+    stats = unified()
+    print(
+        f"pipeline {requests} requests: legacy {requests * 2} parses {legacy_time * 1e6:9.1f}us, "
+        f"unified {stats['parses']} parse(s) {unified_time * 1e6:9.1f}us"
+    )
+
+
+def one_day_payload(slots: int) -> dict:
+    """Все слоты в одном дне: худший случай для подсчёта частот через list.count.
+
+    dt и dt_txt меняются вместе, смещение города - 0: обе реализации видят
+    один и тот же день.
+    """
+    payload = forecast_payload(slots=slots)
+    payload["city"]["timezone"] = 0
+    midnight = payload["list"][0]["dt"] // 86400 * 86400
+    for i, item in enumerate(payload["list"]):
+        item["dt"] = midnight + i * 86400 // slots
+        item["dt_txt"] = datetime.fromtimestamp(item["dt"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return payload
+
+
+def distinct_payload(slots: int) -> dict:
+    """Один день с неповторяющимися описаниями: max(set, key=list.count) квадратичен"""
+    payload = one_day_payload(slots)
+    for i, item in enumerate(payload["list"]):
+        item["weather"][0]["description"] = f"описание {i}"
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slots", type=int, nargs="+", default=[40, 4000, 40000])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    implementations = (
+        ("legacy", legacy_format_forecast),
+        ("same set", ForecastAggregator(LEGACY_AGGREGATES).aggregate),
+        ("default", ForecastAggregator().aggregate),
+    )
+    payloads = (("by day", forecast_payload), ("one day", one_day_payload), ("distinct", distinct_payload))
+    for name, build in payloads:
+        for slots in args.slots:
+            if build is distinct_payload and slots > 4000:
+                continue
+            payload = build(slots=slots)
+            number = max(1, 4000 // slots)
+            timings = []
+            for label, fn in implementations:
+                best = min(timeit.repeat(lambda: fn(payload), number=number, repeat=args.repeat))
+                timings.append(f"{label} {best / number * 1e6:9.1f}us")
+            print(f"{name:8} {slots:6} slots: " + ", ".join(timings))
+    pipeline(args.requests, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Поиск в справочнике городов: двоичный поиск в mmap против перебора.
+
+Загружает справочник из --path (по умолчанию weather/data; для проверки на
+полном наборе - каталог, собранный build_gazetteer --geonames) и меряет время
+точного поиска, подсказок по префиксу и поиска с опечатками. Для сравнения -
+перебор всех названий, разобранных в список. Django не нужен.
+
+Запуск: python -m benchmarks.gazetteer_lookup --queries 20000
+"""
+import argparse
+import os
+import random
+import time
+
+from weather.gazetteer import CITIES_FILE, DATA_DIR, Gazetteer, normalize_name
+
+
+def load_linear(path):
+    """Все названия и синонимы списком: как выглядел бы поиск без индекса"""
+    names = []
+    with open(os.path.join(path, CITIES_FILE), encoding="utf-8") as f:
+        for line in f:
+            place_id, name, local_name, _, _, _, population, aliases = line.rstrip("\n").split("\t")
+            for value in (name, local_name, *aliases.split(",")):
+                if value:
+                    names.append((normalize_name(value), place_id, int(population)))
+    return names
+
+
+def linear_resolve(names, query):
+    key = normalize_name(query)
+    matches = [(population, place_id) for name, place_id, population in names if name == key]
+    return max(matches)[1] if matches else None
+
+
+def measure(label, fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    print(f"{label:<28} p50={p50:8.1f}us  p99={p99:8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--path", default=DATA_DIR)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    gazetteer = Gazetteer(args.path)
+    print(f"mmap load: {(time.perf_counter() - start) * 1000:.2f}ms, cities={len(gazetteer)}")
+    start = time.perf_counter()
+    names = load_linear(args.path)
+    print(f"list load: {(time.perf_counter() - start) * 1000:.2f}ms, names={len(names)}")
+
+    rng = random.Random(42)
+    sample = [name for name, _, _ in rng.sample(names, min(len(names), 500))]
+    queries = [rng.choice(sample) for _ in range(args.queries)]
+    prefixes = [query[: rng.randint(2, 4)] for query in queries]
+    typos = [query[:-1] + "x" if len(query) > 4 else query for query in queries]
+
+    measure("resolve (mmap)", gazetteer.resolve, queries)
+    measure("resolve (linear scan)", lambda query: linear_resolve(names, query), queries[:200])
+    measure("autocomplete prefix", gazetteer.search, prefixes)
+    measure("autocomplete with typo", gazetteer.suggest, typos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Задержка получения данных главной страницы: последовательно и параллельно.
+
+Запуск: python -m benchmarks.home_latency --latency 0.1 --iterations 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    server, _, base_url = start_stub_server(latency=args.latency)
+    setup_django(OPENWEATHERMAP_BASE_URL=base_url)
+
+    from django.conf import settings
+    from weather.cache import WeatherCache
+    from weather.http import async_client_scope
+    from weather.services import WeatherService
+
+    def sequential(service):
+        service.get_current_weather("Moscow")
+        service.get_forecast("Moscow")
+
+    def threads(service):
+        service.get_current_and_forecast("Moscow")
+
+    def run_async(service):
+        async def both():
+            # Клиент httpx на время цикла, как под ASGI на время работы сервера
+            async with async_client_scope():
+                await service.aget_current_and_forecast("Moscow")
+
+        asyncio.run(both())
+
+    modes = [
+        ("sequential", sequential, "httpx"),
+        ("thread pool", threads, "httpx"),
+        ("asyncio (threads)", run_async, "threads"),
+        ("asyncio (httpx)", run_async, "httpx"),
+    ]
+    try:
+        for name, run, async_client in modes:
+            settings.OPENWEATHERMAP_ASYNC_CLIENT = async_client
+            samples = []
+            for _ in range(args.iterations):
+                # Пустой кэш: каждая итерация идёт в заглушку
+                service = WeatherService(cache=WeatherCache())
+                start = time.perf_counter()
+                run(service)
+                samples.append((time.perf_counter() - start) * 1000)
+            print(f"{name:20} p50={statistics.median(samples):.1f}ms max={max(samples):.1f}ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
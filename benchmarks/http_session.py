@@ -0,0 +1,58 @@
+"""Задержка запросов к заглушке OpenWeatherMap с переиспользованием соединений и без.
+
+Запуск: python -m benchmarks.http_session --requests 500
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from benchmarks.stub_server import start_stub_server
+from weather.http import build_session
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(get, url: str, count: int) -> list:
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = get(url, params={"q": "Moscow"}, timeout=(3.05, 5))
+        response.raise_for_status()
+        response.json()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, _, base_url = start_stub_server(latency=args.latency)
+    url = f"{base_url}/weather"
+    try:
+        session = build_session()
+        modes = {
+            "requests.get (new connection)": requests.get,
+            "pooled session (keep-alive)": session.get,
+        }
+        for name, get in modes.items():
+            measure(get, url, 20)  # прогрев
+            samples = measure(get, url, args.requests)
+            print(
+                f"{name:32} p50={statistics.median(samples):.2f}ms "
+                f"p99={percentile(samples, 99):.2f}ms"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
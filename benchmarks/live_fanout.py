@@ -0,0 +1,63 @@
+"""Рассылка обновлений погоды: тысячи подписчиков на сотни городов.
+
+Подписывает --subscribers очередей на --cities городов одного LiveWeatherHub
+и ждёт, пока каждая получит первое событие. Считает обращения к заглушке
+OpenWeatherMap: на каждый город должно приходиться одно.
+
+Запуск: python -m benchmarks.live_fanout --subscribers 10000 --cities 200
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--cities", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(latency=args.latency)
+    setup_django(
+        OPENWEATHERMAP_BASE_URL=base_url,
+        OPENWEATHERMAP_CALLS_PER_MINUTE=100_000,
+        WEATHER_RECORD_OBSERVATIONS=False,
+    )
+
+    from weather.cache import WeatherCache
+    from weather.live import LiveWeatherHub
+    from weather.services import WeatherService
+
+    cities = [f"City{i}" for i in range(args.cities)]
+
+    async def run():
+        hub = LiveWeatherHub(interval=3600, service=WeatherService(cache=WeatherCache()))
+        queues = [asyncio.Queue() for _ in range(args.subscribers)]
+        start = time.perf_counter()
+        for i, queue in enumerate(queues):
+            hub.subscribe(cities[i % len(cities)], queue)
+        for queue in queues:
+            await queue.get()
+        elapsed = time.perf_counter() - start
+        stats = hub.get_stats()
+        for i, queue in enumerate(queues):
+            hub.unsubscribe(cities[i % len(cities)], queue)
+        return elapsed, stats
+
+    try:
+        elapsed, stats = asyncio.run(run())
+        print(
+            f"{args.subscribers} subscribers on {args.cities} cities: "
+            f"upstream calls={state.calls}, service polls={stats['polls']}, "
+            f"messages={stats['messages']}, first event to all in {elapsed * 1000:.0f}ms"
+        )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Нагрузочный тест API погоды и главной страницы на заглушке OpenWeatherMap.
+
+Сценарий - смесь запросов к /api/weather/current|search|forecast|by_coordinates
+и главной странице для --cities городов. Запросы выполняются --concurrency
+потоками, каждый со своей авторизованной сессией. По умолчанию приложение
+работает в этом же процессе (тестовый клиент Django, временная база SQLite,
+без троттлинга DRF и записи наблюдений). С --target нагрузка идёт по HTTP
+на запущенный сервер. Этот сервер должен обращаться к заглушке, адрес которой
+выводится при старте (порт задаёт --stub-port), а пользователь --username
+должен иметь локацию по умолчанию.
+
+Отчёт: RPS, задержки p50/p95/p99 по видам запросов и число обращений к
+заглушке. С --output результат сохраняется в JSON вместе с коммитом, а
+--baseline сравнивает его с сохранённым ранее.
+
+Запуск: python -m benchmarks.load_test --scenario mixed --requests 2000 --concurrency 16
+    --latency 0.05 --error-rate 0.01 --output benchmarks/results/$(git rev-parse --short HEAD).json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import start_stub_server
+
+# Доли видов запросов в сценарии
+SCENARIOS = {
+    "current": {"current": 1},
+    "search": {"search": 1},
+    "forecast": {"forecast": 1},
+    "by_coordinates": {"by_coordinates": 1},
+    "home": {"home": 1},
+    "mixed": {"current": 4, "search": 2, "forecast": 2, "by_coordinates": 1, "home": 1},
+}
+
+PASSWORD = "load-test-password"
+
+
+def city_name(index: int) -> str:
+    """Название города только из букв (search и forecast отклоняют цифры)"""
+    letters = ""
+    while True:
+        index, digit = divmod(index, 26)
+        letters += chr(ord("a") + digit)
+        if not index:
+            return "Gorod" + letters
+
+
+def request_path(kind: str, index: int) -> str:
+    city = city_name(index)
+    if kind == "current":
+        return f"/api/weather/current/?city={city}"
+    if kind == "search":
+        return f"/api/weather/search/?q={city}"
+    if kind == "forecast":
+        return f"/api/weather/forecast/?city={city}"
+    if kind == "by_coordinates":
+        # Точки в ~50 км друг от друга: соседние не попадают в радиус геоиндекса
+        lat, lon = 40 + (index % 40) * 0.5, 20 + (index // 40) * 0.5
+        return f"/api/weather/by_coordinates/?lat={lat}&lon={lon}"
+    return "/"
+
+
+def build_plan(scenario: str, requests: int, cities: int, seed: int) -> List[Tuple[str, str]]:
+    """Детерминированный список запросов (вид, путь)"""
+    rng = random.Random(seed)
+    kinds = list(SCENARIOS[scenario])
+    weights = list(SCENARIOS[scenario].values())
+    return [
+        (kind, request_path(kind, rng.randrange(cities)))
+        for kind in rng.choices(kinds, weights, k=requests)
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу для отсортированного списка"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def summarize(samples: List[Tuple[float, int]], elapsed: float) -> Dict[str, object]:
+    latencies = sorted(latency for latency, _ in samples)
+    statuses: Dict[str, int] = {}
+    for _, code in samples:
+        statuses[str(code)] = statuses.get(str(code), 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, code in samples if code >= 400),
+        "statuses": statuses,
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def run_load(
+    plan: List[Tuple[str, str]], clients: List[Callable[[str], int]]
+) -> Tuple[Dict[str, List[Tuple[float, int]]], float]:
+    """Выполнение плана: каждый клиент в своём потоке берёт свою часть запросов"""
+    chunks = [plan[i::len(clients)] for i in range(len(clients))]
+
+    def worker(get: Callable[[str], int], chunk: List[Tuple[str, str]]):
+        samples = []
+        for kind, path in chunk:
+            start = time.perf_counter()
+            code = get(path)
+            samples.append((kind, time.perf_counter() - start, code))
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+        results = list(executor.map(worker, clients, chunks))
+    elapsed = time.perf_counter() - start
+
+    by_kind: Dict[str, List[Tuple[float, int]]] = {}
+    for samples in results:
+        for kind, latency, code in samples:
+            by_kind.setdefault(kind, []).append((latency, code))
+    return by_kind, elapsed
+
+
+def in_process_clients(
+    base_url: str, concurrency: int, db_path: str
+) -> List[Callable[[str], int]]:
+    """Клиенты тестового клиента Django в этом процессе"""
+    setup_django(
+        OPENWEATHERMAP_BASE_URL=base_url,
+        OPENWEATHERMAP_CALLS_PER_MINUTE=1_000_000,
+        ALLOWED_HOSTS=["*"],
+        DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": db_path}},
+        WEATHER_RECORD_OBSERVATIONS=False,
+    )
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+
+    from weather.models import Location
+    from weather.views import WeatherViewSet
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user(username="loadtest", password=PASSWORD)
+    Location.objects.create(
+        user=user, city=city_name(0), country="RU", latitude=40, longitude=20, is_default=True
+    )
+    # Лимиты DRF рассчитаны на пользователей, а не на нагрузочный тест
+    WeatherViewSet.throttle_classes = []
+
+    clients = []
+    for _ in range(concurrency):
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        clients.append(lambda path, client=client: client.get(path).status_code)
+    return clients
+
+
+def http_clients(
+    target: str, concurrency: int, username: str, password: str
+) -> List[Callable[[str], int]]:
+    """Клиенты requests с авторизацией через форму входа запущенного сервера"""
+    import requests
+
+    clients = []
+    for _ in range(concurrency):
+        session = requests.Session()
+        session.get(f"{target}/login/")
+        response = session.post(
+            f"{target}/login/",
+            data={
+                "username": username,
+                "password": password,
+                "csrfmiddlewaretoken": session.cookies.get("csrftoken", ""),
+            },
+            headers={"Referer": f"{target}/login/"},
+            allow_redirects=False,
+        )
+        if response.status_code != 302:
+            raise SystemExit(f"Не удалось войти как {username}: HTTP {response.status_code}")
+        clients.append(
+            lambda path, session=session: session.get(
+                f"{target}{path}", allow_redirects=False
+            ).status_code
+        )
+    return clients
+
+
+def git_revision() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def print_report(report: Dict[str, object]) -> None:
+    print(
+        f"{'':15} {'requests':>8} {'errors':>6} {'rps':>8} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for kind, row in rows:
+        print(
+            f"{kind:15} {row['requests']:8} {row['errors']:6} {row['rps']:8.1f} "
+            f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f}"
+        )
+    upstream = report["upstream"]
+    print(
+        f"upstream calls: {upstream['calls']} {upstream['by_endpoint']}, "
+        f"injected errors: {upstream['errors']}"
+    )
+
+
+def print_comparison(report: Dict[str, object], baseline: Dict[str, object]) -> None:
+    """Изменение RPS и p95 относительно сохранённого результата"""
+    print(f"vs {baseline.get('commit') or 'baseline'} ({baseline.get('created')}):")
+    if baseline.get("params") != report["params"]:
+        print(f"  параметры отличаются: {baseline.get('params')}")
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for kind, row in rows:
+        old = baseline["total"] if kind == "total" else baseline["endpoints"].get(kind)
+        if not old:
+            continue
+        print(
+            f"{kind:15} rps {_change(old['rps'], row['rps']):>8}  "
+            f"p95 {_change(old['p95_ms'], row['p95_ms']):>8}"
+        )
+
+
+def _change(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушки, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--padding", type=int, default=0, help="добавочные байты в ответе")
+    parser.add_argument("--target", help="адрес запущенного сервера: http://127.0.0.1:8000")
+    parser.add_argument("--stub-port", type=int, default=0)
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--output", help="файл для результата в JSON")
+    parser.add_argument("--baseline", help="JSON предыдущего запуска для сравнения")
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(
+        args.stub_port, args.latency, args.error_rate, args.padding
+    )
+    print(f"OpenWeatherMap stub: {base_url}")
+    plan = build_plan(args.scenario, args.requests, args.cities, args.seed)
+    db_dir = tempfile.TemporaryDirectory() if not args.target else None
+    try:
+        if args.target:
+            clients = http_clients(
+                args.target.rstrip("/"), args.concurrency, args.username, args.password
+            )
+        else:
+            clients = in_process_clients(
+                base_url, args.concurrency, os.path.join(db_dir.name, "load_test.sqlite3")
+            )
+        by_kind, elapsed = run_load(plan, clients)
+    finally:
+        server.shutdown()
+        if db_dir is not None:
+            db_dir.cleanup()
+
+    report = {
+        **git_revision(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": {
+            name: getattr(args, name)
+            for name in (
+                "scenario", "requests", "concurrency", "cities", "seed",
+                "latency", "error_rate", "padding", "target",
+            )
+        },
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize([s for samples in by_kind.values() for s in samples], elapsed),
+        "endpoints": {kind: summarize(by_kind[kind], elapsed) for kind in sorted(by_kind)},
+        "upstream": state.get_stats(),
+    }
+    print_report(report)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print_comparison(report, json.load(f))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Память, размер pickle и время кодирования в JSON для кэшированных результатов:
+словари (прежнее представление) против классов со слотами из weather.results.
+
+Запуск: python -m benchmarks.result_memory --entries 100000
+"""
+import argparse
+import gc
+import json
+import pickle
+import time
+import tracemalloc
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import current_payload, forecast_payload
+
+
+def measure_memory(build, entries):
+    gc.collect()
+    tracemalloc.start()
+    values = [build(i) for i in range(entries)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return values, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from weather import results
+    from weather.services import WeatherService
+
+    service = WeatherService()
+    current = current_payload()
+    forecast = forecast_payload()
+    # Агрегатор запоминает результат по городу и времени: разные города на каждую запись
+    forecast_entries = max(1, args.entries // 20)
+
+    def typed_current(i):
+        current["name"] = f"City {i}"
+        return service._format_current_weather(current)
+
+    def typed_forecast(i):
+        forecast["city"]["name"] = f"City {i}"
+        return service.forecast_aggregator.aggregate(forecast)
+
+    cases = (
+        ("current", args.entries, typed_current),
+        ("forecast", forecast_entries, typed_forecast),
+    )
+    for name, entries, build_typed in cases:
+        typed, typed_size = measure_memory(build_typed, entries)
+        plain, plain_size = measure_memory(lambda i: typed[i].to_dict(), entries)
+
+        plain_pickle = sum(len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for value in plain)
+        typed_pickle = sum(len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for value in typed)
+
+        timings = {}
+        for label, encode, values in (
+            ("json(dict)", lambda value: json.dumps(value, ensure_ascii=False), plain),
+            ("dumps(result)", results.dumps, typed),
+        ):
+            start = time.perf_counter()
+            for value in values:
+                encode(value)
+            timings[label] = (time.perf_counter() - start) / entries * 1e6
+
+        print(
+            f"{name:8} {entries} entries: memory dict {plain_size / 2**20:7.1f}MiB, "
+            f"slots {typed_size / 2**20:7.1f}MiB; "
+            f"pickle dict {plain_pickle / entries:6.0f}B, slots {typed_pickle / entries:6.0f}B; "
+            + ", ".join(f"{label} {value:6.2f}us" for label, value in timings.items())
+            + (" (orjson)" if results.orjson is not None else " (stdlib json)")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Сравнение режимов запуска: runserver против gunicorn (gthread и uvicorn).
+
+Для каждого режима поднимает сервер отдельным процессом на временной базе
+SQLite и заглушке OpenWeatherMap. На него подаётся один и тот же план
+запросов из load_test. Каждый режим стартует с холодным кэшем; воркеры
+gunicorn кэшируют независимо (общего REDIS_URL здесь нет), поэтому обращений
+к заглушке у них больше.
+
+Запуск: python -m benchmarks.serving_modes --requests 2000 --concurrency 32 --workers 4
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import requests
+
+from benchmarks.django_setup import setup_django
+from benchmarks.load_test import (
+    PASSWORD,
+    SCENARIOS,
+    build_plan,
+    city_name,
+    http_clients,
+    run_load,
+    summarize,
+)
+from benchmarks.stub_server import start_stub_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode: str, port: int, args) -> Tuple[List[str], Dict[str, str]]:
+    if mode == "runserver":
+        return [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"], {}
+    return [sys.executable, "-m", "gunicorn"], {
+        "WEB_WORKER_CLASS": mode,
+        "WEB_BIND": f"127.0.0.1:{port}",
+        "WEB_CONCURRENCY": str(args.workers),
+        "WEB_THREADS": str(args.threads),
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            requests.get(f"{url}/login/", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"Сервер {url} не ответил за {timeout} сек")
+
+
+def prepare_database() -> None:
+    """Миграции и пользователь с локацией по умолчанию (главная страница)"""
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+
+    from weather.models import Location
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user(username="loadtest", password=PASSWORD)
+    Location.objects.create(
+        user=user, city=city_name(0), country="RU", latitude=40, longitude=20, is_default=True
+    )
+
+
+def main():
+    default_modes = ["runserver", "gthread"]
+    if importlib.util.find_spec("uvicorn") is not None:
+        default_modes.append("uvicorn")
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--modes", nargs="+", default=default_modes,
+                        choices=["runserver", "gthread", "uvicorn"])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка заглушки, сек")
+    parser.add_argument("--workers", type=int, default=4, help="WEB_CONCURRENCY для gunicorn")
+    parser.add_argument("--threads", type=int, default=8, help="WEB_THREADS для gthread")
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(latency=args.latency)
+    db_dir = tempfile.TemporaryDirectory()
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "benchmarks.serving_settings",
+        "BENCHMARK_DATABASE": os.path.join(db_dir.name, "serving.sqlite3"),
+        "OPENWEATHERMAP_API_KEY": "benchmark",
+        "OPENWEATHERMAP_BASE_URL": base_url,
+        "OPENWEATHERMAP_CALLS_PER_MINUTE": "1000000",
+        "WEATHER_RECORD_OBSERVATIONS": "False",
+        "DEBUG": "False",
+    }
+    os.environ.update(env)
+    plan = build_plan(args.scenario, args.requests, args.cities, seed=0)
+    results = {}
+    try:
+        prepare_database()
+        for mode in args.modes:
+            port = free_port()
+            command, extra_env = server_command(mode, port, args)
+            process = subprocess.Popen(
+                command,
+                cwd=ROOT,
+                env={**env, **extra_env},
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                url = f"http://127.0.0.1:{port}"
+                wait_ready(url, process)
+                calls_before = state.calls
+                clients = http_clients(url, args.concurrency, "loadtest", PASSWORD)
+                by_kind, elapsed = run_load(plan, clients)
+                samples = [sample for kind_samples in by_kind.values() for sample in kind_samples]
+                results[mode] = summarize(samples, elapsed)
+                results[mode]["upstream_calls"] = state.calls - calls_before
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        server.shutdown()
+        db_dir.cleanup()
+
+    print(
+        f"{args.requests} requests ({args.scenario}), concurrency {args.concurrency}, "
+        f"gunicorn: {args.workers} workers, {args.threads} threads (gthread)"
+    )
+    print(f"{'mode':10} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6} {'upstream':>8}")
+    for mode, row in results.items():
+        print(
+            f"{mode:10} {row['rps']:8.1f} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} "
+            f"{row['p99_ms']:8.2f} {row['errors']:6} {row['upstream_calls']:8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""Настройки приложения для бенчмарков с отдельными процессами сервера.
+
+Как weather_project.settings, но с базой SQLite из BENCHMARK_DATABASE и без
+троттлинга DRF. Адрес заглушки OpenWeatherMap и прочее передаются обычными
+переменными окружения (OPENWEATHERMAP_BASE_URL и т.д.).
+"""
+import os
+
+from weather_project.settings import *  # noqa: F401,F403
+from weather_project.settings import REST_FRAMEWORK
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["BENCHMARK_DATABASE"],
+        # Несколько процессов пишут сессии в один файл
+        "OPTIONS": {"timeout": 20},
+    }
+}
+REST_FRAMEWORK = {**REST_FRAMEWORK, "DEFAULT_THROTTLE_CLASSES": []}
@@ -0,0 +1,62 @@
+"""Всплеск одновременных запросов одного города на пустой кэш.
+
+Считает обращения к заглушке OpenWeatherMap: при объединении запросов
+на каждый ключ должно приходиться одно обращение за истечение кэша.
+
+Запуск: python -m benchmarks.singleflight_burst --clients 200 --rounds 3
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(latency=args.latency)
+    setup_django(OPENWEATHERMAP_BASE_URL=base_url, OPENWEATHERMAP_ASYNC_CLIENT="httpx")
+
+    from weather.cache import WeatherCache
+    from weather.http import async_client_scope
+    from weather.services import WeatherService
+
+    def thread_burst(service):
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            list(executor.map(lambda _: service.get_current_weather("Moscow"), range(args.clients)))
+
+    def async_burst(service):
+        async def burst():
+            async with async_client_scope():
+                await asyncio.gather(
+                    *(service.aget_current_weather("Moscow") for _ in range(args.clients))
+                )
+
+        asyncio.run(burst())
+
+    try:
+        for name, burst in (("threads", thread_burst), ("asyncio", async_burst)):
+            for round_number in range(1, args.rounds + 1):
+                # Новый кэш имитирует истечение TTL перед всплеском
+                service = WeatherService(cache=WeatherCache())
+                calls_before = state.calls
+                start = time.perf_counter()
+                burst(service)
+                elapsed = (time.perf_counter() - start) * 1000
+                print(
+                    f"{name:8} round {round_number}: {args.clients} clients, "
+                    f"upstream calls={state.calls - calls_before}, {elapsed:.0f}ms"
+                )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Отдача статики: django.views.static.serve против WhiteNoise.
+
+Собирает static/ во временный STATIC_ROOT (collectstatic только из
+STATICFILES_DIRS) и запрашивает собранный CSS Tailwind: прежним маршрутом
+с представлением serve по имени без хэша и через WhiteNoiseMiddleware по имени
+с хэшем с Accept-Encoding: br, gzip. Печатает время ответа, размер тела и
+Cache-Control. Оба запроса проходят через обработчик Django в том же
+процессе, без сети.
+
+Запуск: python -m benchmarks.static_assets --requests 2000
+"""
+import argparse
+import tempfile
+import time
+
+from django.urls import path
+
+from benchmarks.django_setup import setup_django
+
+ASSET = "css/app.css"
+
+
+def legacy_serve(request, name):
+    """Маршрут static/, которым статика отдавалась без DEBUG до WhiteNoise"""
+    from django.conf import settings
+    from django.views.static import serve
+
+    return serve(request, name, document_root=settings.STATIC_ROOT)
+
+
+# Другой префикс: файлы из STATIC_ROOT под /static/ перехватывает WhiteNoise
+urlpatterns = [path("legacy-static/<path:name>", legacy_serve)]
+
+
+def measure(label, fn, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = fn()
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    encoding = response.get("Content-Encoding", "identity")
+    print(
+        f"{label:<10} p50={p50:8.1f}us  p99={p99:8.1f}us  bytes={len(body):6} ({encoding})  "
+        f"Cache-Control: {response.get('Cache-Control', '-')}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    root = tempfile.TemporaryDirectory()
+    setup_django(
+        STATIC_ROOT=root.name,
+        STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+        ALLOWED_HOSTS=["*"],
+        ROOT_URLCONF=__name__,
+    )
+    from django.core.management import call_command
+    from django.templatetags.static import static
+    from django.test import Client
+
+    try:
+        call_command("collectstatic", interactive=False, verbosity=0)
+        client = Client()
+        hashed_url = static(ASSET)
+
+        measure("serve", lambda: client.get(f"/legacy-static/{ASSET}"), args.requests)
+        measure(
+            "whitenoise",
+            lambda: client.get(hashed_url, HTTP_ACCEPT_ENCODING="br, gzip"),
+            args.requests,
+        )
+    finally:
+        root.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Локальная заглушка OpenWeatherMap API для бенчмарков.
+
+Задержка ответа, доля ответов 503 и размер ответа настраиваются: --padding
+добавляет в каждый ответ поле с заданным числом байт.
+
+Запуск: python -m benchmarks.stub_server --port 8099 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+UNKNOWN_CITY_PREFIX = "notacity"
+
+
+def current_payload(city: str = "Moscow", lat: float = 55.75, lon: float = 37.62) -> dict:
+    now = int(time.time())
+    return {
+        "name": city,
+        "dt": now - now % 600,
+        "timezone": 10800,
+        "coord": {"lat": lat, "lon": lon},
+        "main": {"temp": 20.4, "feels_like": 19.6, "humidity": 65, "pressure": 1013},
+        "weather": [{"description": "ясно", "icon": "01d"}],
+        "wind": {"speed": 4.2, "deg": 135},
+        "sys": {"country": "RU", "sunrise": now - 20000, "sunset": now + 20000},
+        "clouds": {"all": 10},
+        "visibility": 10000,
+    }
+
+
+def forecast_payload(city: str = "Moscow", slots: int = 40) -> dict:
+    now = int(time.time())
+    start = now - now % 10800
+    items = []
+    for i in range(slots):
+        dt = start + i * 10800
+        items.append(
+            {
+                "dt": dt,
+                "dt_txt": datetime.fromtimestamp(dt, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "main": {
+                    "temp": 15 + (i % 8),
+                    "feels_like": 14 + (i % 8),
+                    "humidity": 60 + i % 20,
+                    "pressure": 1000 + i % 15,
+                },
+                "weather": [
+                    {
+                        "description": ("ясно", "облачно", "дождь")[i % 3],
+                        "icon": ("01d", "03d", "10d")[i % 3],
+                    }
+                ],
+                "wind": {"speed": 2.0 + (i % 5) / 2, "deg": (i * 45) % 360},
+                "clouds": {"all": (i * 7) % 100},
+                "pop": (i % 4) / 4,
+            }
+        )
+    return {
+        "cnt": slots,
+        "list": items,
+        "city": {
+            "name": city,
+            "country": "RU",
+            "timezone": 10800,
+            "coord": {"lat": 55.75, "lon": 37.62},
+        },
+    }
+
+
+class StubState:
+    def __init__(
+        self, latency: float = 0.0, error_rate: float = 0.0, padding: int = 0, seed: int = 0
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.padding = "x" * padding
+        self.calls = 0
+        self.errors = 0
+        self.by_endpoint = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def record_call(self, endpoint: str = "") -> bool:
+        """Учёт обращения; True - ответить ошибкой"""
+        with self._lock:
+            self.calls += 1
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "by_endpoint": dict(self.by_endpoint),
+            }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState
+
+    def setup(self):
+        super().setup()
+        # Без TCP_NODELAY keep-alive соединения упираются в delayed ACK (~40 мс)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        city = query.get("q", "Moscow")
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+
+        failed = self.state.record_call(endpoint)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if failed:
+            self._send(503, {"cod": "503", "message": "service unavailable"})
+        elif city.casefold().startswith(UNKNOWN_CITY_PREFIX):
+            self._send(404, {"cod": "404", "message": "city not found"})
+        elif endpoint == "weather":
+            if "lat" in query:
+                payload = current_payload(lat=float(query["lat"]), lon=float(query["lon"]))
+            else:
+                payload = current_payload(city)
+            self._send(200, payload)
+        elif endpoint == "forecast":
+            self._send(200, forecast_payload(city, int(query.get("cnt", 40))))
+        else:
+            self._send(404, {"cod": "404", "message": "not found"})
+
+    def _send(self, status: int, payload: dict) -> None:
+        if self.state.padding and status == 200:
+            payload["padding"] = self.state.padding
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server(
+    port: int = 0, latency: float = 0.0, error_rate: float = 0.0, padding: int = 0
+):
+    """Запуск заглушки в фоновом потоке, возвращает (server, state, base_url)"""
+    state = StubState(latency=latency, error_rate=error_rate, padding=padding)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/data/2.5"
+    return server, state, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--padding", type=int, default=0)
+    args = parser.parse_args()
+    server, _, base_url = start_stub_server(
+        args.port, args.latency, args.error_rate, args.padding
+    )
+    print(f"OpenWeatherMap stub: {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Рендер главной страницы и страницы прогноза: целиком против кэша фрагментов.
+
+Синтетическая погода и прогноз для --cities городов (форматирование
+WeatherService из ответов заглушки), --users пользователей со своей
+оболочкой страницы (имя в меню, CSRF-токен). Каждый рендер - случайный
+пользователь и город, как у представлений home и forecast_view.
+Без кэша фрагменты рендерятся на каждом запросе (WEATHER_FRAGMENT_CACHE_TTL=0),
+с кэшем - один раз на город и наблюдение, общие для всех пользователей.
+Кэш Django - в памяти процесса; БД и сеть не нужны.
+
+Запуск: python -m benchmarks.template_render --cities 50 --users 200 --renders 5000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.django_setup import setup_django
+from benchmarks.stub_server import current_payload, forecast_payload
+
+PAGES = ("weather/home.html", "weather/forecast.html")
+
+
+def run(label, renders, render_page):
+    timings = []
+    for request, context in renders:
+        start = time.perf_counter()
+        render_page(request, context)
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    timings.sort()
+    p50 = timings[len(timings) // 2] * 1e6
+    p99 = timings[int(len(timings) * 0.99)] * 1e6
+    print(f"{label:<10} p50={p50:8.1f}us  p99={p99:8.1f}us  renders/s={len(timings) / total:8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--renders", type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        # Без collectstatic: ссылки на статику без хэша
+        STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        },
+    )
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.shortcuts import render
+    from django.test import RequestFactory
+
+    from weather.services import WeatherService
+
+    service = WeatherService()
+    weather = []
+    for index in range(args.cities):
+        city = f"City{index}"
+        weather.append(
+            (
+                service._format_current_weather(current_payload(city)),
+                service._format_forecast(forecast_payload(city))["forecasts"],
+            )
+        )
+
+    factory = RequestFactory()
+    users = [User(pk=index + 1, username=f"user{index}") for index in range(args.users)]
+    rng = random.Random(0)
+    plan = []
+    for _ in range(args.renders):
+        page = rng.choice(PAGES)
+        request = factory.get("/" if page == PAGES[0] else "/forecast/")
+        request.user = rng.choice(users)
+        current, forecast = rng.choice(weather)
+        context = {"forecast": forecast}
+        if page == PAGES[0]:
+            context["current_weather"] = current
+        plan.append((request, (page, context)))
+
+    print(f"{args.renders} renders, {args.cities} cities, {args.users} users")
+    for label, ttl in (("full", 0), ("fragments", 600)):
+        cache.clear()
+
+        def render_page(request, page_context):
+            page, context = page_context
+            return render(request, page, {**context, "fragment_ttl": ttl})
+
+        run(label, plan, render_page)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Настройки gunicorn для продакшена: gunicorn читает этот файл из рабочего каталога.
+
+Переменные окружения:
+- WEB_WORKER_CLASS - uvicorn (ASGI, по умолчанию: асинхронные представления
+  и поток обновлений /api/weather/live/) или gthread (WSGI, потоки)
+- WEB_CONCURRENCY - число процессов-воркеров
+- WEB_THREADS - потоков в воркере gthread
+- WEB_BIND, PORT - адрес прослушивания
+- WEB_TIMEOUT, WEB_KEEPALIVE, WEB_MAX_REQUESTS, WEB_PRELOAD
+
+Запуск: gunicorn
+"""
+import multiprocessing
+import os
+
+WORKER_CLASSES = {
+    "uvicorn": ("uvicorn.workers.UvicornWorker", "weather_project.asgi:application"),
+    "gthread": ("gthread", "weather_project.wsgi:application"),
+}
+
+_cpus = multiprocessing.cpu_count()
+_kind = os.getenv("WEB_WORKER_CLASS", "uvicorn")
+if _kind not in WORKER_CLASSES:
+    raise RuntimeError(f"WEB_WORKER_CLASS должен быть одним из: {', '.join(WORKER_CLASSES)}")
+worker_class, wsgi_app = WORKER_CLASSES[_kind]
+
+bind = os.getenv("WEB_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# Асинхронный воркер ждёт OpenWeatherMap без блокировки, ему хватает процесса на ядро;
+# потокам gthread процессов нужно больше
+workers = int(os.getenv("WEB_CONCURRENCY", _cpus if _kind == "uvicorn" else _cpus * 2 + 1))
+threads = int(os.getenv("WEB_THREADS", "4"))
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = timeout
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Перезапуск воркера после стольких запросов ограничивает рост памяти (0 - не перезапускать)
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Django и WeatherService загружаются один раз в главном процессе и делятся
+# с воркерами после fork (copy-on-write)
+preload_app = os.getenv("WEB_PRELOAD", "True") == "True"
+
+accesslog = "-"
+errorlog = "-"
+# Время ответа в миллисекундах в конце строки журнала
+access_log_format = '%(h)s "%(r)s" %(s)s %(b)s %(M)sms'
+
+
+def when_ready(server):
+    if preload_app:
+        from weather.warmup import warm_up
+
+        warm_up()
+
+
+def worker_exit(server, worker):
+    # Наблюдения погоды, накопленные воркером и ещё не записанные в БД
+    from weather.observations import flush_observations
+
+    flush_observations()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WeatherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'weather'
+
+    def ready(self):
+        # Сброс кэша локации по умолчанию и пользователя сессии при их изменении
+        from . import auth, locations  # noqa: F401
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_logged_out
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+UserModel = get_user_model()
+
+
+def _key(user_id) -> str:
+    return f"weather:user:{user_id}"
+
+
+def _ttl() -> int:
+    return getattr(settings, "WEATHER_USER_CACHE_TTL", 0)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend, который берёт пользователя сессии из кэша Django.
+
+    AuthenticationMiddleware и SessionAuthentication вызывают get_user на
+    каждом запросе; с кэшем пользователь читается из auth_user раз в
+    WEATHER_USER_CACHE_TTL. Проверка хэша сессии остаётся в django.contrib.auth:
+    после смены пароля запись в кэше сбрасывается, и старые сессии перестают
+    проходить проверку.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None and (
+            username is not None or kwargs.get(UserModel.USERNAME_FIELD) is not None
+        ):
+            # ModelBackend следом проверил бы тот же auth_user и ещё раз
+            # посчитал хэш пароля: неудачный вход стал бы вдвое дольше
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        if _ttl() <= 0:
+            return super().get_user(user_id)
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            # Неактивных и удалённых не кэшируем: им вход всё равно закрыт
+            if user is not None:
+                cache.set(key, user, _ttl())
+        return user
+
+    async def aget_user(self, user_id):
+        if _ttl() <= 0:
+            return await super().aget_user(user_id)
+        key = _key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, _ttl())
+        return user
+
+
+def invalidate_user(user_id) -> None:
+    # Второй сброс после коммита, как у локации по умолчанию: параллельный
+    # запрос мог положить в кэш строку, прочитанную до коммита
+    key = _key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def _user_changed(sender, instance, **kwargs) -> None:
+    # Смена пароля, блокировка, last_login при входе
+    invalidate_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def _user_logged_out(sender, request, user, **kwargs) -> None:
+    if user is not None:
+        invalidate_user(user.pk)
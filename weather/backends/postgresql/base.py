@@ -0,0 +1,21 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from weather.instrumentation import observe_db_connect
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с учётом времени получения соединения.
+
+    С пулом (OPTIONS["pool"]) это ожидание свободного соединения в пуле,
+    без него - установка нового соединения с сервером. При постоянных
+    соединениях (CONN_MAX_AGE) метод вызывается только при переподключении.
+    """
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            observe_db_connect(self.pool is not None, time.perf_counter() - start)
@@ -0,0 +1,294 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+MISSING = object()
+# Отметка отрицательного кэша: город не найден в OpenWeatherMap
+NOT_FOUND = "__not_found__"
+
+
+class CacheStats:
+    """Счётчики попаданий, промахов и вытеснений кэша"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.backend_hits = 0
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "backend_hits": self.backend_hits,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.backend_hits = 0
+
+
+class LRUCache:
+    """Ограниченный по размеру in-process кэш с TTL для каждой записи.
+
+    После истечения TTL запись ещё stale_ttl секунд доступна через get_stale.
+    """
+
+    def __init__(self, maxsize: int = 1024, stats: Optional[CacheStats] = None):
+        self.maxsize = maxsize
+        self.stats = stats or CacheStats()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, stale: bool = False) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at, stale_until = entry
+            now = time.monotonic()
+            if stale_until <= now:
+                del self._data[key]
+                return MISSING
+            if expires_at <= now and not stale:
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key: str) -> Any:
+        """Значение, даже если TTL истёк, пока не прошёл stale_ttl"""
+        return self.get(key, stale=True)
+
+    def set(self, key: str, value: Any, ttl: float, stale_ttl: float = 0) -> None:
+        with self._lock:
+            expires_at = time.monotonic() + ttl
+            self._data[key] = (value, expires_at, expires_at + stale_ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.incr("evictions")
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class WeatherCache:
+    """Двухуровневый кэш ответов OpenWeatherMap.
+
+    Первый уровень - LRU в памяти процесса, второй (необязательный) -
+    бэкенд Django cache, общий для всех воркеров. Методы с префиксом a -
+    для event loop: к общему бэкенду они обращаются через его асинхронный
+    API и не блокируют loop сетевым запросом.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        backend: Optional[str] = None,
+        prefix: str = "weather",
+        stale_ttl: float = 0,
+    ):
+        self.stats = CacheStats()
+        self.local = LRUCache(maxsize, stats=self.stats)
+        self.backend_alias = backend
+        self.prefix = prefix
+        self.stale_ttl = stale_ttl
+
+    @property
+    def backend(self):
+        if not self.backend_alias:
+            return None
+        return caches[self.backend_alias]
+
+    def _backend_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str, count: bool = True) -> Any:
+        """Значение из кэша или MISSING; count=False не учитывается в счётчиках"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            if count:
+                self.stats.incr("hits")
+            return value
+        if self.backend is not None:
+            value = self._from_backend(key, self.backend.get(self._backend_key(key)), count)
+        if value is MISSING and count:
+            self.stats.incr("misses")
+        return value
+
+    async def aget(self, key: str, count: bool = True) -> Any:
+        value = self.local.get(key)
+        if value is not MISSING:
+            if count:
+                self.stats.incr("hits")
+            return value
+        if self.backend is not None:
+            value = self._from_backend(key, await self.backend.aget(self._backend_key(key)), count)
+        if value is MISSING and count:
+            self.stats.incr("misses")
+        return value
+
+    def _from_backend(self, key: str, entry: Optional[tuple], count: bool) -> Any:
+        """Запись общего бэкенда: ещё свежая попадает в локальный уровень"""
+        if entry is None:
+            return MISSING
+        value, expires_at = entry
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return MISSING
+        self.local.set(key, value, ttl, self.stale_ttl)
+        if count:
+            self.stats.incr("hits")
+            self.stats.incr("backend_hits")
+        return value
+
+    def get_stale(self, key: str) -> Any:
+        """Устаревшее значение для работы при недоступном API или MISSING"""
+        value = self.local.get_stale(key)
+        if value is MISSING and self.backend is not None:
+            entry = self.backend.get(self._backend_key(key))
+            if entry is not None:
+                value = entry[0]
+        return value
+
+    async def aget_stale(self, key: str) -> Any:
+        value = self.local.get_stale(key)
+        if value is MISSING and self.backend is not None:
+            entry = await self.backend.aget(self._backend_key(key))
+            if entry is not None:
+                value = entry[0]
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.local.set(key, value, ttl, self.stale_ttl)
+        backend = self.backend
+        if backend is not None:
+            backend.set(self._backend_key(key), (value, time.time() + ttl), self._timeout(ttl))
+
+    async def aset(self, key: str, value: Any, ttl: float) -> None:
+        self.local.set(key, value, ttl, self.stale_ttl)
+        backend = self.backend
+        if backend is not None:
+            await backend.aset(
+                self._backend_key(key), (value, time.time() + ttl), self._timeout(ttl)
+            )
+
+    def _timeout(self, ttl: float) -> int:
+        # В бэкенде запись живёт и после TTL: это устаревшие данные для get_stale
+        return int(ttl + self.stale_ttl) + 1
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        backend = self.backend
+        if backend is not None:
+            backend.delete(self._backend_key(key))
+
+    def acquire_lock(self, key: str, timeout: float) -> bool:
+        """Межпроцессная блокировка ключа через atomic add общего бэкенда.
+
+        Без общего бэкенда блокировка всегда считается полученной.
+        """
+        backend = self.backend
+        if backend is None:
+            return True
+        return backend.add(self._backend_key(f"lock:{key}"), 1, timeout=int(timeout) + 1)
+
+    async def aacquire_lock(self, key: str, timeout: float) -> bool:
+        backend = self.backend
+        if backend is None:
+            return True
+        return await backend.aadd(self._backend_key(f"lock:{key}"), 1, timeout=int(timeout) + 1)
+
+    def release_lock(self, key: str) -> None:
+        backend = self.backend
+        if backend is not None:
+            backend.delete(self._backend_key(f"lock:{key}"))
+
+    async def arelease_lock(self, key: str) -> None:
+        backend = self.backend
+        if backend is not None:
+            await backend.adelete(self._backend_key(f"lock:{key}"))
+
+    def is_locked(self, key: str) -> bool:
+        backend = self.backend
+        return backend is not None and backend.get(self._backend_key(f"lock:{key}")) is not None
+
+    async def ais_locked(self, key: str) -> bool:
+        backend = self.backend
+        return (
+            backend is not None
+            and await backend.aget(self._backend_key(f"lock:{key}")) is not None
+        )
+
+    def clear(self) -> None:
+        """Очистка локального уровня и счётчиков (общий бэкенд не трогаем)"""
+        self.local.clear()
+        self.stats.reset()
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = self.stats.as_dict()
+        stats["size"] = len(self.local)
+        return stats
+
+
+def snap(value: float, grid: float) -> float:
+    """Привязка координаты к ближайшему узлу сетки с шагом grid градусов"""
+    return round(round(value / grid) * grid, 6)
+
+
+def normalize_city(city: str) -> str:
+    """Приведение названия города к каноническому виду для ключа кэша"""
+    return " ".join(city.split()).casefold()
+
+
+def make_key(
+    endpoint: str, city: Optional[str] = None, lat=None, lon=None, place_id: Optional[str] = None
+) -> str:
+    """Ключ кэша по эндпоинту и нормализованному запросу.
+
+    Города из справочника кэшируются по каноническому id: "Питер" и
+    "Saint-Petersburg" попадают в одну запись.
+    """
+    if place_id is not None:
+        return f"{endpoint}:place:{place_id}"
+    if city is not None:
+        return f"{endpoint}:city:{normalize_city(city)}"
+    grid = getattr(settings, "WEATHER_COORD_GRID", 0.01)
+    return f"{endpoint}:coord:{snap(float(lat), grid):.4f}:{snap(float(lon), grid):.4f}"
+
+
+_weather_cache: Optional[WeatherCache] = None
+_weather_cache_lock = threading.Lock()
+
+
+def get_weather_cache() -> WeatherCache:
+    """Общий для процесса экземпляр кэша, настроенный из settings"""
+    global _weather_cache
+    if _weather_cache is None:
+        with _weather_cache_lock:
+            if _weather_cache is None:
+                _weather_cache = WeatherCache(
+                    maxsize=getattr(settings, "WEATHER_CACHE_MAX_ENTRIES", 1024),
+                    backend=getattr(settings, "WEATHER_CACHE_BACKEND", None),
+                    stale_ttl=getattr(settings, "WEATHER_CACHE_STALE_TTL", 3600),
+                )
+    return _weather_cache
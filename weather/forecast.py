@@ -0,0 +1,186 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+from datetime import date
+from itertools import repeat, starmap
+from operator import itemgetter, truediv
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from .results import DailyForecast, Forecast, ForecastSlot
+
+# До этой длины подсчёт через list.count быстрее построения Counter
+MODE_COUNT_LIMIT = 64
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Местное время слота "ЧЧ:ММ" по номеру минуты суток
+CLOCK = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+
+
+class ForecastColumns:
+    """Прогноз OpenWeatherMap, разобранный за один проход по дням.
+
+    rows[i] - значения слотов i-го дня в порядке полей ForecastSlot, dates[i] -
+    сам день. День определяется по местному времени города: к dt слота
+    прибавляется смещение timezone из payload. Слоты упорядочены по времени,
+    поэтому границы дней ищутся двоичным поиском. columns[name][i] - столбец
+    name за i-й день; строки дней транспонируются один раз при первом обращении.
+    """
+
+    # Порядок значений в строке совпадает с полями ForecastSlot
+    NAMES = ForecastSlot.__slots__
+    INDEX = {name: index for index, name in enumerate(NAMES)}
+    TEXT = frozenset({"time", "description", "icon"})
+
+    def __init__(self, items: Sequence[Dict[str, Any]], offset: int = 0):
+        # Генератор списка с кортежем заметно быстрее append по столбцам
+        rows = [
+            (
+                (dt := item["dt"]),
+                CLOCK[(dt + offset) % 86400 // 60],
+                # Средняя температура исторически считается по округлённым значениям
+                round((main := item["main"])["temp"]),
+                round(main["feels_like"]),
+                main["humidity"],
+                main["pressure"],
+                item["wind"]["speed"],
+                item["clouds"]["all"],
+                (item["rain"].get("3h", 0) if "rain" in item else 0)
+                + (item["snow"].get("3h", 0) if "snow" in item else 0),
+                item["pop"] if "pop" in item else 0,
+                (weather := item["weather"][0])["description"],
+                weather["icon"],
+            )
+            for item in items
+        ]
+        self.dates: List[str] = []
+        self.rows: List[List[tuple]] = []
+        self._days: Optional[List[List[tuple]]] = None
+
+        start = 0
+        while start < len(rows):
+            day = (rows[start][0] + offset) // 86400
+            end = bisect_left(rows, (day + 1) * 86400 - offset, start, key=itemgetter(0))
+            self.dates.append(date.fromordinal(EPOCH_ORDINAL + day).isoformat())
+            self.rows.append(rows[start:end])
+            start = end
+
+    def __getitem__(self, name: str) -> List[tuple]:
+        if self._days is None:
+            self._days = [list(zip(*rows)) for rows in self.rows]
+        index = self.INDEX[name]
+        return [columns[index] for columns in self._days]
+
+    def slots(self, index: int) -> List[ForecastSlot]:
+        """3-часовые слоты дня index"""
+        return list(starmap(ForecastSlot, self.rows[index]))
+
+
+def _mean(days: List[Sequence[float]]) -> List[float]:
+    return list(map(truediv, map(sum, days), map(len, days)))
+
+
+def _mode(values: Sequence[Any]) -> Any:
+    """Самое частое значение за линейное время; при равенстве - встретившееся раньше"""
+    if len(values) <= MODE_COUNT_LIMIT:
+        return max(dict.fromkeys(values), key=values.count)
+    return Counter(values).most_common(1)[0][0]
+
+
+# Редукции по всем дням сразу: список значений каждого дня -> значение дня.
+# Встроенные функции через map работают без интерпретатора на каждый день.
+REDUCERS: Dict[str, Callable[[List[Sequence[Any]]], List[Any]]] = {
+    "mean": _mean,
+    "min": lambda days: list(map(min, days)),
+    "max": lambda days: list(map(max, days)),
+    "sum": lambda days: list(map(sum, days)),
+    "first": lambda days: [values[0] for values in days],
+    "mode": lambda days: list(map(_mode, days)),
+}
+
+
+class Aggregate(NamedTuple):
+    field: str
+    column: str
+    reducer: str
+    # Знаков после запятой; None - округление до целого. Текст не округляется.
+    ndigits: Optional[int] = None
+
+
+DEFAULT_AGGREGATES = (
+    Aggregate("avg_temperature", "temperature", "mean"),
+    Aggregate("min_temperature", "temperature", "min"),
+    Aggregate("max_temperature", "temperature", "max"),
+    Aggregate("avg_humidity", "humidity", "mean"),
+    Aggregate("avg_pressure", "pressure", "mean"),
+    Aggregate("avg_wind_speed", "wind_speed", "mean", 1),
+    Aggregate("avg_clouds", "clouds", "mean"),
+    Aggregate("precipitation", "precipitation", "sum", 1),
+    Aggregate("precipitation_probability", "pop", "max", 2),
+    Aggregate("description", "description", "mode"),
+    Aggregate("icon", "icon", "mode"),
+)
+
+
+class ForecastAggregator:
+    """Сводка прогноза по дням из набора агрегатов Aggregate.
+
+    Каждый агрегат считается сразу для всех дней по столбцу ForecastColumns.
+    Кроме сводки в каждый день попадают его 3-часовые слоты. Результат не
+    запоминается: готовый прогноз хранится в кэше WeatherService.
+    """
+
+    def __init__(self, aggregates: Sequence[Aggregate] = DEFAULT_AGGREGATES):
+        for aggregate in aggregates:
+            if aggregate.reducer not in REDUCERS:
+                raise ValueError(f"Неизвестная агрегация: {aggregate.reducer}")
+            if aggregate.column not in ForecastColumns.NAMES:
+                raise ValueError(f"Неизвестный столбец прогноза: {aggregate.column}")
+        self.aggregates = tuple(aggregates)
+        self.fields = tuple(aggregate.field for aggregate in self.aggregates)
+        # Стандартный набор агрегатов укладывается в DailyForecast, другие - в словари
+        self.typed = self.fields == DailyForecast.__slots__[3:-1]
+        self._lock = threading.Lock()
+        self.parses = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"parses": self.parses}
+
+    def aggregate(self, data: Dict[str, Any]) -> Forecast:
+        with self._lock:
+            self.parses += 1
+        city = data["city"]["name"]
+        country = data["city"]["country"]
+        columns = ForecastColumns(data["list"], data["city"].get("timezone", 0))
+
+        results = []
+        for _, column, reducer, ndigits in self.aggregates:
+            values = REDUCERS[reducer](columns[column])
+            if column not in ForecastColumns.TEXT:
+                # round(value, None) - целое
+                values = list(map(round, values, repeat(ndigits)))
+            results.append(values)
+
+        forecasts = []
+        for index, (day, row) in enumerate(zip(columns.dates, zip(*results))):
+            if self.typed:
+                forecasts.append(DailyForecast(day, city, country, *row, columns.slots(index)))
+                continue
+            forecast = {"date": day, "city": city, "country": country}
+            forecast.update(zip(self.fields, row))
+            forecast["slots"] = columns.slots(index)
+            forecasts.append(forecast)
+        return Forecast(city, country, forecasts)
+
+
+_aggregator: Optional[ForecastAggregator] = None
+_aggregator_lock = threading.Lock()
+
+
+def get_forecast_aggregator() -> ForecastAggregator:
+    """Общий для процесса агрегатор всех WeatherService"""
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                _aggregator = ForecastAggregator()
+    return _aggregator
@@ -0,0 +1,257 @@
+import mmap
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Города: id, название, местное название, страна, широта, долгота, население, синонимы
+CITIES_FILE = "cities.tsv"
+# Индекс названий: нормализованное название, id города, население (строится build_gazetteer)
+NAMES_FILE = "city_names.tsv"
+
+# Сколько строк индекса просматривать при поиске по префиксу и нечётком поиске
+SCAN_LIMIT = 2000
+
+_SEPARATORS = re.compile(r"[\s\-'’.()]+")
+# Буквы, слова через пробел, дефис, апостроф или точку; необязательный код страны
+_CITY_NAME = re.compile(r"^[^\W\d_]+(?:[\s'’.-]+[^\W\d_]+)*\.?(?:,\s*[A-Za-z]{2})?$")
+
+
+def normalize_name(value: str) -> str:
+    """Ключ поиска: регистр, диакритика, дефисы и точки не различаются.
+
+    "Saint-Petersburg", "saint petersburg" и "Orël" приводятся к
+    "saint petersburg" и "orel".
+    """
+    value = unicodedata.normalize("NFKD", value.casefold())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(_SEPARATORS.sub(" ", value).split())
+
+
+def is_city_name(value: str) -> bool:
+    """Допустимое название города: "New York", "Saint-Petersburg", "Paris, US" """
+    return bool(_CITY_NAME.match(value.strip()))
+
+
+class Place(NamedTuple):
+    """Город справочника"""
+
+    id: str
+    name: str
+    local_name: str
+    country: str
+    lat: float
+    lon: float
+    population: int
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "local_name": self.local_name,
+            "country": self.country,
+            "lat": self.lat,
+            "lon": self.lon,
+        }
+
+
+class Gazetteer:
+    """Справочник городов поверх двух отсортированных TSV-файлов в mmap.
+
+    Файлы не разбираются при загрузке: поиск идёт двоичным поиском по
+    строкам прямо в отображённой памяти, поэтому загрузка мгновенная, а
+    страницы файла делят все воркеры на машине. Города отсортированы по id,
+    индекс названий - по нормализованному названию (побайтно в UTF-8).
+    """
+
+    def __init__(self, path: str = DATA_DIR):
+        self.path = path
+        self._cities = self._map(os.path.join(path, CITIES_FILE))
+        self._names = self._map(os.path.join(path, NAMES_FILE))
+
+    @staticmethod
+    def _map(filename: str) -> mmap.mmap:
+        with open(filename, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._cities[:].count(b"\n")
+
+    def get(self, place_id: str) -> Optional[Place]:
+        """Город по каноническому id"""
+        target = place_id.encode()
+        pos = _lower_bound(self._cities, target)
+        line = _line(self._cities, pos)
+        if line is None or line.split(b"\t", 1)[0] != target:
+            return None
+        return _parse_place(line)
+
+    def resolve(self, query: str) -> Optional[Place]:
+        """Город по точному названию или синониму; из одноимённых - самый крупный.
+
+        Страну можно указать через запятую: "Paris, US".
+        """
+        name, _, country = query.partition(",")
+        country = country.strip().upper()
+        key = normalize_name(name).encode()
+        if not key:
+            return None
+        candidates = []
+        for matched, place_id, population in self._scan(key):
+            if matched != key:
+                break
+            candidates.append((population, place_id))
+        for _, place_id in sorted(candidates, reverse=True):
+            place = self.get(place_id)
+            if place is not None and (not country or place.country == country):
+                return place
+        return None
+
+    def search(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Города, одно из названий которых начинается с prefix, крупные первыми"""
+        key = normalize_name(prefix).encode()
+        if not key:
+            return []
+        best: Dict[str, Tuple[bool, int]] = {}
+        for matched, place_id, population in self._scan(key):
+            if not matched.startswith(key):
+                break
+            rank = (matched == key, population)
+            if rank > best.get(place_id, (False, -1)):
+                best[place_id] = rank
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return self._places(place_id for place_id, _ in ranked[:limit])
+
+    def fuzzy(self, query: str, limit: int = 5) -> List[Place]:
+        """Города с названием на расстоянии правки до 2 от query (опечатки).
+
+        Кандидаты - названия с теми же первыми двумя буквами и близкой длиной:
+        опечатки в начале слова редки, а перебор всего справочника медленный.
+        """
+        key = normalize_name(query)
+        if len(key) < 3:
+            return []
+        max_distance = 1 if len(key) < 6 else 2
+        first = key[:2].encode()
+        letters = set(key)
+        previous, distance = "", max_distance + 1
+        best: Dict[str, Tuple[int, int]] = {}
+        for matched, place_id, population in self._scan(first):
+            if not matched.startswith(first):
+                break
+            name = matched.decode()
+            # Дешёвые отсечения: каждая правка меняет длину не больше чем на 1,
+            # а набор букв - не больше чем на 2
+            if abs(len(name) - len(key)) > max_distance:
+                continue
+            if len(letters.symmetric_difference(name)) > 2 * max_distance:
+                continue
+            # Одноимённые города идут подряд: расстояние считается один раз
+            if name != previous:
+                previous, distance = name, _edit_distance(key, name, max_distance)
+            if distance <= max_distance:
+                rank = (-distance, population)
+                if rank > best.get(place_id, (-max_distance - 1, -1)):
+                    best[place_id] = rank
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return self._places(place_id for place_id, _ in ranked[:limit])
+
+    def suggest(self, query: str, limit: int = 10) -> List[Place]:
+        """Подсказки для автодополнения: по префиксу, а без совпадений - с опечатками"""
+        return self.search(query, limit) or self.fuzzy(query, limit)
+
+    def _scan(self, prefix: bytes) -> Iterator[Tuple[bytes, str, int]]:
+        """Строки индекса названий начиная с первой не меньше prefix"""
+        names = self._names
+        pos = _lower_bound(names, prefix)
+        for _ in range(SCAN_LIMIT):
+            end = names.find(b"\n", pos)
+            if end < 0:
+                return
+            key, place_id, population = names[pos:end].split(b"\t")
+            yield key, place_id.decode(), int(population)
+            pos = end + 1
+
+    def _places(self, place_ids: Iterable[str]) -> List[Place]:
+        return [place for place in map(self.get, place_ids) if place is not None]
+
+
+def _lower_bound(data: mmap.mmap, target: bytes) -> int:
+    """Смещение первой строки, ключ которой (до табуляции) не меньше target"""
+    lo, hi = 0, len(data)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = data.rfind(b"\n", 0, mid) + 1
+        if data[start:data.find(b"\t", start)] < target:
+            lo = data.find(b"\n", start) + 1
+        else:
+            hi = start
+    return lo
+
+
+def _line(data: mmap.mmap, pos: int) -> Optional[bytes]:
+    end = data.find(b"\n", pos)
+    return data[pos:end] if end >= 0 else None
+
+
+def _parse_place(line: bytes) -> Place:
+    place_id, name, local_name, country, lat, lon, population, _ = line.decode().split("\t")
+    return Place(place_id, name, local_name, country, float(lat), float(lon), int(population))
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечением: при превышении limit возвращает limit + 1.
+
+    Считается только полоса шириной limit вокруг диагонали: клетки вне её
+    заведомо дают расстояние больше limit.
+    """
+    over = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return over
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        if i <= limit:
+            current[0] = i
+        for j in range(lo, hi + 1):
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != b[j - 1])
+            )
+        if min(current[lo - 1:hi + 1]) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def build_names_index(rows: Iterable[List[str]]) -> List[bytes]:
+    """Строки индекса названий для городов в формате cities.tsv"""
+    lines = set()
+    for place_id, name, local_name, _, _, _, population, aliases in rows:
+        for value in (name, local_name, *aliases.split(",")):
+            key = normalize_name(value)
+            if key:
+                lines.add(f"{key}\t{place_id}\t{population}\n".encode())
+    # Табуляция меньше любого символа названия: строки упорядочены по ключу,
+    # одноимённые - по id
+    return sorted(lines)
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Справочник процесса; None, если WEATHER_GAZETTEER=False"""
+    global _gazetteer
+    if not getattr(settings, "WEATHER_GAZETTEER", True):
+        return None
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer(getattr(settings, "WEATHER_GAZETTEER_PATH", "") or DATA_DIR)
+    return _gazetteer
@@ -0,0 +1,130 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import CacheStats, make_key
+from .gazetteer import get_gazetteer
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class GeoIndex:
+    """Индекс точек с известной погодой для поиска ближайшей в радиусе.
+
+    Точки разложены по ячейкам сетки размером с радиус, поэтому поиск
+    просматривает только соседние ячейки. Каждая точка ссылается на ключ
+    кэша WeatherCache; у недавно запрошенных точек есть срок жизни,
+    города сохранённых локаций живут до перезагрузки индекса.
+    """
+
+    def __init__(self, radius_km: float = 5.0):
+        self.radius_km = radius_km
+        self.cell_deg = radius_km / KM_PER_DEGREE
+        self._cells: Dict[Tuple[int, int], List[tuple]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+        self.locations_loaded_at: Optional[float] = None
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    def add(self, lat: float, lon: float, key: str, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl is not None else math.inf
+        cell = self._cell(lat, lon)
+        with self._lock:
+            points = self._cells[cell]
+            points[:] = [p for p in points if p[2] != key and p[3] > time.monotonic()]
+            points.append((lat, lon, key, expires_at))
+
+    def nearest(self, lat: float, lon: float) -> Optional[str]:
+        """Ключ кэша ближайшей точки в пределах радиуса или None"""
+        row, col = self._cell(lat, lon)
+        # На высоких широтах градус долготы короче, ячеек по долготе нужно больше
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        col_span = math.ceil(1 / cos_lat)
+        now = time.monotonic()
+        best_key, best_distance = None, self.radius_km
+        with self._lock:
+            for r in range(row - 1, row + 2):
+                for c in range(col - col_span, col + col_span + 1):
+                    for p_lat, p_lon, key, expires_at in self._cells.get((r, c), ()):
+                        if expires_at <= now:
+                            continue
+                        distance = haversine_km(lat, lon, p_lat, p_lon)
+                        if distance <= best_distance:
+                            best_key, best_distance = key, distance
+        return best_key
+
+    def load_locations(self, max_age: float) -> None:
+        """Загрузка сохранённых локаций, если прошло больше max_age секунд"""
+        from .models import Location
+
+        if not self.locations_expired(max_age):
+            return
+        self.locations_loaded_at = time.monotonic()
+        cities = Location.objects.order_by().values_list("city", flat=True).distinct()
+        with self._lock:
+            for cell, points in list(self._cells.items()):
+                points[:] = [p for p in points if p[3] != math.inf]
+                if not points:
+                    del self._cells[cell]
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return
+        # Точка - координаты города из справочника, а не введённые пользователем:
+        # иначе чужая погода попала бы на запросы по координатам всех пользователей.
+        # Города вне справочника пропускаются
+        places = {place.id: place for place in map(gazetteer.resolve, cities) if place is not None}
+        for place in places.values():
+            # Ключ тот же, что у WeatherService.get_current_weather(city)
+            self.add(place.lat, place.lon, make_key("weather", place_id=place.id))
+
+    def locations_expired(self, max_age: float) -> bool:
+        """Пора ли перечитать сохранённые локации"""
+        return (
+            self.locations_loaded_at is None
+            or time.monotonic() - self.locations_loaded_at >= max_age
+        )
+
+    def record(self, reused: bool) -> None:
+        self.stats.incr("hits" if reused else "misses")
+
+    def get_stats(self) -> Dict[str, float]:
+        stats = self.stats.as_dict()
+        total = stats["hits"] + stats["misses"]
+        with self._lock:
+            points = sum(len(points) for points in self._cells.values())
+        return {
+            "requests": total,
+            "reused": stats["hits"],
+            "reuse_ratio": round(stats["hits"] / total, 4) if total else 0.0,
+            "points": points,
+        }
+
+
+_geo_index: Optional[GeoIndex] = None
+_geo_index_lock = threading.Lock()
+
+
+def get_geo_index() -> GeoIndex:
+    global _geo_index
+    if _geo_index is None:
+        with _geo_index_lock:
+            if _geo_index is None:
+                _geo_index = GeoIndex(
+                    radius_km=getattr(settings, "WEATHER_GEO_REUSE_RADIUS_KM", 5.0)
+                )
+    return _geo_index
@@ -0,0 +1,195 @@
+import asyncio
+import contextlib
+import functools
+import os
+import random
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+try:
+    import httpx
+except ImportError:  # асинхронный клиент необязателен
+    httpx = None
+
+# 429 не повторяется: лимитер квоты учитывает один вызов на запрос, а повтор
+# ответа о превышении квоты расходует её ещё раз
+RETRY_STATUSES = (500, 502, 503, 504)
+DEFAULT_TIMEOUT = (3.05, 10)
+
+
+def build_session(
+    pool_size: int = 10,
+    retries: int = 2,
+    backoff_factor: float = 0.3,
+    backoff_jitter: float = 0.2,
+) -> requests.Session:
+    """Сессия requests с пулом keep-alive соединений и повторами на 5xx"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=backoff_factor,
+        backoff_jitter=backoff_jitter,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Долгоживущая сессия процесса.
+
+    Сессия пересоздаётся после fork, чтобы воркеры не делили сокеты
+    родительского процесса.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = build_session(
+                    pool_size=getattr(settings, "OPENWEATHERMAP_POOL_SIZE", 10),
+                    retries=getattr(settings, "OPENWEATHERMAP_RETRIES", 2),
+                    backoff_factor=getattr(settings, "OPENWEATHERMAP_BACKOFF", 0.3),
+                )
+                _session_pid = pid
+    return _session
+
+
+def get_timeout(endpoint: str) -> Tuple[float, float]:
+    """Таймауты (connect, read) для эндпоинта OpenWeatherMap"""
+    timeouts = getattr(settings, "OPENWEATHERMAP_TIMEOUTS", {})
+    return tuple(timeouts.get(endpoint, timeouts.get("default", DEFAULT_TIMEOUT)))
+
+
+def retry_delay(attempt: int) -> float:
+    """Задержка перед повтором: экспоненциальная с джиттером"""
+    backoff = getattr(settings, "OPENWEATHERMAP_BACKOFF", 0.3)
+    return backoff * (2**attempt) + random.uniform(0, backoff)
+
+
+def use_async_client() -> bool:
+    """Есть ли у текущего event loop асинхронный клиент (httpx).
+
+    Клиент открывает async_client_scope(): под ASGI - на всё время работы
+    сервера. Под WSGI async_to_sync создаёт event loop на каждый запрос,
+    и клиент с пулом соединений жил бы один запрос, поэтому там запросы
+    идут через общую сессию requests в пуле потоков.
+    """
+    mode = getattr(settings, "OPENWEATHERMAP_ASYNC_CLIENT", "httpx")
+    if httpx is None or mode != "httpx":
+        return False
+    return asyncio.get_running_loop() in _async_clients
+
+
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """Асинхронный клиент текущего event loop (см. async_client_scope)"""
+    return _async_clients[asyncio.get_running_loop()]
+
+
+@contextlib.asynccontextmanager
+async def async_client_scope() -> AsyncIterator[None]:
+    """Асинхронный клиент с пулом соединений для текущего event loop на время блока.
+
+    При выходе клиент закрывается вместе с соединениями.
+    """
+    if httpx is None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    pool_size = getattr(settings, "OPENWEATHERMAP_POOL_SIZE", 10)
+    async with httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    ) as client:
+        _async_clients[loop] = client
+        try:
+            yield
+        finally:
+            del _async_clients[loop]
+
+
+def with_async_client(app: Callable[..., Any]) -> Callable[..., Any]:
+    """ASGI-приложение, которое держит асинхронный клиент от запуска до остановки сервера.
+
+    Django не обрабатывает события lifespan: их обрабатывает обёртка,
+    остальные запросы передаются app.
+    """
+
+    async def application(scope, receive, send):
+        if scope["type"] != "lifespan":
+            return await app(scope, receive, send)
+        await receive()  # lifespan.startup
+        async with async_client_scope():
+            await send({"type": "lifespan.startup.complete"})
+            await receive()  # lifespan.shutdown
+        await send({"type": "lifespan.shutdown.complete"})
+
+    return application
+
+
+def get_async_timeout(endpoint: str) -> "httpx.Timeout":
+    connect, read = get_timeout(endpoint)
+    return httpx.Timeout(read, connect=connect)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Пул потоков процесса для параллельных синхронных запросов"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _session_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "WEATHER_FETCH_WORKERS", 8),
+                    thread_name_prefix="weather-fetch",
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def db_task(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """fn для пула потоков, обращающаяся к БД.
+
+    Потоки пула живут дольше запроса, и сигналы request_started/finished
+    их соединения не закрывают: без этого каждый поток держал бы своё
+    соединение (или соединение пула psycopg) до конца процесса.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            connections.close_all()
+
+    return wrapper
@@ -0,0 +1,326 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+# Границы корзин гистограмм длительностей, сек
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Тип и описание метрик для экспорта в формате Prometheus
+METRICS = {
+    "weather_http_requests_total": ("counter", "Запросы к приложению"),
+    "weather_http_request_duration_seconds": ("histogram", "Время обработки запроса"),
+    "weather_upstream_requests_total": ("counter", "Запросы к OpenWeatherMap"),
+    "weather_upstream_duration_seconds": ("histogram", "Время ответа OpenWeatherMap"),
+    "weather_cache_lookups_total": ("counter", "Обращения WeatherService к кэшу"),
+    "weather_db_queries_total": ("counter", "SQL-запросы"),
+    "weather_db_query_seconds_total": ("counter", "Суммарное время SQL-запросов"),
+    "weather_db_connections_total": ("counter", "Полученные соединения с БД (новые или из пула)"),
+    "weather_db_connect_seconds": ("histogram", "Время получения соединения с БД, с ожиданием пула"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма: число наблюдений в каждой корзине, сумма и общее число"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы процесса с метками"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        key = (name, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, gauges: Iterable[Tuple[str, float]] = ()) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+
+        lines: List[str] = []
+        described = set()
+
+        def describe(name: str, kind: str = "gauge", help_text: str = "") -> None:
+            if name not in described:
+                described.add(name)
+                kind, help_text = METRICS.get(name, (kind, help_text))
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = labels + (("le", _number(bound)),)
+                lines.append(f"{name}_bucket{_labels(le)} {cumulative}")
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, value in gauges:
+            describe(name)
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def flatten_gauges(stats: Dict[str, Dict[str, Any]]) -> List[Tuple[str, float]]:
+    """Числовые значения collect_metrics как метрики weather_<раздел>_<имя>"""
+    gauges = []
+    for section, values in stats.items():
+        for name, value in values.items():
+            if isinstance(value, (bool, int, float)):
+                gauges.append((f"weather_{section}_{name}", float(value)))
+    return gauges
+
+
+class RequestTimings:
+    """Время, проведённое запросом в OpenWeatherMap, кэше и базе данных"""
+
+    __slots__ = ("_lock", "upstream", "upstream_calls", "db", "db_queries", "db_connect", "cache")
+
+    def __init__(self):
+        # Запросы к API идут и из пула потоков (главная страница, пакетный запрос)
+        self._lock = threading.Lock()
+        self.upstream = 0.0
+        self.upstream_calls = 0
+        self.db = 0.0
+        self.db_queries = 0
+        self.db_connect = 0.0
+        self.cache: Dict[str, int] = {}
+
+    def add_upstream(self, seconds: float) -> None:
+        with self._lock:
+            self.upstream += seconds
+            self.upstream_calls += 1
+
+    def add_db(self, seconds: float) -> None:
+        with self._lock:
+            self.db += seconds
+            self.db_queries += 1
+
+    def add_db_connect(self, seconds: float) -> None:
+        with self._lock:
+            self.db_connect += seconds
+
+    def add_cache(self, result: str) -> None:
+        with self._lock:
+            self.cache[result] = self.cache.get(result, 0) + 1
+
+    def server_timing(self, total: float) -> str:
+        """Значение заголовка Server-Timing, длительности в миллисекундах"""
+        parts = [f"total;dur={total * 1000:.1f}"]
+        if self.upstream_calls:
+            parts.append(
+                f'upstream;dur={self.upstream * 1000:.1f};desc="{self.upstream_calls} calls"'
+            )
+        if self.cache:
+            summary = " ".join(f"{name}={count}" for name, count in sorted(self.cache.items()))
+            parts.append(f'cache;desc="{summary}"')
+        if self.db_queries:
+            parts.append(f'db;dur={self.db * 1000:.1f};desc="{self.db_queries} queries"')
+        if self.db_connect:
+            parts.append(f"dbconn;dur={self.db_connect * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_registry = MetricsRegistry()
+_current: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "weather_request_timings", default=None
+)
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "WEATHER_INSTRUMENTATION", True)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def bind_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """fn для пула потоков: учёт времени попадает в текущий запрос.
+
+    Контекст копируется на каждый вызов: один контекст нельзя выполнять
+    в двух потоках одновременно.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def observe_upstream(endpoint: str, seconds: float, outcome: str) -> None:
+    """Запрос к OpenWeatherMap: outcome - ok, код ответа или error"""
+    if not is_enabled():
+        return
+    labels = (("endpoint", endpoint),)
+    _registry.inc("weather_upstream_requests_total", labels + (("outcome", outcome),))
+    _registry.observe("weather_upstream_duration_seconds", seconds, labels)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_upstream(seconds)
+
+
+def observe_cache(result: str) -> None:
+    """Результат обращения к кэшу: hit, miss или stale"""
+    if not is_enabled():
+        return
+    _registry.inc("weather_cache_lookups_total", (("result", result),))
+    timings = _current.get()
+    if timings is not None:
+        timings.add_cache(result)
+
+
+def observe_db_connect(pooled: bool, seconds: float) -> None:
+    """Получение соединения с БД: из пула (pooled) или новое"""
+    if not is_enabled():
+        return
+    labels = (("mode", "pool" if pooled else "direct"),)
+    _registry.inc("weather_db_connections_total", labels)
+    _registry.observe("weather_db_connect_seconds", seconds, labels)
+    timings = _current.get()
+    if timings is not None:
+        timings.add_db_connect(seconds)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        timings.add_db(elapsed)
+        _registry.inc("weather_db_queries_total")
+        _registry.inc("weather_db_query_seconds_total", amount=elapsed)
+
+
+def _install_db_wrapper(sender, connection, **kwargs) -> None:
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _db_wrapper)
+
+
+class InstrumentationMiddleware:
+    """Учёт времени запроса, обращений к API, кэшу и базе данных.
+
+    Пишет счётчики и гистограммы для /metrics и заголовок Server-Timing.
+    С WEATHER_INSTRUMENTATION=False Django не включает middleware в цепочку,
+    а хуки WeatherService сводятся к проверке настройки.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "WEATHER_SERVER_TIMING", True)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Соединения создаются в каждом потоке заново, обёртку получает каждое
+        connection_created.connect(_install_db_wrapper, dispatch_uid="weather_instrumentation")
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Соединение потока могло открыться до подключения сигнала
+        _install_db_wrapper(None, connection)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, timings, time.perf_counter() - start)
+        return response
+
+    def _finish(self, request, response, timings: RequestTimings, elapsed: float) -> None:
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        status = f"{response.status_code // 100}xx"
+        _registry.inc(
+            "weather_http_requests_total",
+            (("view", view), ("method", request.method), ("status", status)),
+        )
+        _registry.observe("weather_http_request_duration_seconds", elapsed, (("view", view),))
+        if self.server_timing:
+            response["Server-Timing"] = timings.server_timing(elapsed)
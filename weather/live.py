@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import logging
+import weakref
+from typing import Any, Dict, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .cache import CacheStats, normalize_city
+from .services import CityNotFoundError, WeatherService
+
+logger = logging.getLogger(__name__)
+
+
+class LiveWeatherHub:
+    """Рассылка обновлений текущей погоды подписчикам по городам.
+
+    На каждый город с подписчиками работает одна задача, которая раз в
+    interval секунд запрашивает погоду через WeatherService (то есть через
+    его кэш) и рассылает её всем очередям подписчиков, только если
+    наблюдение изменилось. Сколько бы ни было открытых страниц, к сервису
+    обращается одна задача на город. Хаб привязан к своему event loop.
+    """
+
+    def __init__(self, interval: float = 60, service: Optional[WeatherService] = None):
+        self.interval = interval
+        self.service = service or WeatherService()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._fetchers: Dict[str, asyncio.Task] = {}
+        self._latest: Dict[str, Tuple[str, Any]] = {}
+        # Открытые потоки SSE (live_weather), для ограничения WEATHER_LIVE_MAX_STREAMS
+        self.streams = 0
+        # hits - отправленные подписчикам сообщения, misses - опросы сервиса
+        self.stats = CacheStats()
+
+    def subscribe(self, city: str, queue: asyncio.Queue) -> None:
+        """Подписка очереди на город; последние известные данные приходят сразу"""
+        key = normalize_city(city)
+        self._subscribers.setdefault(key, set()).add(queue)
+        if key in self._latest:
+            queue.put_nowait(self._latest[key])
+        if key not in self._fetchers:
+            # Свой контекст: опрос переживает запрос и не пишет в его Server-Timing
+            self._fetchers[key] = asyncio.create_task(
+                self._poll(key, city), context=contextvars.Context()
+            )
+
+    def unsubscribe(self, city: str, queue: asyncio.Queue) -> None:
+        key = normalize_city(city)
+        subscribers = self._subscribers.get(key)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[key]
+            self._latest.pop(key, None)
+            fetcher = self._fetchers.pop(key, None)
+            if fetcher is not None:
+                fetcher.cancel()
+
+    def _broadcast(self, key: str, message: Tuple[str, Any]) -> None:
+        self._latest[key] = message
+        for queue in self._subscribers.get(key, ()):
+            queue.put_nowait(message)
+        self.stats.incr("hits", len(self._subscribers.get(key, ())))
+
+    async def _poll(self, key: str, city: str) -> None:
+        observed = None
+        try:
+            while key in self._subscribers:
+                self.stats.incr("misses")
+                try:
+                    data = await self.service.aget_current_weather(city)
+                except CityNotFoundError as e:
+                    self._broadcast(key, ("weather-error", {"city": city, "error": str(e)}))
+                    return
+                except Exception as e:
+                    logger.warning("Не удалось получить погоду для %s: %s", city, e)
+                else:
+                    version = (data.get("dt"), data.get("stale", False))
+                    if version != observed:
+                        observed = version
+                        self._broadcast(key, ("weather", data))
+                await asyncio.sleep(self.interval)
+        finally:
+            if self._fetchers.get(key) is asyncio.current_task():
+                del self._fetchers[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = self.stats.as_dict()
+        return {
+            "streams": self.streams,
+            "cities": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "polls": stats["misses"],
+            "messages": stats["hits"],
+        }
+
+
+_hubs: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_live_hub() -> LiveWeatherHub:
+    """Хаб текущего event loop (по одному на воркер ASGI)"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LiveWeatherHub(
+            interval=getattr(settings, "WEATHER_LIVE_INTERVAL", 60)
+        )
+    return hub
+
+
+def get_live_stats() -> Dict[str, int]:
+    """Суммарные счётчики хабов процесса"""
+    totals = {"streams": 0, "cities": 0, "subscribers": 0, "polls": 0, "messages": 0}
+    for hub in list(_hubs.values()):
+        for name, value in hub.get_stats().items():
+            totals[name] += value
+    return totals
@@ -0,0 +1,64 @@
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import NOT_FOUND
+from .models import Location
+
+
+def _key(user_id: int) -> str:
+    return f"weather:default-location:{user_id}"
+
+
+def _ttl() -> int:
+    return getattr(settings, "WEATHER_DEFAULT_LOCATION_TTL", 300)
+
+
+def get_default_location(user) -> Optional[Location]:
+    """Локация по умолчанию пользователя или None.
+
+    Хранится в кэше Django (общем для воркеров при REDIS_URL), в том числе
+    её отсутствие. Сбрасывается сигналами сохранения и удаления локаций и
+    Location.objects.set_default; TTL ограничивает устаревание в кэше,
+    локальном для процесса.
+    """
+    key = _key(user.pk)
+    location = cache.get(key)
+    if location is None:
+        try:
+            location = Location.objects.get(user=user, is_default=True)
+        except Location.DoesNotExist:
+            location = NOT_FOUND
+        cache.set(key, location, _ttl())
+    return None if location == NOT_FOUND else location
+
+
+async def aget_default_location(user) -> Optional[Location]:
+    """Асинхронный вариант get_default_location"""
+    key = _key(user.pk)
+    location = await cache.aget(key)
+    if location is None:
+        try:
+            location = await Location.objects.aget(user=user, is_default=True)
+        except Location.DoesNotExist:
+            location = NOT_FOUND
+        await cache.aset(key, location, _ttl())
+    return None if location == NOT_FOUND else location
+
+
+def invalidate_default_location(user_id: int) -> None:
+    # Второй сброс после коммита: параллельный запрос мог успеть положить
+    # в кэш строку, прочитанную до коммита
+    key = _key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def _location_changed(sender, instance: Location, **kwargs) -> None:
+    invalidate_default_location(instance.user_id)
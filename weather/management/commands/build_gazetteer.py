@@ -0,0 +1,92 @@
+import os
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import slugify
+
+from weather.gazetteer import CITIES_FILE, DATA_DIR, NAMES_FILE, build_names_index
+
+# Синонимы из GeoNames только на латинице и кириллице: остальные алфавиты
+# раздувают индекс, а пользователи сервиса их не вводят
+_ALIAS = re.compile(r"^[\sA-Za-zÀ-ɏЀ-ӿ'’.-]+$")
+_CYRILLIC = re.compile(r"[Ѐ-ӿ]")
+
+
+class Command(BaseCommand):
+    help = "Строит индекс названий справочника городов (weather/data)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--geonames",
+            help="Файл cities15000.txt из GeoNames: пересоздать и список городов",
+        )
+        parser.add_argument("--min-population", type=int, default=15000)
+        parser.add_argument("--output", default=DATA_DIR, help="Каталог с файлами справочника")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        cities_path = os.path.join(output, CITIES_FILE)
+        if options["geonames"]:
+            rows = self._read_geonames(options["geonames"], options["min_population"])
+            write_lines(cities_path, ["\t".join(row) + "\n" for row in rows])
+        elif not os.path.exists(cities_path):
+            raise CommandError(f"Нет файла {cities_path}, укажите --geonames")
+
+        with open(cities_path, encoding="utf-8") as f:
+            rows = [line.rstrip("\n").split("\t") for line in f if line.strip()]
+        names = build_names_index(rows)
+        write_lines(os.path.join(output, NAMES_FILE), [line.decode() for line in names])
+        self.stdout.write(f"Городов: {len(rows)}, названий в индексе: {len(names)}")
+
+    def _read_geonames(self, path: str, min_population: int):
+        """Города GeoNames в формате cities.tsv, отсортированные по id.
+
+        id - страна и slug названия; одноимённые города одной страны, кроме
+        самого крупного, различаются кодом региона, а при совпадении и его -
+        geonameid.
+        """
+        cities = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                population = int(fields[14] or 0)
+                if population >= min_population:
+                    cities.append(fields)
+        # Крупные города первыми: им достаются короткие id
+        cities.sort(key=lambda fields: (-int(fields[14] or 0), int(fields[0])))
+
+        rows, used = [], set()
+        for fields in cities:
+            geoname_id, name, ascii_name, alternate = fields[0], fields[1], fields[2], fields[3]
+            country, admin1 = fields[8], fields[10]
+            slug = slugify(ascii_name) or geoname_id
+            place_id = f"{country}-{slug}"
+            if place_id in used:
+                place_id = f"{country}-{slug}-{slugify(admin1) or geoname_id}"
+            if place_id in used:
+                place_id = f"{country}-{slug}-{geoname_id}"
+            used.add(place_id)
+
+            aliases = [value for value in alternate.split(",") if value and _ALIAS.match(value)]
+            local_name = next((value for value in aliases if _CYRILLIC.search(value)), name)
+            if ascii_name != name:
+                aliases.insert(0, ascii_name)
+            rows.append([
+                place_id,
+                name,
+                local_name,
+                country,
+                fields[4],
+                fields[5],
+                str(int(fields[14] or 0)),
+                ",".join(dict.fromkeys(aliases)),
+            ])
+        return sorted(rows, key=lambda row: row[0].encode())
+
+
+def write_lines(path: str, lines) -> None:
+    """Атомарная запись: работающие процессы держат старый файл в mmap"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
@@ -0,0 +1,56 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weather.refresh import WeatherRefresher
+
+
+class Command(BaseCommand):
+    help = "Обновляет текущую погоду и прогноз для всех сохранённых городов"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Работать постоянно, обновляя данные каждые --interval секунд",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "WEATHER_REFRESH_INTERVAL", 300),
+            help="Период обновления в секундах",
+        )
+        parser.add_argument("--concurrency", type=int, default=None)
+        parser.add_argument(
+            "--jitter",
+            type=float,
+            default=None,
+            help="Максимальная случайная задержка перед запросом города, сек",
+        )
+
+    def handle(self, *args, **options):
+        if getattr(settings, "WEATHER_CACHE_BACKEND", None) is None:
+            # Команда работает в своём процессе: без общего кэша веб-воркеры
+            # обновлённых данных не увидят, пишется только история наблюдений
+            self.stderr.write(self.style.WARNING(
+                "WEATHER_CACHE_BACKEND не задан: обновлённая погода останется в памяти "
+                "этого процесса и не попадёт в кэш веб-воркеров"
+            ))
+        refresher = WeatherRefresher(
+            concurrency=options["concurrency"], jitter=options["jitter"]
+        )
+        while True:
+            started = time.monotonic()
+            report = refresher.run_once()
+            self.stdout.write(
+                f"Обновлено городов: {len(report.refreshed)}/{report.cities}, "
+                f"ошибок: {len(report.failed)}, записей: {report.observations}"
+            )
+            if not options["loop"]:
+                break
+            # Случайный сдвиг, чтобы несколько воркеров не синхронизировались
+            elapsed = time.monotonic() - started
+            delay = options["interval"] * random.uniform(0.9, 1.1) - elapsed
+            time.sleep(max(delay, 0))
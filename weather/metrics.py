@@ -0,0 +1,35 @@
+from typing import Any, Dict
+
+from django.db import connections
+
+from .cache import get_weather_cache
+from .forecast import get_forecast_aggregator
+from .geo import get_geo_index
+from .live import get_live_stats
+from .resilience import get_circuit_breaker, get_quota_limiter
+from .singleflight import get_async_singleflight, get_singleflight
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """Снимок счётчиков WeatherService в текущем процессе"""
+    return {
+        "cache": get_weather_cache().get_stats(),
+        "singleflight": get_singleflight().get_stats(),
+        "async_singleflight": get_async_singleflight().get_stats(),
+        "quota_limiter": get_quota_limiter().get_stats(),
+        "circuit_breaker": get_circuit_breaker().get_stats(),
+        "geo_reuse": get_geo_index().get_stats(),
+        "forecast_pipeline": get_forecast_aggregator().get_stats(),
+        "live": get_live_stats(),
+        "db_pool": get_db_pool_stats(),
+    }
+
+
+def get_db_pool_stats() -> Dict[str, Any]:
+    """Статистика пула соединений psycopg процесса; пусто, если пул не включён.
+
+    requests_wait_ms - суммарное ожидание свободного соединения,
+    requests_waiting - сколько запросов ждут сейчас.
+    """
+    pool = getattr(connections["default"], "pool", None)
+    return pool.get_stats() if pool is not None else {}
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:35
+
+import django.utils.timezone
+import weather.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='location',
+            name='city',
+            field=models.CharField(max_length=100, validators=[weather.models.validate_city]),
+        ),
+        migrations.AlterField(
+            model_name='weatherdata',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['-timestamp'], name='weatherdata_timestamp_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdata',
+            constraint=models.UniqueConstraint(fields=('location', 'timestamp'), name='weatherdata_location_timestamp_uniq'),
+        ),
+    ]
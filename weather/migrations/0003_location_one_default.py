@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def keep_latest_default(apps, schema_editor):
+    """У пользователя с несколькими локациями по умолчанию остаётся последняя изменённая"""
+    Location = apps.get_model('weather', 'Location')
+    seen = set()
+    extra = []
+    for pk, user_id in (
+        Location.objects.filter(is_default=True)
+        .order_by('user_id', '-updated_at', '-pk')
+        .values_list('pk', 'user_id')
+    ):
+        if user_id in seen:
+            extra.append(pk)
+        seen.add(user_id)
+    Location.objects.filter(pk__in=extra).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_weatherdata_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_default, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_default', True)), fields=('user',), name='location_one_default_per_user'),
+        ),
+    ]
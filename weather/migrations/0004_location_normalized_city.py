@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+def fill_normalized_city(apps, schema_editor):
+    """normalized_city существующих локаций - как в normalize_city"""
+    Location = apps.get_model('weather', 'Location')
+    locations = list(Location.objects.only('pk', 'city'))
+    for location in locations:
+        location.normalized_city = ' '.join(location.city.split()).casefold()
+    Location.objects.bulk_update(locations, ['normalized_city'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_location_one_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='normalized_city',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_normalized_city, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,45 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
+from .cache import normalize_city
+from .gazetteer import is_city_name
+
 def validate_city(value):
-    if not value.isalpha():
-        raise ValidationError('Название города должно содержать только буквы')
+    if not is_city_name(value):
+        raise ValidationError('Название города должно состоять из букв')
     if value.isdigit():
         raise ValidationError('Название города не может быть числом')
 
+class LocationQuerySet(models.QuerySet):
+    def set_default(self, location):
+        """Делает location локацией по умолчанию её пользователя.
+
+        Снимается флаг только с прежней локации по умолчанию, без перебора
+        всех локаций пользователя. Строка пользователя блокируется, чтобы
+        одновременные вызовы не нарушили ограничение одной локации по
+        умолчанию. update не отправляет сигналы, поэтому кэш локации по
+        умолчанию сбрасывается явно.
+        """
+        from .locations import invalidate_default_location
+
+        with transaction.atomic(using=self.db):
+            User.objects.select_for_update().filter(pk=location.user_id).exists()
+            self.filter(user_id=location.user_id, is_default=True).exclude(
+                pk=location.pk
+            ).update(is_default=False)
+            self.filter(pk=location.pk).update(is_default=True)
+        location.is_default = True
+        invalidate_default_location(location.user_id)
+        return location
+
+
 class Location(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='locations')
     city = models.CharField(max_length=100, validators=[validate_city])
+    # Город в виде normalize_city: по нему наблюдения сопоставляются с локациями
+    normalized_city = models.CharField(max_length=100, db_index=True, editable=False, default='')
     country = models.CharField(max_length=100)
     latitude = models.FloatField()
     longitude = models.FloatField()
@@ -18,12 +47,29 @@ class Location(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LocationQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'city', 'country')
+        constraints = [
+            # Частичный индекс: по нему же ищется локация по умолчанию
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_default=True),
+                name='location_one_default_per_user',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.city}, {self.country}"
 
+    def save(self, *args, **kwargs):
+        self.normalized_city = normalize_city(self.city)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'city' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_city'}
+        super().save(*args, **kwargs)
+
 class WeatherData(models.Model):
     location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='weather_data')
     temperature = models.FloatField()
@@ -33,10 +79,19 @@ class WeatherData(models.Model):
     wind_speed = models.FloatField()
     description = models.CharField(max_length=200)
     icon = models.CharField(max_length=10)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Время наблюдения OpenWeatherMap (поле dt ответа)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['location', 'timestamp'], name='weatherdata_location_timestamp_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-timestamp'], name='weatherdata_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"Weather for {self.location} at {self.timestamp}"
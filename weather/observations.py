@@ -0,0 +1,129 @@
+import atexit
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .cache import normalize_city
+from .http import db_task, get_executor
+
+logger = logging.getLogger(__name__)
+
+
+class ObservationRecorder:
+    """Накопление наблюдений OpenWeatherMap и пакетная запись в WeatherData.
+
+    record() только добавляет наблюдение в буфер и не обращается к БД, поэтому
+    безопасен в асинхронных представлениях. Буфер сбрасывается одним
+    bulk_create в фоновом потоке, когда набирается batch_size наблюдений
+    или проходит flush_interval секунд, в том числе если новых наблюдений
+    больше нет: первое наблюдение в пустом буфере заводит таймер.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Tuple[str, Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, city: str, current: Dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append((normalize_city(city), current))
+            due = (
+                len(self._buffer) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            schedule = not due and len(self._buffer) == 1
+        if due:
+            self._flush_later()
+        elif schedule and math.isfinite(self.flush_interval):
+            timer = threading.Timer(self.flush_interval, self._flush_later)
+            timer.daemon = True
+            timer.start()
+
+    def _flush_later(self) -> None:
+        get_executor().submit(db_task(self._flush_in_background))
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Не удалось сохранить наблюдения погоды")
+
+    def flush(self) -> int:
+        """Запись накопленных наблюдений для всех локаций с этими городами"""
+        from .models import Location, WeatherData
+
+        with self._lock:
+            pending, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        locations: Dict[str, List[int]] = {}
+        rows = Location.objects.filter(
+            normalized_city__in={city for city, _ in pending}
+        ).values_list("id", "normalized_city")
+        for location_id, city in rows:
+            locations.setdefault(city, []).append(location_id)
+
+        observations = [
+            self.build_observation(WeatherData, location_id, current)
+            for city, current in pending
+            for location_id in locations.get(city, ())
+        ]
+        # Одно и то же наблюдение (location, timestamp) записывается один раз
+        WeatherData.objects.bulk_create(
+            observations, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        return len(observations)
+
+    @staticmethod
+    def build_observation(model, location_id: int, current: Dict[str, Any]):
+        return model(
+            location_id=location_id,
+            temperature=current["temperature"],
+            feels_like=current["feels_like"],
+            humidity=current["humidity"],
+            pressure=current["pressure"],
+            wind_speed=current["wind_speed"],
+            description=current["description"],
+            icon=current["icon"],
+            timestamp=datetime.fromtimestamp(current["dt"], dt_timezone.utc),
+        )
+
+
+_recorder: Optional[ObservationRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_observation_recorder() -> Optional[ObservationRecorder]:
+    """Общий для процесса recorder или None, если запись отключена"""
+    global _recorder
+    if not getattr(settings, "WEATHER_RECORD_OBSERVATIONS", True):
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ObservationRecorder(
+                    batch_size=getattr(settings, "WEATHER_RECORD_BATCH_SIZE", 100),
+                    flush_interval=getattr(settings, "WEATHER_RECORD_FLUSH_INTERVAL", 5.0),
+                )
+                atexit.register(flush_observations)
+    return _recorder
+
+
+def flush_observations() -> int:
+    """Запись буфера recorder процесса при остановке (atexit, worker_exit gunicorn)"""
+    if _recorder is None:
+        return 0
+    try:
+        return _recorder.flush()
+    except Exception:
+        logger.exception("Не удалось сохранить наблюдения погоды")
+        return 0
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class WeatherHistoryPagination(CursorPagination):
+    """Keyset-пагинация истории наблюдений по времени наблюдения.
+
+    Курсор хранит последний timestamp страницы, поэтому выборка любой
+    страницы идёт по индексу без OFFSET.
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    ordering = "-timestamp"
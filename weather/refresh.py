@@ -0,0 +1,85 @@
+import logging
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .models import Location
+from .observations import ObservationRecorder
+from .services import WeatherService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RefreshReport:
+    cities: int = 0
+    refreshed: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    observations: int = 0
+
+
+class WeatherRefresher:
+    """Фоновое обновление погоды для сохранённых городов пользователей.
+
+    Каждый город запрашивается один раз независимо от числа локаций,
+    запросы выполняются с ограниченным параллелизмом и случайной
+    задержкой, чтобы не создавать всплеск обращений к API.
+    """
+
+    def __init__(
+        self,
+        service: Optional[WeatherService] = None,
+        concurrency: Optional[int] = None,
+        jitter: Optional[float] = None,
+    ):
+        # Наблюдения записываются пачкой в конце прохода
+        self.recorder = ObservationRecorder(
+            batch_size=getattr(settings, "WEATHER_RECORD_BATCH_SIZE", 100),
+            flush_interval=float("inf"),
+        )
+        self.service = service or WeatherService(recorder=self.recorder)
+        self.concurrency = concurrency or getattr(settings, "WEATHER_REFRESH_CONCURRENCY", 4)
+        self.jitter = jitter if jitter is not None else getattr(
+            settings, "WEATHER_REFRESH_JITTER", 5.0
+        )
+
+    def city_groups(self) -> Dict[str, List[int]]:
+        """Идентификаторы локаций, сгруппированные по нормализованному городу"""
+        groups = defaultdict(list)
+        for location_id, city in Location.objects.values_list("id", "normalized_city"):
+            groups[city].append(location_id)
+        return groups
+
+    def refresh_city(self, city: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if self.jitter:
+            time.sleep(random.uniform(0, self.jitter))
+        current = self.service.get_current_weather(city, refresh=True)
+        forecast = self.service.get_forecast(city, refresh=True)
+        return current, forecast
+
+    def run_once(self) -> RefreshReport:
+        groups = self.city_groups()
+        report = RefreshReport(cities=len(groups))
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="weather-refresh"
+        ) as executor:
+            futures = {executor.submit(self.refresh_city, city): city for city in groups}
+            for future in as_completed(futures):
+                city = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning("Не удалось обновить погоду для %s: %s", city, e)
+                    report.failed[city] = str(e)
+                    continue
+                report.refreshed.append(city)
+
+        # Запись в БД из основного потока
+        report.observations = self.recorder.flush()
+        return report
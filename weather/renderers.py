@@ -0,0 +1,41 @@
+from typing import Any
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import results
+from .results import Result
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer, отдающий готовый JSON результата из кэша.
+
+    Если у результата WeatherService уже есть закодированный JSON (encode при
+    записи в кэш), он возвращается без сериализации. Остальные данные
+    кодируются через orjson, если он установлен. Запросы с отступами
+    (браузерный API) и окружение без orjson обслуживает стандартный
+    JSONRenderer DRF.
+    """
+
+    def render(self, data: Any, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        if getattr(settings, "WEATHER_FAST_JSON", True) and self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ) is None:
+            if isinstance(data, Result) and data.encoded is not None:
+                return data.encoded
+            if results.orjson is not None:
+                return results.dumps(data, default=self.default)
+        return super().render(data, accepted_media_type, renderer_context)
+
+    @staticmethod
+    def default(value: Any) -> Any:
+        """Типы, которые orjson не кодирует сам (Decimal, ленивые строки и т.п.)"""
+        if isinstance(value, Result):
+            return value.as_dict()
+        return _drf_encoder.default(value)
+
+
+_drf_encoder = JSONEncoder()
@@ -0,0 +1,230 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket в памяти процесса: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            return True
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self.tokens
+
+
+class QuotaLimiter:
+    """Учёт квоты вызовов OpenWeatherMap в минуту.
+
+    Локальный token bucket сглаживает всплески внутри процесса. При заданном
+    общем бэкенде кэша квота дополнительно считается для всех воркеров
+    атомарным incr счётчика текущей минуты (Redis, Memcached).
+    """
+
+    def __init__(
+        self,
+        calls_per_minute: int,
+        burst: Optional[int] = None,
+        backend: Optional[str] = None,
+        prefix: str = "weather:quota",
+    ):
+        self.calls_per_minute = calls_per_minute
+        self.bucket = TokenBucket(calls_per_minute / 60, burst or calls_per_minute)
+        self.backend_alias = backend
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def _window_key(self, now: float) -> str:
+        return f"{self.prefix}:{int(now // 60)}"
+
+    def _acquire_shared(self) -> bool:
+        backend = caches[self.backend_alias]
+        key = self._window_key(time.time())
+        backend.add(key, 0, timeout=120)
+        try:
+            count = backend.incr(key)
+        except ValueError:
+            # Окно истекло между add и incr
+            backend.add(key, 1, timeout=120)
+            count = 1
+        return count <= self.calls_per_minute
+
+    async def _aacquire_shared(self) -> bool:
+        backend = caches[self.backend_alias]
+        key = self._window_key(time.time())
+        await backend.aadd(key, 0, timeout=120)
+        try:
+            count = await backend.aincr(key)
+        except ValueError:
+            await backend.aadd(key, 1, timeout=120)
+            count = 1
+        return count <= self.calls_per_minute
+
+    def acquire(self) -> bool:
+        allowed = self.bucket.acquire()
+        if allowed and self.backend_alias:
+            allowed = self._acquire_shared()
+        return self._count(allowed)
+
+    async def aacquire(self) -> bool:
+        """acquire для event loop: общий счётчик - через асинхронный API кэша"""
+        allowed = self.bucket.acquire()
+        if allowed and self.backend_alias:
+            allowed = await self._aacquire_shared()
+        return self._count(allowed)
+
+    def _count(self, allowed: bool) -> bool:
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+        return allowed
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "calls_per_minute": self.calls_per_minute,
+            "tokens_available": round(self.bucket.available(), 2),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+        if self.backend_alias:
+            used = caches[self.backend_alias].get(self._window_key(time.time()), 0)
+            stats["shared_window_used"] = used
+        return stats
+
+
+class CircuitBreaker:
+    """Размыкатель цепи для обращений к OpenWeatherMap.
+
+    После failure_threshold ошибок подряд цепь размыкается, и запросы к API
+    не выполняются reset_timeout секунд. Затем пропускается один пробный
+    запрос (half-open): успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def cancel(self) -> None:
+        """Разрешённый запрос не был выполнен (например, нет квоты)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.open_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Сколько секунд цепь ещё будет разомкнута (0, если не разомкнута)"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_count": self.open_count,
+            }
+
+
+_limiter: Optional[QuotaLimiter] = None
+_breaker: Optional[CircuitBreaker] = None
+_lock = threading.Lock()
+
+
+def get_quota_limiter() -> QuotaLimiter:
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                backend = getattr(settings, "WEATHER_CACHE_BACKEND", None)
+                if backend is None:
+                    logger.warning(
+                        "WEATHER_CACHE_BACKEND не задан: квота OpenWeatherMap считается "
+                        "отдельно в каждом воркере, всего до WEB_CONCURRENCY × "
+                        "OPENWEATHERMAP_CALLS_PER_MINUTE вызовов в минуту"
+                    )
+                _limiter = QuotaLimiter(
+                    calls_per_minute=getattr(settings, "OPENWEATHERMAP_CALLS_PER_MINUTE", 60),
+                    burst=getattr(settings, "OPENWEATHERMAP_BURST", None),
+                    backend=backend,
+                )
+    return _limiter
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    global _breaker
+    if _breaker is None:
+        with _lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failure_threshold=getattr(settings, "WEATHER_BREAKER_FAILURE_THRESHOLD", 5),
+                    reset_timeout=getattr(settings, "WEATHER_BREAKER_RESET_TIMEOUT", 30),
+                )
+    return _breaker
@@ -0,0 +1,171 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # быстрый JSON-кодировщик необязателен
+    orjson = None
+
+
+class Result:
+    """Основа результатов WeatherService: слоты вместо словаря на каждый объект.
+
+    Объекты читаются и как словари (result["city"], dict(result), **result),
+    поэтому шаблоны, DRF и код, рассчитанный на прежние словари, работают
+    без изменений. Pickle хранит только кортеж значений, без имён полей,
+    и готовый JSON, если он был закодирован методом encode.
+    """
+
+    # Закодированный JSON; поле класса-наследника __slots__ его не включает
+    __slots__ = ("_json",)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def keys(self):
+        return self.__slots__
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __reduce__(self):
+        values = tuple(getattr(self, name) for name in self.__slots__)
+        encoded = self.encoded
+        if encoded is None:
+            return self.__class__, values
+        return self.__class__, values, (None, {"_json": encoded})
+
+    @property
+    def encoded(self) -> Optional[bytes]:
+        """JSON, сохранённый encode, или None"""
+        return getattr(self, "_json", None)
+
+    def encode(self) -> bytes:
+        """Кодирование в JSON с сохранением результата в объекте"""
+        self._json = dumps(self)
+        return self._json
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Словарь верхнего уровня; вложенные результаты остаются объектами"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Полное преобразование в словари и списки"""
+        return {name: _plain(getattr(self, name)) for name in self.__slots__}
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Result):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+@dataclass(slots=True)
+class Coordinates(Result):
+    lat: float
+    lon: float
+
+
+@dataclass(slots=True)
+class CurrentWeather(Result):
+    city: str
+    country: str
+    temperature: int
+    feels_like: int
+    description: str
+    icon: str
+    humidity: int
+    pressure: int
+    wind_speed: float
+    wind_direction: str
+    sunrise: str
+    sunset: str
+    clouds: int
+    visibility: Union[int, str]
+    coordinates: Coordinates
+    dt: int
+
+
+@dataclass(slots=True)
+class ForecastSlot(Result):
+    dt: int
+    time: str
+    temperature: int
+    feels_like: int
+    humidity: int
+    pressure: int
+    wind_speed: float
+    clouds: int
+    precipitation: float
+    pop: float
+    description: str
+    icon: str
+
+
+@dataclass(slots=True)
+class DailyForecast(Result):
+    date: str
+    city: str
+    country: str
+    avg_temperature: int
+    min_temperature: int
+    max_temperature: int
+    avg_humidity: int
+    avg_pressure: int
+    avg_wind_speed: float
+    avg_clouds: int
+    precipitation: float
+    precipitation_probability: float
+    description: str
+    icon: str
+    slots: List[ForecastSlot]
+
+
+@dataclass(slots=True)
+class Forecast(Result):
+    city: str
+    country: str
+    forecasts: List[Union[DailyForecast, Dict[str, Any]]]
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Result):
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def dumps(value: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """JSON в UTF-8 для результатов и обычных словарей.
+
+    С установленным orjson dataclass-результаты кодируются им напрямую,
+    иначе - стандартным json через as_dict. default вызывается для прочих
+    типов, которые кодировщик не знает.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=default or _default)
+    if default is None:
+        return _encoder.encode(value).encode()
+    return json.dumps(
+        value, ensure_ascii=False, separators=(",", ":"), default=default
+    ).encode()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
@@ -21,4 +21,33 @@ class WeatherDataSerializer(serializers.ModelSerializer):
         model = WeatherData
         fields = ('id', 'location', 'temperature', 'feels_like', 'humidity',
                  'pressure', 'wind_speed', 'description', 'icon', 'timestamp')
-        read_only_fields = ('id', 'timestamp') 
\ No newline at end of file
+        read_only_fields = ('id', 'timestamp') 
+
+class WeatherObservationSerializer(serializers.ModelSerializer):
+    """Наблюдение без вложенной локации - для истории одной локации"""
+
+    class Meta:
+        model = WeatherData
+        fields = ('id', 'temperature', 'feels_like', 'humidity', 'pressure',
+                  'wind_speed', 'description', 'icon', 'timestamp')
+        read_only_fields = fields
+
+
+class BatchItemSerializer(serializers.Serializer):
+    city = serializers.CharField(required=False, max_length=100)
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lon = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    endpoint = serializers.ChoiceField(choices=('current', 'forecast'), default='current')
+
+    def validate(self, attrs):
+        has_coordinates = 'lat' in attrs and 'lon' in attrs
+        if not attrs.get('city') and not has_coordinates:
+            raise serializers.ValidationError('Укажите city или lat и lon')
+        if attrs['endpoint'] == 'forecast' and not attrs.get('city'):
+            raise serializers.ValidationError('Прогноз доступен только по названию города')
+        return attrs
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    items = BatchItemSerializer(many=True, allow_empty=False, max_length=50)
+    stream = serializers.BooleanField(default=False)
@@ -1,141 +1,643 @@
+import asyncio
+import functools
+import math
 import os
+import time
 import requests
 from django.conf import settings
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Any, AsyncIterator, Optional, Callable, Iterator, List, NamedTuple, Tuple
+from datetime import date, datetime, timedelta
+
+from .cache import MISSING, NOT_FOUND, WeatherCache, get_weather_cache, make_key, snap
+from .forecast import get_forecast_aggregator
+from .gazetteer import Place, get_gazetteer
+from .geo import get_geo_index
+from .instrumentation import bind_context, observe_cache, observe_upstream
+from .observations import ObservationRecorder, get_observation_recorder
+from .results import Coordinates, CurrentWeather, Forecast
+from .resilience import get_circuit_breaker, get_quota_limiter
+from .singleflight import get_async_singleflight, get_singleflight
+from .http import (
+    RETRY_STATUSES,
+    db_task,
+    get_async_client,
+    get_async_timeout,
+    get_executor,
+    get_http_session,
+    get_timeout,
+    httpx,
+    retry_delay,
+    use_async_client,
+)
+
+
+# Период опроса общего кэша, пока другой процесс запрашивает тот же ключ
+LOCK_POLL_INTERVAL = 0.05
+
+
+class CityNotFoundError(ValueError):
+    """OpenWeatherMap ответил 404 на запрос города"""
+
+
+class UpstreamRequestError(ValueError):
+    """OpenWeatherMap отклонил запрос (4xx, кроме 404 и 429): ошибка в запросе, а не сбой API"""
+
+
+class UpstreamUnavailableError(Exception):
+    """API недоступно (ошибки, разомкнутая цепь или исчерпана квота) и нет данных в кэше"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        # Через сколько секунд имеет смысл повторить запрос (заголовок Retry-After)
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(status_code: int) -> bool:
+    """Ответ, который размыкатель цепи считает сбоем API: 429 и 5xx"""
+    return status_code == 429 or status_code >= 500
+
+
+def upstream_outcome(response: Any) -> str:
+    """Метка ответа API для метрик: ok или код ошибки"""
+    return "ok" if response.status_code < 400 else str(response.status_code)
+
+
+class UpstreamQuery(NamedTuple):
+    """Описание запроса к OpenWeatherMap и правил его кэширования"""
+
+    key: str
+    endpoint: str
+    params: Dict[str, Any]
+    ttl: float
+    formatter: Callable[[Dict[str, Any]], Dict[str, Any]]
+    # Город из запроса пользователя: по нему записываются наблюдения
+    city: Optional[str] = None
 
 
 class WeatherService:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[WeatherCache] = None,
+        session: Optional[requests.Session] = None,
+        recorder: Optional[ObservationRecorder] = None,
+    ):
         self.api_key = os.getenv("OPENWEATHERMAP_API_KEY")
         if not self.api_key:
             raise ValueError("OpenWeatherMap API key is not set")
-        self.base_url = "http://api.openweathermap.org/data/2.5"
+        self.base_url = getattr(
+            settings, "OPENWEATHERMAP_BASE_URL", "http://api.openweathermap.org/data/2.5"
+        )
+        self.cache = cache if cache is not None else get_weather_cache()
+        self.session = session if session is not None else get_http_session()
+        self.recorder = recorder if recorder is not None else get_observation_recorder()
+        self.limiter = get_quota_limiter()
+        self.geo_index = get_geo_index()
+        self.forecast_aggregator = get_forecast_aggregator()
+        self.gazetteer = get_gazetteer()
+        self.encode_responses = getattr(settings, "WEATHER_CACHE_ENCODED_RESPONSES", True)
+        self.coord_grid = getattr(settings, "WEATHER_COORD_GRID", 0.01)
+        self.geo_locations_max_age = getattr(settings, "WEATHER_GEO_LOCATIONS_MAX_AGE", 300)
+        self.breaker = get_circuit_breaker()
+        self.current_ttl = getattr(settings, "WEATHER_CACHE_CURRENT_TTL", 600)
+        self.forecast_ttl = getattr(settings, "WEATHER_CACHE_FORECAST_TTL", 1800)
+        self.not_found_ttl = getattr(settings, "WEATHER_CACHE_NOT_FOUND_TTL", 300)
+        self.distributed_lock = getattr(settings, "WEATHER_SINGLEFLIGHT_DISTRIBUTED", False)
+        self.lock_timeout = getattr(settings, "WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT", 10)
 
-    def get_current_weather(self, city: str) -> Dict[str, Any]:
-        """Получение текущей погоды по названию города"""
-        url = f"{self.base_url}/weather"
-        params = {"q": city, "appid": self.api_key, "units": "metric", "lang": "ru"}
-        response = requests.get(url, params=params)
-        response.raise_for_status()
+    def get_current_weather(self, city: str, refresh: bool = False) -> Dict[str, Any]:
+        """Получение текущей погоды по названию города.
 
-        return self._format_current_weather(response.json())
+        refresh=True игнорирует кэш и обновляет его свежим ответом API.
+        """
+        return self._cached_fetch(self._current_weather_query(city), refresh)
 
     def get_weather_by_coordinates(self, lat: str, lon: str) -> Dict[str, Any]:
-        """Получение текущей погоды по координатам"""
-        url = f"{self.base_url}/weather"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": self.api_key,
-            "units": "metric",
-            "lang": "ru",
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return self._format_current_weather(response.json())
+        """Получение текущей погоды по координатам.
+
+        Координаты привязываются к сетке WEATHER_COORD_GRID. Если в радиусе
+        WEATHER_GEO_REUSE_RADIUS_KM есть свежие данные сохранённой локации
+        или недавнего запроса, они используются без обращения к API.
+        """
+        lat, lon = float(lat), float(lon)
+        self.geo_index.load_locations(self.geo_locations_max_age)
+        query = self._coordinates_query(lat, lon)
+        nearby = self._nearby_weather(query, lat, lon)
+        if nearby is not MISSING:
+            return nearby
+        data = self._cached_fetch(query)
+        self._remember_point(query)
+        return data
 
-    def get_forecast(self, city: str) -> Dict[str, Any]:
+    def get_forecast(self, city: str, refresh: bool = False) -> Dict[str, Any]:
         """Получение прогноза погоды на 7 дней"""
-        url = f"{self.base_url}/forecast"
+        return self._cached_fetch(self._forecast_query(city), refresh)
+
+    def get_current_and_forecast(self, city: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Параллельное получение текущей погоды и прогноза в пуле потоков"""
+        executor = get_executor()
+        current = executor.submit(bind_context(self.get_current_weather), city)
+        forecast = executor.submit(bind_context(self.get_forecast), city)
+        return current.result(), forecast.result()
+
+    def iter_batch(
+        self, items: List[Dict[str, Any]], concurrency: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Погода для набора городов и координат по мере готовности.
+
+        Промахи кэша запрашиваются параллельно, но не более concurrency
+        одновременно. Ошибка одного элемента не прерывает остальные.
+        """
+        concurrency = concurrency or getattr(settings, "WEATHER_BATCH_CONCURRENCY", 8)
+        executor = get_executor()
+        pending = {}
+        queue = iter(enumerate(items))
+
+        def submit_next() -> bool:
+            try:
+                index, item = next(queue)
+            except StopIteration:
+                return False
+            pending[executor.submit(bind_context(db_task(self._batch_item)), item)] = (index, item)
+            return True
+
+        while len(pending) < concurrency and submit_next():
+            pass
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item = pending.pop(future)
+                result = {"index": index, "query": item}
+                try:
+                    result["data"] = future.result()
+                except (CityNotFoundError, UpstreamRequestError) as e:
+                    result["error"] = str(e)
+                except Exception:
+                    result["error"] = "Ошибка API"
+                yield result
+                submit_next()
+
+    def _batch_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if item.get("endpoint") == "forecast":
+            return self.get_forecast(item["city"])
+        if item.get("city"):
+            return self.get_current_weather(item["city"])
+        return self.get_weather_by_coordinates(item["lat"], item["lon"])
+
+    async def aiter_batch(
+        self, items: List[Dict[str, Any]], concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Асинхронный вариант iter_batch для потоковой отдачи под ASGI"""
+        semaphore = asyncio.Semaphore(
+            concurrency or getattr(settings, "WEATHER_BATCH_CONCURRENCY", 8)
+        )
+
+        async def run(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            result = {"index": index, "query": item}
+            async with semaphore:
+                try:
+                    result["data"] = await self._abatch_item(item)
+                except (CityNotFoundError, UpstreamRequestError) as e:
+                    result["error"] = str(e)
+                except Exception:
+                    result["error"] = "Ошибка API"
+            return result
+
+        tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Клиент отключился: оставшиеся запросы больше не нужны
+            for task in tasks:
+                task.cancel()
+
+    async def _abatch_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if item.get("endpoint") == "forecast":
+            return await self.aget_forecast(item["city"])
+        if item.get("city"):
+            return await self.aget_current_weather(item["city"])
+        return await self.aget_weather_by_coordinates(item["lat"], item["lon"])
+
+    async def aget_current_weather(self, city: str) -> Dict[str, Any]:
+        """Асинхронное получение текущей погоды по названию города"""
+        return await self._acached_fetch(self._current_weather_query(city))
+
+    async def aget_weather_by_coordinates(self, lat: str, lon: str) -> Dict[str, Any]:
+        """Асинхронное получение текущей погоды по координатам.
+
+        Сохранённые локации перечитываются в индекс в пуле потоков, чтобы
+        обращение к БД не блокировало цикл событий.
+        """
+        lat, lon = float(lat), float(lon)
+        if self.geo_index.locations_expired(self.geo_locations_max_age):
+            await asyncio.get_running_loop().run_in_executor(
+                get_executor(), db_task(self.geo_index.load_locations), self.geo_locations_max_age
+            )
+        query = self._coordinates_query(lat, lon)
+        nearby = await self._anearby_weather(query, lat, lon)
+        if nearby is not MISSING:
+            return nearby
+        data = await self._acached_fetch(query)
+        self._remember_point(query)
+        return data
+
+    async def aget_forecast(self, city: str) -> Dict[str, Any]:
+        """Асинхронное получение прогноза погоды"""
+        return await self._acached_fetch(self._forecast_query(city))
+
+    async def aget_current_and_forecast(
+        self, city: str
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Параллельное асинхронное получение текущей погоды и прогноза"""
+        return tuple(
+            await asyncio.gather(self.aget_current_weather(city), self.aget_forecast(city))
+        )
+
+    def resolve_city(self, city: str) -> Optional[Place]:
+        """Город из справочника или None, если его там нет (или справочник выключен)"""
+        return self.gazetteer.resolve(city) if self.gazetteer is not None else None
+
+    def _city_params(
+        self, endpoint: str, city: str
+    ) -> Tuple[str, Dict[str, Any], Optional[Place]]:
+        """Ключ кэша и параметры запроса города.
+
+        Город из справочника запрашивается по координатам и кэшируется по
+        каноническому id, остальные - по названию (q).
+        """
+        params = {"appid": self.api_key, "units": "metric", "lang": "ru"}
+        place = self.resolve_city(city)
+        if place is None:
+            return make_key(endpoint, city=city), {"q": city, **params}, None
+        return (
+            make_key(endpoint, place_id=place.id),
+            {"lat": place.lat, "lon": place.lon, **params},
+            place,
+        )
+
+    def _current_weather_query(self, city: str) -> UpstreamQuery:
+        key, params, place = self._city_params("weather", city)
+        formatter = self._format_current_weather
+        if place is not None:
+            formatter = functools.partial(self._format_place_weather, place)
+        return UpstreamQuery(key, "weather", params, self.current_ttl, formatter, city)
+
+    def _coordinates_query(self, lat: float, lon: float) -> UpstreamQuery:
         params = {
-            "q": city,
+            "lat": snap(lat, self.coord_grid),
+            "lon": snap(lon, self.coord_grid),
             "appid": self.api_key,
             "units": "metric",
             "lang": "ru",
-            "cnt": 40,  # 5 дней * 8 измерений в день
         }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return self._format_forecast(response.json())
+        return UpstreamQuery(
+            make_key("weather", lat=lat, lon=lon),
+            "weather",
+            params,
+            self.current_ttl,
+            self._format_current_weather,
+        )
 
-    def _format_current_weather(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Форматирование данных о текущей погоде"""
-        return {
-            "city": data["name"],
-            "country": data["sys"]["country"],
-            "temperature": round(data["main"]["temp"]),
-            "feels_like": round(data["main"]["feels_like"]),
-            "description": data["weather"][0]["description"],
-            "icon": data["weather"][0]["icon"],
-            "humidity": data["main"]["humidity"],
-            "pressure": data["main"]["pressure"],
-            "wind_speed": data["wind"]["speed"],
-            "wind_direction": self._get_wind_direction(data["wind"]["deg"]),
-            "sunrise": self._format_time(data["sys"]["sunrise"]),
-            "sunset": self._format_time(data["sys"]["sunset"]),
-            "clouds": data["clouds"]["all"],
-            "visibility": data.get("visibility", "Нет данных"),
-            "coordinates": {"lat": data["coord"]["lat"], "lon": data["coord"]["lon"]},
-        }
+    def _forecast_query(self, city: str) -> UpstreamQuery:
+        key, params, place = self._city_params("forecast", city)
+        params["cnt"] = 40  # 5 дней * 8 измерений в день
+        formatter = self._format_forecast
+        if place is not None:
+            formatter = functools.partial(self._format_place_forecast, place)
+        return UpstreamQuery(key, "forecast", params, self.forecast_ttl, formatter, city)
 
-    def _format_forecast(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Форматирование данных прогноза погоды"""
-        daily_forecasts = {}
-
-        for item in data["list"]:
-            date = item["dt_txt"].split()[0]
-            if date not in daily_forecasts:
-                daily_forecasts[date] = {
-                    "date": date,
-                    "city": data["city"]["name"],
-                    "country": data["city"]["country"],
-                    "temperatures": [],
-                    "descriptions": [],
-                    "icons": [],
-                    "humidity": [],
-                    "pressure": [],
-                    "wind_speed": [],
-                    "clouds": [],
-                }
-
-            forecast = daily_forecasts[date]
-            forecast["temperatures"].append(round(item["main"]["temp"]))
-            forecast["descriptions"].append(item["weather"][0]["description"])
-            forecast["icons"].append(item["weather"][0]["icon"])
-            forecast["humidity"].append(item["main"]["humidity"])
-            forecast["pressure"].append(item["main"]["pressure"])
-            forecast["wind_speed"].append(item["wind"]["speed"])
-            forecast["clouds"].append(item["clouds"]["all"])
-
-        # Вычисляем средние значения для каждого дня
-        for date, forecast in daily_forecasts.items():
-            forecast["avg_temperature"] = round(
-                sum(forecast["temperatures"]) / len(forecast["temperatures"])
-            )
-            forecast["avg_humidity"] = round(
-                sum(forecast["humidity"]) / len(forecast["humidity"])
-            )
-            forecast["avg_pressure"] = round(
-                sum(forecast["pressure"]) / len(forecast["pressure"])
-            )
-            forecast["avg_wind_speed"] = round(
-                sum(forecast["wind_speed"]) / len(forecast["wind_speed"]), 1
-            )
-            forecast["avg_clouds"] = round(
-                sum(forecast["clouds"]) / len(forecast["clouds"])
+    def _nearby_weather(self, query: UpstreamQuery, lat: float, lon: float) -> Any:
+        """Свежие данные ближайшей известной точки или своей ячейки сетки"""
+        for key in self._nearby_keys(query, lat, lon):
+            cached = self.cache.get(key, count=False)
+            if self._reuse_nearby(cached):
+                return cached
+        self.geo_index.record(reused=False)
+        return MISSING
+
+    async def _anearby_weather(self, query: UpstreamQuery, lat: float, lon: float) -> Any:
+        for key in self._nearby_keys(query, lat, lon):
+            cached = await self.cache.aget(key, count=False)
+            if self._reuse_nearby(cached):
+                return cached
+        self.geo_index.record(reused=False)
+        return MISSING
+
+    def _nearby_keys(self, query: UpstreamQuery, lat: float, lon: float) -> List[str]:
+        return [key for key in (self.geo_index.nearest(lat, lon), query.key) if key is not None]
+
+    def _reuse_nearby(self, cached: Any) -> bool:
+        if cached is MISSING or cached == NOT_FOUND:
+            return False
+        self.cache.stats.incr("hits")
+        observe_cache("hit")
+        self.geo_index.record(reused=True)
+        return True
+
+    def _remember_point(self, query: UpstreamQuery) -> None:
+        self.geo_index.add(query.params["lat"], query.params["lon"], query.key, query.ttl)
+
+    def _cache_lookup(self, key: str, count: bool = True) -> Any:
+        return self._checked(self.cache.get(key, count=count), count)
+
+    async def _acache_lookup(self, key: str, count: bool = True) -> Any:
+        return self._checked(await self.cache.aget(key, count=count), count)
+
+    def _checked(self, cached: Any, count: bool) -> Any:
+        if count:
+            observe_cache("miss" if cached is MISSING else "hit")
+        if cached == NOT_FOUND:
+            raise CityNotFoundError("Город не найден")
+        return cached
+
+    def _remember_not_found(self, key: str) -> None:
+        """Запоминание ответа 404 в отрицательном кэше.
+
+        Повторные запросы несуществующего города не доходят до API,
+        пока не истечёт WEATHER_CACHE_NOT_FOUND_TTL.
+        """
+        self.cache.set(key, NOT_FOUND, self.not_found_ttl)
+
+    def _store(self, query: UpstreamQuery, payload: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._format(query, payload)
+        self.cache.set(query.key, data, query.ttl)
+        self._record(query, data)
+        return data
+
+    async def _astore(self, query: UpstreamQuery, payload: Dict[str, Any]) -> Dict[str, Any]:
+        data = self._format(query, payload)
+        await self.cache.aset(query.key, data, query.ttl)
+        self._record(query, data)
+        return data
+
+    def _format(self, query: UpstreamQuery, payload: Dict[str, Any]) -> Dict[str, Any]:
+        data = query.formatter(payload)
+        if self.encode_responses:
+            # Готовый JSON хранится в кэше вместе с данными: попадание не сериализует
+            data.encode()
+        return data
+
+    def _record(self, query: UpstreamQuery, data: Dict[str, Any]) -> None:
+        if self.recorder is not None and query.endpoint == "weather" and query.city:
+            self.recorder.record(query.city, data)
+
+    def _cached_fetch(self, query: UpstreamQuery, refresh: bool = False) -> Dict[str, Any]:
+        """Получение отформатированного ответа из кэша или от OpenWeatherMap.
+
+        Одновременные запросы одного ключа объединяются: к API идёт только
+        первый, остальные получают его результат.
+        """
+        if not refresh:
+            cached = self._cache_lookup(query.key)
+            if cached is not MISSING:
+                return cached
+        return get_singleflight().do(query.key, lambda: self._leader_fetch(query, refresh))
+
+    def _leader_fetch(self, query: UpstreamQuery, refresh: bool) -> Dict[str, Any]:
+        if not refresh:
+            # Пока ждали своей очереди, значение мог положить другой поток
+            cached = self._cache_lookup(query.key, count=False)
+            if cached is not MISSING:
+                return cached
+
+        locked = False
+        if self.distributed_lock and not refresh:
+            locked = self.cache.acquire_lock(query.key, self.lock_timeout)
+            if not locked:
+                cached = self._wait_for_lock_holder(query.key)
+                if cached is not MISSING:
+                    return cached
+        try:
+            return self._fetch(query)
+        finally:
+            if locked:
+                self.cache.release_lock(query.key)
+
+    def _wait_for_lock_holder(self, key: str) -> Any:
+        """Ожидание результата от процесса, удерживающего блокировку ключа"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            cached = self._cache_lookup(key, count=False)
+            if cached is not MISSING or not self.cache.is_locked(key):
+                return cached
+        return MISSING
+
+    def _fetch(self, query: UpstreamQuery) -> Dict[str, Any]:
+        if not self._upstream_allowed():
+            return self._serve_stale(query)
+        try:
+            payload = self._request(query.endpoint, query.params)
+        except requests.HTTPError as e:
+            if e.response is not None and not is_upstream_failure(e.response.status_code):
+                self._reject(query, e.response.status_code, e)
+            self.breaker.record_failure()
+            return self._serve_stale(query, e)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            return self._serve_stale(query, e)
+        self.breaker.record_success()
+        return self._store(query, payload)
+
+    def _reject(self, query: UpstreamQuery, status_code: int, error: Exception) -> None:
+        if status_code == 404:
+            self._remember_not_found(query.key)
+        raise self._rejection(status_code) from error
+
+    async def _areject(self, query: UpstreamQuery, status_code: int, error: Exception) -> None:
+        if status_code == 404:
+            await self.cache.aset(query.key, NOT_FOUND, self.not_found_ttl)
+        raise self._rejection(status_code) from error
+
+    def _rejection(self, status_code: int) -> Exception:
+        """Ответ 4xx (кроме 429): API работает, ошибка в самом запросе.
+
+        Такой ответ не считается сбоем, иначе неверный ввод одного
+        пользователя разомкнул бы цепь для всех городов.
+        """
+        self.breaker.record_success()
+        if status_code == 404:
+            return CityNotFoundError("Город не найден")
+        return UpstreamRequestError("Сервис погоды отклонил запрос")
+
+    def _upstream_allowed(self) -> bool:
+        """Можно ли сейчас обращаться к API: цепь замкнута и есть квота"""
+        if not self.breaker.allow():
+            return False
+        if not self.limiter.acquire():
+            self.breaker.cancel()
+            return False
+        return True
+
+    async def _aupstream_allowed(self) -> bool:
+        if not self.breaker.allow():
+            return False
+        if not await self.limiter.aacquire():
+            self.breaker.cancel()
+            return False
+        return True
+
+    def _serve_stale(
+        self, query: UpstreamQuery, error: Optional[Exception] = None
+    ) -> Dict[str, Any]:
+        """Устаревшие данные из кэша с флагом stale вместо ошибки API"""
+        return self._stale_response(self.cache.get_stale(query.key), error)
+
+    async def _aserve_stale(
+        self, query: UpstreamQuery, error: Optional[Exception] = None
+    ) -> Dict[str, Any]:
+        return self._stale_response(await self.cache.aget_stale(query.key), error)
+
+    def _stale_response(self, stale: Any, error: Optional[Exception]) -> Dict[str, Any]:
+        if stale is MISSING:
+            raise UpstreamUnavailableError(
+                "Сервис погоды временно недоступен", self._retry_after()
+            ) from error
+        if stale == NOT_FOUND:
+            raise CityNotFoundError("Город не найден")
+        observe_cache("stale")
+        return {**stale, "stale": True}
+
+    def _retry_after(self) -> int:
+        """До пробного запроса разомкнутой цепи, иначе до следующего вызова по квоте, сек"""
+        remaining = self.breaker.retry_after()
+        if remaining <= 0:
+            remaining = 60 / max(self.limiter.calls_per_minute, 1)
+        return max(math.ceil(remaining), 1)
+
+    async def _acached_fetch(self, query: UpstreamQuery) -> Dict[str, Any]:
+        """Асинхронный вариант _cached_fetch.
+
+        Без httpx синхронный запрос выполняется в пуле потоков.
+        """
+        if not use_async_client():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_executor(), bind_context(self._cached_fetch), query
             )
 
-            # Выбираем наиболее частое описание погоды
-            forecast["description"] = max(
-                set(forecast["descriptions"]), key=forecast["descriptions"].count
+        cached = await self._acache_lookup(query.key)
+        if cached is not MISSING:
+            return cached
+        return await get_async_singleflight().do(
+            query.key, lambda: self._aleader_fetch(query)
+        )
+
+    async def _aleader_fetch(self, query: UpstreamQuery) -> Dict[str, Any]:
+        cached = await self._acache_lookup(query.key, count=False)
+        if cached is not MISSING:
+            return cached
+
+        locked = False
+        if self.distributed_lock:
+            locked = await self.cache.aacquire_lock(query.key, self.lock_timeout)
+            if not locked:
+                cached = await self._await_lock_holder(query.key)
+                if cached is not MISSING:
+                    return cached
+        try:
+            return await self._afetch(query)
+        finally:
+            if locked:
+                await self.cache.arelease_lock(query.key)
+
+    async def _await_lock_holder(self, key: str) -> Any:
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            cached = await self._acache_lookup(key, count=False)
+            if cached is not MISSING or not await self.cache.ais_locked(key):
+                return cached
+        return MISSING
+
+    async def _afetch(self, query: UpstreamQuery) -> Dict[str, Any]:
+        if not await self._aupstream_allowed():
+            return await self._aserve_stale(query)
+        try:
+            payload = await self._arequest(query.endpoint, query.params)
+        except httpx.HTTPStatusError as e:
+            if not is_upstream_failure(e.response.status_code):
+                await self._areject(query, e.response.status_code, e)
+            self.breaker.record_failure()
+            return await self._aserve_stale(query, e)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            return await self._aserve_stale(query, e)
+        self.breaker.record_success()
+        return await self._astore(query, payload)
+
+    def _request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Запрос к OpenWeatherMap API"""
+        start = time.perf_counter()
+        try:
+            response = self.session.get(
+                f"{self.base_url}/{endpoint}", params=params, timeout=get_timeout(endpoint)
             )
-            forecast["icon"] = forecast["icons"][0]  # Берем первую иконку дня
+        except requests.RequestException:
+            observe_upstream(endpoint, time.perf_counter() - start, "error")
+            raise
+        observe_upstream(endpoint, time.perf_counter() - start, upstream_outcome(response))
+        response.raise_for_status()
+        return response.json()
 
-            # Удаляем списки, оставляем только средние значения
-            del forecast["temperatures"]
-            del forecast["descriptions"]
-            del forecast["icons"]
-            del forecast["humidity"]
-            del forecast["pressure"]
-            del forecast["wind_speed"]
-            del forecast["clouds"]
+    async def _arequest(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Асинхронный запрос к OpenWeatherMap API с повторами на 5xx"""
+        client = get_async_client()
+        retries = getattr(settings, "OPENWEATHERMAP_RETRIES", 2)
+        start = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                response = await client.get(
+                    f"{self.base_url}/{endpoint}",
+                    params=params,
+                    timeout=get_async_timeout(endpoint),
+                )
+            except httpx.TransportError:
+                if attempt == retries:
+                    observe_upstream(endpoint, time.perf_counter() - start, "error")
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    break
+            await asyncio.sleep(retry_delay(attempt))
+        observe_upstream(endpoint, time.perf_counter() - start, upstream_outcome(response))
+        response.raise_for_status()
+        return response.json()
 
-        return {
-            "city": data["city"]["name"],
-            "country": data["city"]["country"],
-            "forecasts": list(daily_forecasts.values()),
-        }
+    def _format_current_weather(self, data: Dict[str, Any]) -> CurrentWeather:
+        """Форматирование данных о текущей погоде"""
+        return CurrentWeather(
+            city=data["name"],
+            country=data["sys"]["country"],
+            temperature=round(data["main"]["temp"]),
+            feels_like=round(data["main"]["feels_like"]),
+            description=data["weather"][0]["description"],
+            icon=data["weather"][0]["icon"],
+            humidity=data["main"]["humidity"],
+            pressure=data["main"]["pressure"],
+            wind_speed=data["wind"]["speed"],
+            wind_direction=self._get_wind_direction(data["wind"]["deg"]),
+            sunrise=self._format_time(data["sys"]["sunrise"]),
+            sunset=self._format_time(data["sys"]["sunset"]),
+            clouds=data["clouds"]["all"],
+            visibility=data.get("visibility", "Нет данных"),
+            coordinates=Coordinates(lat=data["coord"]["lat"], lon=data["coord"]["lon"]),
+            dt=data["dt"],
+        )
+
+    def _format_forecast(self, data: Dict[str, Any]) -> Forecast:
+        """Форматирование данных прогноза погоды: сводка по дням"""
+        return self.forecast_aggregator.aggregate(data)
+
+    # По координатам API называет ближайший населённый пункт или район,
+    # поэтому название города берётся из справочника
+
+    def _format_place_weather(self, place: Place, data: Dict[str, Any]) -> CurrentWeather:
+        return self._format_current_weather({**data, "name": place.name})
+
+    def _format_place_forecast(self, place: Place, data: Dict[str, Any]) -> Forecast:
+        return self._format_forecast({**data, "city": {**data["city"], "name": place.name}})
 
     def _get_wind_direction(self, degrees: float) -> str:
         """Преобразование градусов в направление ветра"""
@@ -164,46 +666,37 @@ class WeatherService:
         }
 
     def process_forecast_data(self, forecast_data: Dict[str, Any]) -> list:
-        """Обработка данных прогноза погоды"""
+        """Первый 3-часовой слот каждого дня прогноза.
+
+        Дни те же, что и в сводке _format_forecast (местное время города),
+        payload разбирается один раз для обоих представлений. Как и раньше,
+        date - datetime.date, значения - из ответа API без округления.
+        """
+        days = self.forecast_aggregator.aggregate(forecast_data)["forecasts"]
+        items = {item["dt"]: item for item in forecast_data["list"]}
         processed_forecast = []
-        current_date = None
-        daily_forecast = None
-
-        for item in forecast_data["list"]:
-            date = datetime.fromtimestamp(item["dt"]).date()
-
-            if current_date != date:
-                if daily_forecast:
-                    processed_forecast.append(daily_forecast)
-
-                current_date = date
-                daily_forecast = {
-                    "date": date,
-                    "temperature": item["main"]["temp"],
-                    "feels_like": item["main"]["feels_like"],
-                    "humidity": item["main"]["humidity"],
-                    "pressure": item["main"]["pressure"],
-                    "wind_speed": item["wind"]["speed"],
-                    "description": item["weather"][0]["description"],
-                    "icon": item["weather"][0]["icon"],
-                }
-
-        if daily_forecast:
-            processed_forecast.append(daily_forecast)
-
-        return processed_forecast[:7]  # Возвращаем прогноз на 7 дней
-
-    def validate_city_name(self, city):
-        """Проверяет существование города через API OpenWeatherMap."""
-        api_key = settings.OPENWEATHERMAP_API_KEY
-        url = f'http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}'
-        
+        for day in days[:7]:  # Возвращаем прогноз на 7 дней
+            item = items[day["slots"][0]["dt"]]
+            processed_forecast.append({
+                "date": date.fromisoformat(day["date"]),
+                "temperature": item["main"]["temp"],
+                "feels_like": item["main"]["feels_like"],
+                "humidity": item["main"]["humidity"],
+                "pressure": item["main"]["pressure"],
+                "wind_speed": item["wind"]["speed"],
+                "description": item["weather"][0]["description"],
+                "icon": item["weather"][0]["icon"],
+            })
+        return processed_forecast
+
+    def validate_city_name(self, city: str) -> Dict[str, Any]:
+        """Проверяет существование города через API OpenWeatherMap.
+
+        Использует тот же (кэшируемый) запрос текущей погоды, поэтому
+        последующий get_current_weather для города не обращается к API.
+        Возвращает данные о текущей погоде.
+        """
         try:
-            response = requests.get(url)
-            if response.status_code == 404:
-                raise ValueError('Город не найден')
-            elif response.status_code != 200:
-                raise ValueError('Ошибка при проверке города')
-            return True
-        except requests.RequestException:
-            raise ValueError('Ошибка при проверке города')
+            return self.get_current_weather(city)
+        except (requests.RequestException, UpstreamUnavailableError):
+            raise ValueError("Ошибка при проверке города")
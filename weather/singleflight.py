@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from .cache import CacheStats
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом.
+
+    Первый вызов (лидер) выполняет функцию, остальные ждут его результата
+    или исключения. Работает для потоков; для корутин - AsyncSingleFlight.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = self.stats.as_dict()
+        return {"leaders": stats["misses"], "coalesced": stats["hits"]}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self.stats.incr("hits")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        self.stats.incr("misses")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """Объединение одновременных корутин с одинаковым ключом в одном event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.stats = CacheStats()
+
+    get_stats = SingleFlight.get_stats
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            self.stats.incr("hits")
+            # shield: отмена одного ожидающего не отменяет общий запрос
+            return await asyncio.shield(future)
+
+        self.stats.incr("misses")
+        future = self._calls[call_key] = loop.create_future()
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже проброшено лидеру; не ругаемся, если ждущих нет
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[call_key]
+
+
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+
+def get_singleflight() -> SingleFlight:
+    return _flights
+
+
+def get_async_singleflight() -> AsyncSingleFlight:
+    return _async_flights
@@ -0,0 +1,21 @@
+import logging
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+logger = logging.getLogger(__name__)
+
+
+class WeatherStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Статика с хэшем в именах и сжатыми вариантами (collectstatic).
+
+    Если манифеста нет или в нём нет файла (collectstatic не запускался,
+    STATIC_ROOT перекрыт томом), {% static %} ссылается на имя без хэша,
+    а не роняет страницу с ошибкой 500.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            logger.warning("Нет %s в манифесте статики: выполните collectstatic", name)
+            return name
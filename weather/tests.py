@@ -1,9 +1,57 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, override_settings
 from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, force_authenticate
 from rest_framework import status
-from .models import Location
-from unittest.mock import patch
+from .models import Location, WeatherData
+from .auth import CachedModelBackend
+from .cache import MISSING, WeatherCache, get_weather_cache, make_key, snap
+from . import results
+from .renderers import FastJSONRenderer
+from .results import CurrentWeather
+from .forecast import Aggregate, ForecastAggregator, get_forecast_aggregator
+from .gazetteer import build_names_index, get_gazetteer, is_city_name, normalize_name
+from .geo import GeoIndex, get_geo_index, haversine_km
+from .instrumentation import MetricsRegistry, RequestTimings, observe_db_connect
+from .http import (
+    async_client_scope,
+    build_session,
+    db_task,
+    get_async_client,
+    get_http_session,
+    get_timeout,
+    use_async_client,
+    with_async_client,
+)
+from .observations import ObservationRecorder, flush_observations
+from .refresh import WeatherRefresher
+from .resilience import CircuitBreaker, QuotaLimiter, get_circuit_breaker, get_quota_limiter
+from .live import LiveWeatherHub
+from .metrics import collect_metrics
+from .locations import get_default_location
+from .services import CityNotFoundError, UpstreamRequestError, UpstreamUnavailableError, WeatherService
+from .views import WeatherViewSet, _fragment_ttl, conditional_response, live_weather, weather_etag
+from .warmup import warm_up
+from unittest.mock import AsyncMock, Mock, patch
+import requests
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 
 class WeatherAPITests(TestCase):
     def setUp(self):
@@ -140,3 +188,1421 @@ class WeatherAPITests(TestCase):
         # Проверка, что Париж стал локацией по умолчанию
         response = self.client.get('/api/locations/')
         self.assertTrue(response.data[1]['is_default'])
+
+
+CURRENT_PAYLOAD = {
+    'name': 'Moscow',
+    'dt': 1750000000,
+    'coord': {'lat': 55.7558, 'lon': 37.6173},
+    'main': {'temp': 20.2, 'feels_like': 19.4, 'humidity': 65, 'pressure': 1013},
+    'weather': [{'description': 'ясно', 'icon': '01d'}],
+    'wind': {'speed': 5.0, 'deg': 0},
+    'sys': {'country': 'RU', 'sunrise': 1749950000, 'sunset': 1750010000},
+    'clouds': {'all': 0},
+    'visibility': 10000,
+}
+
+
+@override_settings(WEATHER_RECORD_OBSERVATIONS=False)
+class WeatherServiceTestCase(TestCase):
+    """Сбрасывает общее для процесса состояние WeatherService между тестами.
+
+    Общий recorder выключен: его таймер и atexit писали бы в БД вне теста.
+    Запись наблюдений проверяется отдельным ObservationRecorder.
+    """
+
+    def setUp(self):
+        # Счётчики троттлинга DRF живут в кэше Django
+        cache.clear()
+        get_weather_cache().clear()
+        for name, value in (
+            ('_limiter', QuotaLimiter(calls_per_minute=10_000)),
+            ('_breaker', CircuitBreaker()),
+        ):
+            patcher = patch(f'weather.resilience.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, value in (
+            ('weather.geo._geo_index', GeoIndex(radius_km=5)),
+            ('weather.forecast._aggregator', ForecastAggregator()),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherCacheTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = WeatherCache(maxsize=2)
+
+    @patch('weather.services.WeatherService._request')
+    def test_repeated_city_hits_cache(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        service.get_current_weather('  moscow ')
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(self.cache.get_stats()['hits'], 1)
+        self.assertEqual(self.cache.get_stats()['misses'], 1)
+
+    @patch('weather.services.WeatherService._request')
+    def test_coordinates_are_rounded_in_key(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        service = WeatherService(cache=self.cache)
+        service.get_weather_by_coordinates('55.75581', '37.61731')
+        service.get_weather_by_coordinates('55.75579', '37.61729')
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 1, 60)
+        self.cache.set('b', 2, 60)
+        self.cache.get('a')
+        self.cache.set('c', 3, 60)
+        self.assertIs(self.cache.get('b'), MISSING)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+
+    def test_expired_entry_is_miss(self):
+        self.cache.set('a', 1, -1)
+        self.assertIs(self.cache.get('a'), MISSING)
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_backend_tier(self):
+        writer = WeatherCache(backend='shared')
+        reader = WeatherCache(backend='shared')
+        writer.set('weather:city:moscow', {'city': 'Moscow'}, 60)
+        self.assertEqual(reader.get('weather:city:moscow'), {'city': 'Moscow'})
+        self.assertEqual(reader.get_stats()['backend_hits'], 1)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherHttpTests(WeatherServiceTestCase):
+    def test_session_retries_on_server_errors_only(self):
+        retry = build_session(retries=3).get_adapter('https://api.openweathermap.org').max_retries
+        self.assertEqual(retry.total, 3)
+        # Повтор 429 расходовал бы квоту мимо лимитера
+        self.assertNotIn(429, retry.status_forcelist)
+        self.assertIn(503, retry.status_forcelist)
+        self.assertNotIn(404, retry.status_forcelist)
+
+    def test_request_uses_endpoint_timeout(self):
+        session = Mock()
+        session.get.return_value.status_code = 200
+        session.get.return_value.json.return_value = CURRENT_PAYLOAD
+        service = WeatherService(cache=WeatherCache(), session=session)
+        service.get_current_weather('Moscow')
+        self.assertEqual(session.get.call_args.kwargs['timeout'], get_timeout('weather'))
+
+    def test_shared_session_per_process(self):
+        self.assertIs(get_http_session(), get_http_session())
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class CityValidationTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='validator', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def _not_found(self):
+        response = Mock(status_code=404)
+        return requests.HTTPError(response=response)
+
+    @patch('weather.services.WeatherService._request')
+    def test_search_makes_single_upstream_call(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        response = self.client.get('/api/weather/search/?q=Moscow')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch('weather.services.WeatherService._request')
+    def test_unknown_city_is_negatively_cached(self, mock_request):
+        mock_request.side_effect = self._not_found()
+        for _ in range(3):
+            response = self.client.get('/api/weather/search/?q=Atlantis')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['error'], 'Город не найден')
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch('weather.services.WeatherService._request')
+    def test_location_create_reuses_validation_fetch(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        response = self.client.post('/api/locations/', {
+            'city': 'Moscow', 'country': 'RU', 'latitude': 55.75, 'longitude': 37.62,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.get('/api/weather/search/?q=Moscow')
+        self.assertEqual(mock_request.call_count, 1)
+
+    @patch('weather.services.WeatherService._request')
+    def test_location_create_rejects_unknown_city(self, mock_request):
+        mock_request.side_effect = self._not_found()
+        response = self.client.post('/api/locations/', {
+            'city': 'Atlantis', 'country': 'XX', 'latitude': 0, 'longitude': 0,
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['city'], 'Город не найден')
+
+
+FORECAST_PAYLOAD = {
+    'city': {'name': 'Moscow', 'country': 'RU', 'timezone': 10800},
+    'list': [
+        {
+            'dt': 1749945600 + i * 10800,
+            'dt_txt': f'2025-06-{15 + i // 8} {(i % 8) * 3:02d}:00:00',
+            'main': {'temp': 15 + i % 8, 'feels_like': 14, 'humidity': 60, 'pressure': 1010},
+            'weather': [{'description': 'ясно', 'icon': '01d'}],
+            'wind': {'speed': 3.0, 'deg': 90},
+            'clouds': {'all': 20},
+        }
+        for i in range(16)
+    ],
+}
+
+
+def slow_request(endpoint, params):
+    time.sleep(0.2)
+    return CURRENT_PAYLOAD if endpoint == 'weather' else FORECAST_PAYLOAD
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+@override_settings(OPENWEATHERMAP_ASYNC_CLIENT='threads')
+class ConcurrentFetchTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='homeuser', password='testpass123')
+        Location.objects.create(
+            user=self.user, city='Moscow', country='RU',
+            latitude=55.7558, longitude=37.6173, is_default=True,
+        )
+
+    @patch('weather.services.WeatherService._request', side_effect=slow_request)
+    def test_sync_fetch_runs_in_parallel(self, mock_request):
+        start = time.monotonic()
+        current, forecast = WeatherService().get_current_and_forecast('Moscow')
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertEqual(current['city'], 'Moscow')
+        self.assertIn('forecasts', forecast)
+
+    @patch('weather.services.WeatherService._request', side_effect=slow_request)
+    def test_home_fetches_current_and_forecast_concurrently(self, mock_request):
+        self.client.force_login(self.user)
+        start = time.monotonic()
+        response = self.client.get('/')
+        self.assertLess(time.monotonic() - start, 0.35)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['current_weather']['city'], 'Moscow')
+        self.assertEqual(mock_request.call_count, 2)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherRefreshTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        for i, city in enumerate(['Moscow', 'moscow', 'London']):
+            user = User.objects.create_user(username=f'refresh{i}', password='testpass123')
+            Location.objects.create(
+                user=user, city=city, country='RU', latitude=0, longitude=0, is_default=True
+            )
+
+    @patch('weather.services.WeatherService._request')
+    def test_refresh_fetches_each_city_once(self, mock_request):
+        mock_request.side_effect = (
+            lambda endpoint, params: CURRENT_PAYLOAD if endpoint == 'weather' else FORECAST_PAYLOAD
+        )
+        out, err = StringIO(), StringIO()
+        with override_settings(WEATHER_CACHE_BACKEND=None):
+            call_command('refresh_weather', jitter=0, stdout=out, stderr=err)
+        # Moscow и moscow - один город: 2 города * (погода + прогноз)
+        self.assertEqual(mock_request.call_count, 4)
+        self.assertEqual(WeatherData.objects.count(), 3)
+        self.assertIn('Обновлено городов: 2/2', out.getvalue())
+        # Без общего кэша веб-воркеры обновлений не увидят
+        self.assertIn('WEATHER_CACHE_BACKEND', err.getvalue())
+
+    @patch('weather.services.WeatherService._request')
+    def test_refreshed_data_served_from_cache(self, mock_request):
+        mock_request.side_effect = (
+            lambda endpoint, params: CURRENT_PAYLOAD if endpoint == 'weather' else FORECAST_PAYLOAD
+        )
+        WeatherRefresher(jitter=0).run_once()
+        mock_request.reset_mock()
+        WeatherService().get_current_weather('Moscow')
+        WeatherService().get_forecast('London')
+        mock_request.assert_not_called()
+
+    @patch('weather.services.WeatherService._request')
+    def test_failed_city_does_not_stop_refresh(self, mock_request):
+        london = get_gazetteer().resolve('London')
+
+        def request(endpoint, params):
+            # Город из справочника запрашивается по координатам
+            if params['lat'] == london.lat:
+                raise requests.ConnectionError('upstream down')
+            return CURRENT_PAYLOAD if endpoint == 'weather' else FORECAST_PAYLOAD
+
+        mock_request.side_effect = request
+        report = WeatherRefresher(jitter=0).run_once()
+        self.assertEqual(report.refreshed, ['moscow'])
+        self.assertIn('london', report.failed)
+        self.assertEqual(WeatherData.objects.count(), 2)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherHistoryTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='historian', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.location = Location.objects.create(
+            user=self.user, city='Moscow', country='RU', latitude=0, longitude=0
+        )
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_observations_are_recorded_in_batches(self, mock_request):
+        recorder = ObservationRecorder(batch_size=100, flush_interval=float('inf'))
+        service = WeatherService(cache=WeatherCache(), recorder=recorder)
+        service.get_current_weather('Moscow')
+        service.get_current_weather('moscow', refresh=True)
+        self.assertEqual(WeatherData.objects.count(), 0)
+        recorder.flush()
+        # Повторное наблюдение с тем же dt не дублируется
+        self.assertEqual(WeatherData.objects.count(), 1)
+        observation = WeatherData.objects.get()
+        self.assertEqual(observation.location, self.location)
+        self.assertEqual(observation.timestamp.timestamp(), CURRENT_PAYLOAD['dt'])
+
+    @patch('weather.http.close_old_connections')
+    @patch('weather.http.connections')
+    def test_pool_tasks_release_db_connections(self, mock_connections, mock_close_old):
+        task = Mock(side_effect=RuntimeError)
+        with self.assertRaises(RuntimeError):
+            db_task(task)()
+        mock_close_old.assert_called_once_with()
+        mock_connections.close_all.assert_called_once_with()
+
+    @patch('weather.observations.threading.Timer')
+    def test_first_observation_schedules_flush(self, mock_timer):
+        recorder = ObservationRecorder(batch_size=100, flush_interval=5)
+        recorder.record('Moscow', {**CURRENT_PAYLOAD, 'temperature': 20})
+        recorder.record('Moscow', CURRENT_PAYLOAD)
+        mock_timer.assert_called_once_with(5, recorder._flush_later)
+        mock_timer.return_value.start.assert_called_once_with()
+
+    def test_observations_match_city_like_cache_keys(self):
+        spaced = Location.objects.create(
+            user=self.user, city='New   York', country='US', latitude=0, longitude=0
+        )
+        recorder = ObservationRecorder(batch_size=100, flush_interval=float('inf'))
+        current = WeatherService()._format_current_weather(CURRENT_PAYLOAD)
+        recorder.record(' new york ', current)
+        recorder.record('MOSCOW', current)
+        self.assertEqual(recorder.flush(), 2)
+        self.assertEqual(
+            set(WeatherData.objects.values_list('location', flat=True)), {self.location.pk, spaced.pk}
+        )
+
+    def test_buffer_is_flushed_on_exit(self):
+        recorder = ObservationRecorder(batch_size=100, flush_interval=float('inf'))
+        with patch('weather.observations._recorder', recorder), \
+                patch.object(recorder, 'flush', return_value=1) as flush:
+            self.assertEqual(flush_observations(), 1)
+        flush.assert_called_once_with()
+
+    def test_history_uses_cursor_pagination(self):
+        WeatherData.objects.bulk_create(
+            WeatherData(
+                location=self.location, temperature=i, feels_like=i, humidity=50,
+                pressure=1000, wind_speed=1, description='ясно', icon='01d',
+                timestamp=datetime(2025, 6, 1, tzinfo=dt_timezone.utc) + timedelta(hours=i),
+            )
+            for i in range(5)
+        )
+        url = f'/api/locations/{self.location.id}/history/?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['temperature'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [4, 3, 2, 1, 0])
+
+    def test_history_is_scoped_to_owner(self):
+        other = User.objects.create_user(username='stranger', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(f'/api/locations/{self.location.id}/history/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class SingleFlightTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = WeatherCache()
+
+    @patch('weather.services.WeatherService._request')
+    def test_concurrent_threads_share_one_upstream_call(self, mock_request):
+        def request(endpoint, params):
+            time.sleep(0.1)
+            return CURRENT_PAYLOAD
+
+        mock_request.side_effect = request
+        service = WeatherService(cache=self.cache)
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(lambda _: service.get_current_weather('Moscow'), range(20)))
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertTrue(all(result['city'] == 'Moscow' for result in results))
+
+    @patch('weather.services.WeatherService._request')
+    def test_leader_error_is_shared(self, mock_request):
+        def request(endpoint, params):
+            time.sleep(0.1)
+            raise requests.ConnectionError('upstream down')
+
+        mock_request.side_effect = request
+        service = WeatherService(cache=self.cache)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(service.get_current_weather, 'Moscow') for _ in range(5)]
+        for future in futures:
+            self.assertIsInstance(future.exception(), UpstreamUnavailableError)
+        self.assertEqual(mock_request.call_count, 1)
+
+    @override_settings(OPENWEATHERMAP_ASYNC_CLIENT='httpx')
+    @patch('weather.services.WeatherService._arequest')
+    def test_concurrent_coroutines_share_one_upstream_call(self, mock_arequest):
+        async def arequest(endpoint, params):
+            await asyncio.sleep(0.1)
+            return CURRENT_PAYLOAD
+
+        mock_arequest.side_effect = arequest
+        service = WeatherService(cache=self.cache)
+
+        async def burst():
+            async with async_client_scope():
+                return await asyncio.gather(
+                    *(service.aget_current_weather('Moscow') for _ in range(20))
+                )
+
+        results = asyncio.run(burst())
+        self.assertEqual(mock_arequest.call_count, 1)
+        self.assertEqual(len(results), 20)
+
+    @override_settings(OPENWEATHERMAP_ASYNC_CLIENT='httpx')
+    def test_async_client_lives_for_asgi_lifespan(self):
+        clients = []
+
+        async def app(scope, receive, send):
+            clients.append(get_async_client())
+
+        application = with_async_client(app)
+
+        async def serve():
+            messages, sent = asyncio.Queue(), []
+
+            async def send(message):
+                sent.append(message['type'])
+
+            # Вне lifespan, как под WSGI: запросы через сессию requests
+            self.assertFalse(use_async_client())
+            await messages.put({'type': 'lifespan.startup'})
+            lifespan = asyncio.create_task(application({'type': 'lifespan'}, messages.get, send))
+            while not sent:
+                await asyncio.sleep(0)
+            self.assertTrue(use_async_client())
+            await application({'type': 'http'}, None, None)
+            await messages.put({'type': 'lifespan.shutdown'})
+            await lifespan
+            self.assertFalse(use_async_client())
+            return sent
+
+        sent = asyncio.run(serve())
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(clients[0].is_closed)
+
+    @override_settings(OPENWEATHERMAP_ASYNC_CLIENT='httpx', WEATHER_SINGLEFLIGHT_DISTRIBUTED=True)
+    @patch('weather.services.WeatherService._arequest', return_value=CURRENT_PAYLOAD)
+    def test_async_fetch_keeps_shared_cache_off_event_loop(self, mock_arequest):
+        service = WeatherService(cache=WeatherCache(backend='default'))
+        calls = []
+
+        def spy(name):
+            original = getattr(cache, name)
+
+            def wrapper(*args, **kwargs):
+                calls.append((name, threading.current_thread()))
+                return original(*args, **kwargs)
+
+            return patch.object(cache, name, wrapper)
+
+        async def fetch():
+            async with async_client_scope():
+                return await service.aget_current_weather('Moscow')
+
+        with spy('get'), spy('set'), spy('add'), spy('delete'):
+            asyncio.run(fetch())
+        # Общий бэкенд (в продакшене Redis) читается и пишется не из потока event loop
+        self.assertEqual({name for name, _ in calls}, {'get', 'set', 'add', 'delete'})
+        self.assertNotIn(threading.current_thread(), {thread for _, thread in calls})
+
+    @override_settings(WEATHER_SINGLEFLIGHT_DISTRIBUTED=True)
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_waits_for_lock_held_by_other_process(self, mock_request):
+        shared = WeatherCache(backend='default')
+        other_process = WeatherCache(backend='default')
+        key = 'weather:place:RU-moscow'
+        self.assertTrue(other_process.acquire_lock(key, 5))
+
+        def finish_fetch():
+            time.sleep(0.1)
+            other_process.set(key, {'city': 'Moscow'}, 60)
+            other_process.release_lock(key)
+
+        threading.Thread(target=finish_fetch).start()
+        result = WeatherService(cache=shared).get_current_weather('Moscow')
+        self.assertEqual(result, {'city': 'Moscow'})
+        mock_request.assert_not_called()
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherBatchTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='dashboard', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def _request(self, endpoint, params):
+        if params.get('q') == 'Atlantis':
+            raise requests.HTTPError(response=Mock(status_code=404))
+        return CURRENT_PAYLOAD if endpoint == 'weather' else FORECAST_PAYLOAD
+
+    @patch('weather.services.WeatherService._request')
+    def test_batch_returns_results_in_order_with_item_errors(self, mock_request):
+        mock_request.side_effect = self._request
+        response = self.client.post('/api/weather/batch/', {'items': [
+            {'city': 'Moscow'},
+            {'lat': 55.75, 'lon': 37.62},
+            {'city': 'Atlantis'},
+            {'city': 'Moscow', 'endpoint': 'forecast'},
+            {'city': 'moscow'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(results[0]['data']['city'], 'Moscow')
+        self.assertEqual(results[2]['error'], 'Город не найден')
+        self.assertIn('forecasts', results[3]['data'])
+        # moscow берётся из кэша
+        self.assertEqual(mock_request.call_count, 4)
+
+    @patch('weather.services.WeatherService._request')
+    def test_batch_streams_ndjson(self, mock_request):
+        mock_request.side_effect = self._request
+        response = self.client.post('/api/weather/batch/', {
+            'items': [{'city': 'Moscow'}, {'city': 'Atlantis'}],
+            'stream': True,
+        }, format='json')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1])
+
+    def test_batch_streams_under_asgi_as_items_complete(self):
+        release = {}
+
+        async def batch_item(service, item):
+            if item['city'] == 'Slow':
+                await release['slow'].wait()
+            return {'city': item['city']}
+
+        request = AsyncRequestFactory().post(
+            '/api/weather/batch/',
+            json.dumps({'items': [{'city': 'Slow'}, {'city': 'Moscow'}], 'stream': True}),
+            content_type='application/json',
+        )
+        force_authenticate(request, user=self.user)
+        response = WeatherViewSet.as_view({'post': 'batch'})(request)
+
+        async def scenario():
+            release['slow'] = asyncio.Event()
+            lines = aiter(response.streaming_content)
+            async with asyncio.timeout(5):
+                first = json.loads(await anext(lines))
+                release['slow'].set()
+                rest = [json.loads(line) async for line in lines]
+            return first, rest
+
+        with patch.object(WeatherService, '_abatch_item', batch_item):
+            first, rest = asyncio.run(scenario())
+        # Первая строка пришла, пока медленный элемент ещё ждал
+        self.assertEqual(first['data'], {'city': 'Moscow'})
+        self.assertEqual([line['index'] for line in rest], [0])
+
+    def test_batch_validates_items(self):
+        response = self.client.post('/api/weather/batch/', {'items': [{'lat': 10}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            '/api/weather/batch/', {'items': [{'city': 'Moscow'}] * 51}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class UpstreamResilienceTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = WeatherCache(stale_ttl=3600)
+
+    def _expire(self, key):
+        value, _, stale_until = self.cache.local._data[key]
+        self.cache.local._data[key] = (value, time.monotonic() - 1, stale_until)
+
+    def test_token_bucket_limits_calls(self):
+        limiter = QuotaLimiter(calls_per_minute=60, burst=2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.get_stats()['rejected'], 1)
+
+    @override_settings(CACHES={'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_quota_is_shared_between_workers(self):
+        first = QuotaLimiter(calls_per_minute=3, backend='shared')
+        second = QuotaLimiter(calls_per_minute=3, backend='shared')
+        results = [first.acquire(), second.acquire(), first.acquire(), second.acquire()]
+        self.assertEqual(results, [True, True, True, False])
+
+    @override_settings(WEATHER_CACHE_BACKEND=None)
+    def test_per_worker_quota_is_reported(self):
+        with patch('weather.resilience._limiter', None), \
+                self.assertLogs('weather.resilience', 'WARNING') as logs:
+            get_quota_limiter()
+        self.assertIn('WEATHER_CACHE_BACKEND', logs.output[0])
+
+    def test_breaker_opens_and_half_opens(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        # Пока идёт пробный запрос, остальные не пропускаются
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.get_stats()['state'], CircuitBreaker.CLOSED)
+
+    @patch('weather.services.WeatherService._request')
+    def test_stale_data_served_when_upstream_fails(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        self._expire('weather:place:RU-moscow')
+
+        mock_request.side_effect = requests.HTTPError(response=Mock(status_code=503))
+        result = service.get_current_weather('Moscow')
+        self.assertTrue(result['stale'])
+        self.assertEqual(result['city'], 'Moscow')
+
+    @patch('weather.services.WeatherService._request')
+    def test_open_breaker_skips_upstream(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError('upstream down')
+        service = WeatherService(cache=self.cache)
+        for _ in range(5):
+            with self.assertRaises(UpstreamUnavailableError):
+                service.get_current_weather('Moscow')
+        self.assertEqual(get_circuit_breaker().get_stats()['state'], CircuitBreaker.OPEN)
+        with self.assertRaises(UpstreamUnavailableError):
+            service.get_current_weather('Moscow')
+        self.assertEqual(mock_request.call_count, 5)
+
+    @patch('weather.services.WeatherService._request')
+    def test_unavailable_upstream_returns_503(self, mock_request):
+        mock_request.side_effect = requests.ConnectionError('upstream down')
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='outage', password='testpass123'))
+        for _ in range(5):
+            response = client.get('/api/weather/current/?city=Moscow')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        # Цепь разомкнута: повторить не раньше, чем через WEATHER_BREAKER_RESET_TIMEOUT
+        response = client.get('/api/weather/forecast/?city=Moscow')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertGreaterEqual(int(response['Retry-After']), 25)
+        self.assertEqual(mock_request.call_count, 5)
+
+    @patch('weather.services.WeatherService._request')
+    def test_client_errors_do_not_open_breaker(self, mock_request):
+        mock_request.side_effect = requests.HTTPError(response=Mock(status_code=400))
+        service = WeatherService(cache=self.cache)
+        for _ in range(5):
+            with self.assertRaises(UpstreamRequestError):
+                service.get_weather_by_coordinates('95', '37.6')
+        self.assertEqual(get_circuit_breaker().get_stats()['state'], CircuitBreaker.CLOSED)
+
+        mock_request.side_effect = None
+        mock_request.return_value = CURRENT_PAYLOAD
+        self.assertEqual(service.get_current_weather('Moscow')['city'], 'Moscow')
+        self.assertEqual(mock_request.call_count, 6)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_exhausted_quota_serves_stale(self, mock_request):
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        self._expire('weather:place:RU-moscow')
+        with patch.object(get_quota_limiter(), 'acquire', return_value=False):
+            result = service.get_current_weather('Moscow')
+        self.assertTrue(result['stale'])
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_metrics_endpoint_requires_admin(self):
+        client = APIClient()
+        user = User.objects.create_user(username='viewer', password='testpass123')
+        client.force_authenticate(user=user)
+        self.assertEqual(client.get('/api/weather/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+        user.is_staff = True
+        user.save()
+        response = client.get('/api/weather/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['circuit_breaker']['state'], CircuitBreaker.CLOSED)
+        self.assertIn('rejected', response.data['quota_limiter'])
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class GeoReuseTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = WeatherCache()
+        self.user = User.objects.create_user(username='geo', password='testpass123')
+
+    def test_snap_to_grid(self):
+        self.assertEqual(snap(55.75581, 0.01), 55.76)
+        self.assertEqual(snap(-0.12781, 0.05), -0.15)
+        self.assertEqual(
+            make_key('weather', lat='55.7558', lon='37.6173'),
+            make_key('weather', lat=55.7612, lon=37.6151),
+        )
+
+    def test_haversine(self):
+        # Москва - Санкт-Петербург, около 634 км
+        self.assertAlmostEqual(haversine_km(55.7558, 37.6173, 59.9343, 30.3351), 634, delta=5)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_nearby_request_reuses_cached_point(self, mock_request):
+        service = WeatherService(cache=self.cache)
+        service.get_weather_by_coordinates('55.7558', '37.6173')
+        # ~2 км от первой точки, другая ячейка сетки
+        service.get_weather_by_coordinates('55.7700', '37.6400')
+        # ~70 км, вне радиуса
+        service.get_weather_by_coordinates('56.3000', '38.1000')
+        self.assertEqual(mock_request.call_count, 2)
+        stats = get_geo_index().get_stats()
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(stats['requests'], 3)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_upstream_receives_snapped_coordinates(self, mock_request):
+        WeatherService(cache=self.cache).get_weather_by_coordinates('55.75581', '37.61731')
+        params = mock_request.call_args[0][1]
+        self.assertEqual((params['lat'], params['lon']), (55.76, 37.62))
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_saved_location_weather_is_reused(self, mock_request):
+        Location.objects.create(
+            user=self.user, city='Moscow', country='RU', latitude=55.7558, longitude=37.6173
+        )
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        result = service.get_weather_by_coordinates('55.7600', '37.6200')
+        self.assertEqual(result['city'], 'Moscow')
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(get_geo_index().get_stats()['reuse_ratio'], 1.0)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_async_coordinates_reuse_saved_location(self, mock_request):
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        moscow = service.resolve_city('Moscow')
+
+        def load_locations(index, max_age):
+            index.locations_loaded_at = time.monotonic()
+            index.add(moscow.lat, moscow.lon, make_key('weather', place_id=moscow.id))
+
+        with patch.object(GeoIndex, 'load_locations', autospec=True, side_effect=load_locations) as load:
+            result = asyncio.run(service.aget_weather_by_coordinates('55.7600', '37.6200'))
+            asyncio.run(service.aget_weather_by_coordinates('55.7600', '37.6200'))
+        self.assertEqual(result['city'], 'Moscow')
+        self.assertEqual(mock_request.call_count, 1)
+        # Локации перечитываются раз в WEATHER_GEO_LOCATIONS_MAX_AGE
+        load.assert_called_once_with(get_geo_index(), service.geo_locations_max_age)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_saved_location_coordinates_are_not_trusted(self, mock_request):
+        # Москва с координатами Парижа: точкой индекса остаются координаты из справочника
+        Location.objects.create(
+            user=self.user, city='Moscow', country='RU', latitude=48.857, longitude=2.353
+        )
+        service = WeatherService(cache=self.cache)
+        service.get_current_weather('Moscow')
+        service.get_weather_by_coordinates('48.857', '2.353')
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(get_geo_index().get_stats()['reused'], 0)
+
+    def test_by_coordinates_rejects_invalid_numbers(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/weather/by_coordinates/?lat=north&lon=37.6')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for query in ('lat=95&lon=37.6', 'lat=55.7&lon=-181', 'lat=nan&lon=37.6'):
+            response = client.get(f'/api/weather/by_coordinates/?{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('within', response.data['error'])
+
+    @patch('weather.services.WeatherService._request')
+    def test_by_coordinates_reports_missing_result(self, mock_request):
+        mock_request.side_effect = requests.HTTPError(response=Mock(status_code=404))
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/weather/by_coordinates/?lat=10&lon=-30')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Город не найден')
+
+
+class ForecastAggregationTests(WeatherServiceTestCase):
+    def payload(self):
+        payload = json.loads(json.dumps(FORECAST_PAYLOAD))
+        # Дни по UTC совпадают с dt_txt
+        payload['city']['timezone'] = 0
+        for i, item in enumerate(payload['list'][:8]):
+            item['weather'][0] = {
+                'description': 'дождь' if i % 4 == 0 else 'облачно',
+                'icon': '10d' if i % 4 == 0 else '03d',
+            }
+            item['rain'] = {'3h': 0.5}
+            item['pop'] = i / 10
+        return payload
+
+    def test_daily_aggregates(self):
+        result = WeatherService()._format_forecast(self.payload())
+        self.assertEqual([day['date'] for day in result['forecasts']], ['2025-06-15', '2025-06-16'])
+        day = result['forecasts'][0]
+        self.assertEqual(day['avg_temperature'], 18)
+        self.assertEqual((day['min_temperature'], day['max_temperature']), (15, 22))
+        self.assertEqual(day['avg_wind_speed'], 3.0)
+        self.assertEqual(day['precipitation'], 4.0)
+        self.assertEqual(day['precipitation_probability'], 0.7)
+        self.assertEqual((day['description'], day['icon']), ('облачно', '03d'))
+        self.assertEqual(result['forecasts'][1]['precipitation'], 0)
+
+    def test_mode_prefers_first_on_tie(self):
+        payload = self.payload()
+        for i, item in enumerate(payload['list'][:8]):
+            item['weather'][0]['description'] = ('ясно', 'дождь')[i % 2]
+        self.assertEqual(WeatherService()._format_forecast(payload)['forecasts'][0]['description'], 'ясно')
+
+    def test_configurable_aggregates(self):
+        aggregator = ForecastAggregator([
+            Aggregate('max_clouds', 'clouds', 'max'),
+            Aggregate('first_icon', 'icon', 'first'),
+        ])
+        day = aggregator.aggregate(self.payload())['forecasts'][0]
+        self.assertEqual(len(day.pop('slots')), 8)
+        self.assertEqual(day, {
+            'date': '2025-06-15', 'city': 'Moscow', 'country': 'RU',
+            'max_clouds': 20, 'first_icon': '10d',
+        })
+        with self.assertRaises(ValueError):
+            ForecastAggregator([Aggregate('median', 'clouds', 'median')])
+
+    def test_days_follow_city_timezone(self):
+        result = WeatherService()._format_forecast(FORECAST_PAYLOAD)
+        days = result['forecasts']
+        # UTC+3: слот 21:00 UTC 15 июня уже относится к 16 июня
+        self.assertEqual([day['date'] for day in days], ['2025-06-15', '2025-06-16', '2025-06-17'])
+        self.assertEqual([len(day['slots']) for day in days], [7, 8, 1])
+        self.assertEqual(days[1]['slots'][0]['time'], '00:00')
+
+    def test_first_slots_come_from_one_parse(self):
+        daily = WeatherService().process_forecast_data(FORECAST_PAYLOAD)
+        self.assertEqual(
+            [day['date'] for day in daily],
+            [date(2025, 6, 15), date(2025, 6, 16), date(2025, 6, 17)],
+        )
+        self.assertEqual(daily[1]['temperature'], 22)
+        self.assertEqual(get_forecast_aggregator().get_stats()['parses'], 1)
+
+    def test_first_slots_keep_api_values(self):
+        payload = self.payload()
+        payload['list'][0]['main']['temp'] = 15.6
+        day = WeatherService().process_forecast_data(payload)[0]
+        self.assertEqual(day['date'], date(2025, 6, 15))
+        self.assertEqual(day['temperature'], 15.6)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WeatherResultTests(WeatherServiceTestCase):
+    def test_current_weather_reads_like_dict(self):
+        current = WeatherService()._format_current_weather(CURRENT_PAYLOAD)
+        self.assertIsInstance(current, CurrentWeather)
+        self.assertEqual(current['city'], current.city)
+        self.assertEqual(current.get('missing', 'x'), 'x')
+        self.assertEqual({**current}['coordinates']['lat'], 55.7558)
+        with self.assertRaises(KeyError):
+            current['missing']
+
+    def test_pickle_stores_values_only(self):
+        current = WeatherService()._format_current_weather(CURRENT_PAYLOAD)
+        data = pickle.dumps(current, protocol=pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(pickle.loads(data), current)
+        self.assertNotIn(b'wind_direction', data)
+        self.assertLess(len(data), len(pickle.dumps(current.to_dict(), protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def test_dumps_matches_plain_dicts(self):
+        forecast = WeatherService()._format_forecast(FORECAST_PAYLOAD)
+        expected = forecast.to_dict()
+        self.assertEqual(json.loads(results.dumps(forecast)), expected)
+        with patch('weather.results.orjson', None):
+            self.assertEqual(json.loads(results.dumps(forecast)), expected)
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_api_renders_result(self, mock_request):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='r', password='testpass123'))
+        response = client.get('/api/weather/by_coordinates/?lat=55.7558&lon=37.6173')
+        self.assertEqual(response.json()['coordinates'], {'lat': 55.7558, 'lon': 37.6173})
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class FastJSONRendererTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='json', password='testpass123'))
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_cache_hit_serves_pre_encoded_bytes(self, mock_request):
+        first = self.client.get('/api/weather/search/?q=Moscow')
+        with patch('weather.results.dumps') as mock_dumps:
+            second = self.client.get('/api/weather/search/?q=Moscow')
+        mock_dumps.assert_not_called()
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.json()['city'], 'Moscow')
+
+    @patch('weather.services.WeatherService._request', return_value=FORECAST_PAYLOAD)
+    def test_stdlib_fallback_renders_same_json(self, mock_request):
+        fast = self.client.get('/api/weather/forecast/?city=Moscow').json()
+        get_weather_cache().clear()
+        with patch('weather.results.orjson', None):
+            fallback = self.client.get('/api/weather/forecast/?city=Moscow').json()
+        self.assertEqual(fast, fallback)
+
+    def test_renders_plain_data_and_indent(self):
+        renderer = FastJSONRenderer()
+        data = {
+            'value': Decimal('1.5'),
+            'items': [WeatherService()._format_current_weather(CURRENT_PAYLOAD)],
+        }
+        rendered = json.loads(renderer.render(data))
+        self.assertEqual(rendered['value'], 1.5)
+        self.assertEqual(rendered['items'][0]['coordinates']['lon'], 37.6173)
+        indented = renderer.render(data, 'application/json; indent=2')
+        self.assertIn(b'\n  ', indented)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class ConditionalRequestTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='etag', password='testpass123'))
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_current_has_etag_and_max_age(self, mock_request):
+        response = self.client.get('/api/weather/current/?city=Moscow')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertEqual(response['Cache-Control'], f'public, max-age={WeatherService().current_ttl}')
+
+        with patch.object(FastJSONRenderer, 'render', return_value=b'') as mock_render:
+            cached = self.client.get('/api/weather/current/?city=Moscow', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        # Данные не рендерятся, только пустое тело
+        self.assertIsNone(mock_render.call_args[0][0])
+
+    @patch('weather.services.WeatherService._request')
+    def test_new_observation_changes_etag(self, mock_request):
+        mock_request.return_value = CURRENT_PAYLOAD
+        first = self.client.get('/api/weather/current/?city=Moscow')['ETag']
+        get_weather_cache().clear()
+        mock_request.return_value = {**CURRENT_PAYLOAD, 'dt': CURRENT_PAYLOAD['dt'] + 600}
+        response = self.client.get('/api/weather/current/?city=Moscow', HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first)
+
+    @patch('weather.services.WeatherService._request', return_value=FORECAST_PAYLOAD)
+    def test_forecast_conditional_request(self, mock_request):
+        response = self.client.get('/api/weather/forecast/?city=Moscow')
+        self.assertEqual(response['Cache-Control'], f'public, max-age={WeatherService().forecast_ttl}')
+        cached = self.client.get('/api/weather/forecast/?city=Moscow', HTTP_IF_NONE_MATCH=f'"other", {response["ETag"]}')
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached.content, b'')
+
+    def test_forecast_etag_covers_every_slot(self):
+        service = WeatherService()
+        first = service._format_forecast(FORECAST_PAYLOAD)
+        revised = json.loads(json.dumps(FORECAST_PAYLOAD))
+        revised['list'][-1]['main']['temp'] += 5
+        self.assertNotEqual(
+            weather_etag('forecast', first), weather_etag('forecast', service._format_forecast(revised))
+        )
+
+    def test_stale_data_is_not_cacheable(self):
+        fresh = WeatherService()._format_current_weather(CURRENT_PAYLOAD)
+        stale = {**fresh, 'stale': True}
+        self.assertNotEqual(weather_etag('weather', fresh), weather_etag('weather', stale))
+        request = Mock(headers={})
+        self.assertEqual(conditional_response(request, 'weather', stale, 600)['Cache-Control'], 'no-cache')
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class LiveWeatherTests(WeatherServiceTestCase):
+    def test_one_fetcher_per_city_fans_out(self):
+        service = WeatherService()
+        calls = []
+
+        async def fake_current(city, refresh=False):
+            calls.append(city)
+            return {**CURRENT_PAYLOAD, 'city': city}
+
+        async def scenario():
+            with patch.object(service, 'aget_current_weather', side_effect=fake_current):
+                hub = LiveWeatherHub(interval=60, service=service)
+                queues = [asyncio.Queue() for _ in range(50)]
+                for i, queue in enumerate(queues):
+                    hub.subscribe(('Moscow', ' moscow', 'London')[i % 3], queue)
+                messages = [await asyncio.wait_for(queue.get(), 1) for queue in queues]
+                stats = hub.get_stats()
+                for i, queue in enumerate(queues):
+                    hub.unsubscribe(('Moscow', ' moscow', 'London')[i % 3], queue)
+                await asyncio.sleep(0)
+                return messages, stats, hub.get_stats()
+
+        messages, stats, after = asyncio.run(scenario())
+        self.assertEqual(sorted(calls), ['London', 'Moscow'])
+        self.assertTrue(all(event == 'weather' for event, _ in messages))
+        self.assertEqual((stats['cities'], stats['subscribers'], stats['messages']), (2, 50, 50))
+        self.assertEqual((after['cities'], after['subscribers']), (0, 0))
+
+    def test_unknown_city_sends_error_event(self):
+        service = WeatherService()
+
+        async def scenario():
+            with patch.object(service, 'aget_current_weather', side_effect=CityNotFoundError('Город не найден')):
+                hub = LiveWeatherHub(service=service)
+                queue = asyncio.Queue()
+                hub.subscribe('Nowhere', queue)
+                return await asyncio.wait_for(queue.get(), 1)
+
+        event, data = asyncio.run(scenario())
+        self.assertEqual(event, 'weather-error')
+
+    def test_sse_endpoint_streams_events(self):
+        user = User(username='live')
+
+        def request(path):
+            request = AsyncRequestFactory().get(path)
+            request.auser = AsyncMock(return_value=user)
+            return request
+
+        async def scenario():
+            with patch('weather.services.WeatherService.aget_current_weather', return_value=CURRENT_PAYLOAD):
+                response = await live_weather(request('/api/weather/live/?city=Moscow'))
+                stream = aiter(response.streaming_content)
+                chunks = [await anext(stream), await anext(stream)]
+                await stream.aclose()
+            bad = await live_weather(request('/api/weather/live/'))
+            return response, chunks, bad
+
+        response, chunks, bad = asyncio.run(scenario())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(chunks[0], b'retry: 5000\n\n')
+        self.assertTrue(chunks[1].startswith(b'event: weather\ndata: {'))
+        self.assertEqual(bad.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(WEATHER_LIVE_MAX_STREAMS=1)
+    def test_sse_requires_asgi_and_caps_streams(self):
+        user = User(username='live')
+
+        def request(factory):
+            request = factory().get('/api/weather/live/?city=Moscow')
+            request.auser = AsyncMock(return_value=user)
+            return request
+
+        async def scenario():
+            wsgi = await live_weather(request(RequestFactory))
+            with patch('weather.services.WeatherService.aget_current_weather', return_value=CURRENT_PAYLOAD):
+                first = await live_weather(request(AsyncRequestFactory))
+                chunks = asyncio.Queue()
+
+                async def consume():
+                    async for chunk in first.streaming_content:
+                        chunks.put_nowait(chunk)
+
+                reader = asyncio.create_task(consume())
+                await asyncio.wait_for(chunks.get(), 1)
+                second = await live_weather(request(AsyncRequestFactory))
+                # Отключение клиента: обработчик ASGI отменяет задачу ответа
+                reader.cancel()
+                await asyncio.gather(reader, return_exceptions=True)
+                third = await live_weather(request(AsyncRequestFactory))
+            return wsgi, second, third
+
+        wsgi, second, third = asyncio.run(scenario())
+        self.assertEqual(wsgi.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertEqual(second.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('Retry-After', second)
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class InstrumentationTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+        session = Mock()
+        session.get.return_value.status_code = 200
+        session.get.return_value.json.return_value = CURRENT_PAYLOAD
+        for target, value in (
+            ('weather.instrumentation._registry', self.registry),
+            ('weather.services.get_http_session', Mock(return_value=session)),
+        ):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='metrics', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_reports_upstream_and_cache(self):
+        first = self.client.get('/api/weather/current/?city=Moscow')['Server-Timing']
+        second = self.client.get('/api/weather/current/?city=Moscow')['Server-Timing']
+        self.assertIn('upstream;dur=', first)
+        self.assertIn('cache;desc="miss=1"', first)
+        self.assertNotIn('upstream', second)
+        self.assertIn('cache;desc="hit=1"', second)
+
+    def test_server_timing_counts_db_queries(self):
+        Location.objects.create(user=self.user, city='Moscow', country='RU', latitude=55.75, longitude=37.62)
+        response = self.client.get('/api/locations/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    @override_settings(WEATHER_METRICS_TOKEN='secret')
+    def test_prometheus_endpoint(self):
+        self.client.get('/api/weather/current/?city=Moscow')
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('weather_upstream_requests_total{endpoint="weather",outcome="ok"} 1', body)
+        self.assertIn('weather_upstream_duration_seconds_count{endpoint="weather"} 1', body)
+        self.assertIn('weather_cache_lookups_total{result="miss"} 1', body)
+        self.assertIn('weather_http_requests_total{view="weather-current",method="GET",status="2xx"} 1', body)
+        self.assertIn('# TYPE weather_cache_misses gauge', body)
+
+    @override_settings(WEATHER_INSTRUMENTATION=False)
+    def test_disabled_instrumentation(self):
+        response = APIClient().get('/api/weather/current/?city=Moscow')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.registry.render(), '\n')
+
+    def test_db_connect_metrics(self):
+        observe_db_connect(False, 0.02)
+        observe_db_connect(True, 0.001)
+        body = self.registry.render()
+        self.assertIn('weather_db_connections_total{mode="direct"} 1', body)
+        self.assertIn('weather_db_connections_total{mode="pool"} 1', body)
+        self.assertIn('weather_db_connect_seconds_count{mode="direct"} 1', body)
+
+        timings = RequestTimings()
+        self.assertNotIn('dbconn', timings.server_timing(0.1))
+        timings.add_db_connect(0.0125)
+        self.assertIn('dbconn;dur=12.5', timings.server_timing(0.1))
+
+    def test_db_pool_stats_empty_without_pool(self):
+        self.assertEqual(collect_metrics()['db_pool'], {})
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            registry.observe('weather_upstream_duration_seconds', value, (('endpoint', 'weather'),))
+        body = registry.render()
+        self.assertIn('weather_upstream_duration_seconds_bucket{endpoint="weather",le="0.1"} 1', body)
+        self.assertIn('weather_upstream_duration_seconds_bucket{endpoint="weather",le="1.0"} 2', body)
+        self.assertIn('weather_upstream_duration_seconds_bucket{endpoint="weather",le="+Inf"} 3', body)
+        self.assertIn('# TYPE weather_upstream_duration_seconds histogram', body)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class DefaultLocationTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='default', password='testpass123')
+        self.moscow = Location.objects.create(
+            user=self.user, city='Moscow', country='RU', latitude=55.75, longitude=37.62, is_default=True
+        )
+        self.paris = Location.objects.create(
+            user=self.user, city='Paris', country='FR', latitude=48.86, longitude=2.35
+        )
+
+    def test_one_default_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Location.objects.filter(pk=self.paris.pk).update(is_default=True)
+        # У другого пользователя своя локация по умолчанию
+        other = User.objects.create_user(username='other', password='testpass123')
+        Location.objects.create(user=other, city='Paris', country='FR', latitude=0, longitude=0, is_default=True)
+
+    def test_set_default_switches_and_invalidates_cache(self):
+        self.assertEqual(get_default_location(self.user), self.moscow)
+        Location.objects.set_default(self.paris)
+        self.assertEqual(get_default_location(self.user), self.paris)
+        self.assertEqual(
+            list(Location.objects.filter(user=self.user, is_default=True).values_list('city', flat=True)),
+            ['Paris'],
+        )
+
+    def test_warm_default_location_does_not_query(self):
+        get_default_location(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_default_location(self.user), self.moscow)
+        self.moscow.delete()
+        self.assertIsNone(get_default_location(self.user))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_default_location(self.user))
+
+    @patch('weather.services.WeatherService._request', return_value=FORECAST_PAYLOAD)
+    def test_forecast_page_skips_location_query_when_warm(self, mock_request):
+        self.client.force_login(self.user)
+        self.client.get('/forecast/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/forecast/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in queries.captured_queries if 'weather_location' in q['sql']])
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_create_default_location_replaces_previous(self, mock_request):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.post('/api/locations/', {
+            'city': 'London', 'country': 'GB', 'latitude': 51.5, 'longitude': -0.12, 'is_default': True,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['is_default'])
+        self.assertEqual(get_default_location(self.user).city, 'London')
+
+        response = client.post(f'/api/locations/{self.paris.pk}/set_default/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_default_location(self.user).city, 'Paris')
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache', WEATHER_USER_CACHE_TTL=60)
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class CachedAuthTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='cached', password='testpass123')
+        Location.objects.create(
+            user=self.user, city='Moscow', country='RU', latitude=55.75, longitude=37.62, is_default=True
+        )
+        self.client.login(username='cached', password='testpass123')
+
+    def warm_queries(self, path):
+        self.client.get(path)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [q['sql'] for q in queries.captured_queries]
+
+    @patch('weather.services.WeatherService._request', return_value=FORECAST_PAYLOAD)
+    def test_warm_requests_identify_user_without_queries(self, mock_request):
+        self.assertEqual(self.warm_queries('/forecast/'), [])
+        queries = self.warm_queries('/api/locations/')
+        self.assertTrue(queries)
+        self.assertFalse([sql for sql in queries if 'auth_user' in sql or 'django_session' in sql])
+
+    def test_async_lookup_uses_cache(self):
+        backend = CachedModelBackend()
+        self.assertEqual(backend.get_user(self.user.pk), self.user)
+        self.assertEqual(asyncio.run(backend.aget_user(self.user.pk)), self.user)
+
+    def test_sessions_of_model_backend_stay_valid(self):
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get('/api/locations/').status_code, status.HTTP_200_OK)
+
+    def test_failed_login_checks_password_once(self):
+        with patch.object(User, 'check_password', autospec=True, return_value=False) as check:
+            self.assertFalse(self.client.login(username='cached', password='wrong'))
+        self.assertEqual(check.call_count, 1)
+
+    def test_password_change_invalidates_session(self):
+        self.warm_queries('/api/locations/')
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/locations/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_logout_drops_cached_user(self):
+        self.warm_queries('/api/locations/')
+        self.assertIsNotNone(cache.get(f'weather:user:{self.user.pk}'))
+        self.client.post('/logout/')
+        self.assertIsNone(cache.get(f'weather:user:{self.user.pk}'))
+        self.assertEqual(self.client.get('/api/locations/').status_code, status.HTTP_403_FORBIDDEN)
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class GazetteerTests(WeatherServiceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gazetteer = get_gazetteer()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='traveller', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_normalize_and_validate_names(self):
+        self.assertEqual(normalize_name('  Saint-Petersburg '), 'saint petersburg')
+        self.assertEqual(normalize_name('Орёл'), normalize_name('Орел'))
+        for name in ('New York', 'Saint-Petersburg', "Xi'an", 'St. Petersburg', 'Ростов-на-Дону', 'Paris, US'):
+            self.assertTrue(is_city_name(name), name)
+        for name in ('', 'Moscow1', '--', 'Paris!', 'Paris, USA'):
+            self.assertFalse(is_city_name(name), name)
+
+    def test_resolve_aliases_to_canonical_place(self):
+        for query in ('Москва', 'moscow', 'MOSKVA'):
+            self.assertEqual(self.gazetteer.resolve(query).id, 'RU-moscow')
+        for query in ('Питер', 'СПб', 'saint petersburg'):
+            self.assertEqual(self.gazetteer.resolve(query).id, 'RU-saint-petersburg')
+        self.assertEqual(self.gazetteer.resolve('St. Petersburg, US').id, 'US-saint-petersburg')
+        self.assertEqual(self.gazetteer.resolve('Paris').id, 'FR-paris')
+        self.assertIsNone(self.gazetteer.resolve('Atlantis'))
+        self.assertEqual(self.gazetteer.get('RU-moscow').name, 'Moscow')
+        self.assertIsNone(self.gazetteer.get('RU-atlantis'))
+
+    def test_search_by_prefix_and_typos(self):
+        self.assertEqual([place.id for place in self.gazetteer.search('мос')], ['RU-moscow', 'US-moscow'])
+        self.assertEqual(self.gazetteer.search('new y')[0].id, 'US-new-york')
+        self.assertEqual(self.gazetteer.suggest('Novosibrsk')[0].id, 'RU-novosibirsk')
+        self.assertEqual(self.gazetteer.search(''), [])
+
+    def test_names_index_matches_cities(self):
+        with open(f'{self.gazetteer.path}/cities.tsv', encoding='utf-8') as f:
+            rows = [line.rstrip('\n').split('\t') for line in f]
+        with open(f'{self.gazetteer.path}/city_names.tsv', 'rb') as f:
+            self.assertEqual(f.readlines(), build_names_index(rows))
+        self.assertEqual([row[0] for row in rows], sorted(row[0] for row in rows))
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_aliases_share_cache_entry_and_query_by_coordinates(self, mock_request):
+        service = WeatherService(cache=WeatherCache())
+        self.assertEqual(service.get_current_weather('Питер')['city'], 'Saint Petersburg')
+        service.get_current_weather('Saint-Petersburg')
+        self.assertEqual(mock_request.call_count, 1)
+        endpoint, params = mock_request.call_args.args
+        self.assertNotIn('q', params)
+        self.assertEqual((params['lat'], params['lon']), (59.9386, 30.3141))
+
+    @patch('weather.services.WeatherService._request', return_value=CURRENT_PAYLOAD)
+    def test_known_city_location_created_without_upstream(self, mock_request):
+        response = self.client.post('/api/locations/', {
+            'city': 'New York', 'country': 'US', 'latitude': 40.71, 'longitude': -74.0,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_request.assert_not_called()
+
+    @override_settings(WEATHER_GAZETTEER_STRICT=True)
+    def test_strict_mode_rejects_unknown_city(self):
+        response = self.client.post('/api/locations/', {
+            'city': 'Atlantis', 'country': 'XX', 'latitude': 0, 'longitude': 0,
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cities/autocomplete/', {'q': 'Моск', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()['results'],
+            [{'id': 'RU-moscow', 'name': 'Moscow', 'local_name': 'Москва', 'country': 'RU',
+              'lat': 55.7558, 'lon': 37.6173}],
+        )
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class WarmUpTests(WeatherServiceTestCase):
+    def test_warm_up_does_not_touch_database(self):
+        # Выполняется в главном процессе gunicorn до fork воркеров
+        with self.assertNumQueries(0):
+            warm_up()
+
+
+@patch.dict('os.environ', {'OPENWEATHERMAP_API_KEY': 'test-key'})
+class FragmentCacheTests(WeatherServiceTestCase):
+    def render_current(self, dt, temp):
+        current = WeatherService()._format_current_weather(
+            {**CURRENT_PAYLOAD, 'dt': dt, 'main': {**CURRENT_PAYLOAD['main'], 'temp': temp}}
+        )
+        return render_to_string(
+            'weather/fragments/current.html', {'current_weather': current, 'fragment_ttl': _fragment_ttl()}
+        )
+
+    def test_fragment_keyed_by_observation_time(self):
+        self.assertIn('20°C', self.render_current(1750000000, 20.2))
+        # То же наблюдение - готовый фрагмент, новое - рендер заново
+        self.assertIn('20°C', self.render_current(1750000000, 25.0))
+        self.assertIn('25°C', self.render_current(1750000600, 25.0))
+
+    @override_settings(WEATHER_FRAGMENT_CACHE_TTL=0)
+    def test_zero_ttl_disables_cache(self):
+        self.render_current(1750000000, 20.2)
+        self.assertIn('25°C', self.render_current(1750000000, 25.0))
+
+    @patch('weather.services.WeatherService._request', return_value=FORECAST_PAYLOAD)
+    def test_forecast_fragment_shared_between_users(self, mock_request):
+        pages = []
+        for username in ('alice', 'bob'):
+            user = User.objects.create_user(username=username, password='testpass123')
+            Location.objects.create(
+                user=user, city='Moscow', country='RU', latitude=55.75, longitude=37.62, is_default=True
+            )
+            self.client.force_login(user)
+            pages.append(self.client.get('/forecast/').content.decode())
+        self.assertIn('alice', pages[0])
+        self.assertIn('bob', pages[1])
+        self.assertIn('Прогноз погоды в Moscow, RU', pages[1])
+        self.assertIn('2025-06-16', pages[1])
+        key = make_template_fragment_key('weather-forecast', ['Moscow', 'RU', FORECAST_PAYLOAD['list'][0]['dt']])
+        self.assertIsNotNone(cache.get(key))
+
+
+class StaticFilesTests(TestCase):
+    def test_pages_render_without_manifest(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            response = self.client.get('/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'href="/static/css/app.css"')
+
+    @override_settings(STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'])
+    def test_collectstatic_hashes_and_precompresses(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('css/app.css')
+            self.assertRegex(url, r'^/static/css/app\.[0-9a-f]{12}\.css$')
+            path = os.path.join(root, url[len('/static/'):])
+            self.assertTrue(os.path.exists(path + '.gz'))
+            self.assertTrue(os.path.exists(path + '.br'))
+
+            response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+            response.close()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Encoding'], 'br')
+            self.assertIn('immutable', response['Cache-Control'])
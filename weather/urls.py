@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LocationViewSet, WeatherViewSet
+from .views import CityViewSet, LocationViewSet, WeatherViewSet
 
 router = DefaultRouter()
 router.register(r'locations', LocationViewSet, basename='location')
 router.register(r'weather', WeatherViewSet, basename='weather')
+router.register(r'cities', CityViewSet, basename='city')
 
 urlpatterns = [
     path('', include(router.urls)),
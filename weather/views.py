@@ -1,12 +1,40 @@
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.throttling import ScopedRateThrottle
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags, quote_etag
+from .gazetteer import get_gazetteer, is_city_name
+from .instrumentation import flatten_gauges, get_registry
+from .live import get_live_hub
+from .locations import aget_default_location, get_default_location
+from .metrics import collect_metrics
 from .models import Location, WeatherData
-from .serializers import LocationSerializer, WeatherDataSerializer
-from .services import WeatherService
+from .pagination import WeatherHistoryPagination
+from .renderers import FastJSONRenderer
+from .serializers import (
+    BatchRequestSerializer,
+    LocationSerializer,
+    WeatherDataSerializer,
+    WeatherObservationSerializer,
+)
+from .results import Result, dumps as dumps_json
+from .services import (
+    CityNotFoundError,
+    UpstreamRequestError,
+    UpstreamUnavailableError,
+    WeatherService,
+)
 from .forms import CustomUserCreationForm
 import requests
 from django.conf import settings
@@ -20,6 +48,52 @@ from drf_yasg import openapi
 # Create your views here.
 
 
+def weather_etag(endpoint: str, data) -> str:
+    """Сильный ETag по содержимому ответа.
+
+    Результат из кэша уже закодирован в JSON (Result.encoded), хэшируется он;
+    остальные данные (например, устаревшие с полем stale) кодируются здесь.
+    """
+    encoded = data.encoded if isinstance(data, Result) else None
+    if encoded is None:
+        encoded = dumps_json(data)
+    digest = hashlib.blake2b(endpoint.encode(), digest_size=12)
+    digest.update(encoded)
+    return quote_etag(digest.hexdigest())
+
+
+def conditional_response(request, endpoint: str, data, max_age: int) -> Response:
+    """Ответ с ETag и Cache-Control; 304 без тела, если у клиента та же версия"""
+    etag = weather_etag(endpoint, data)
+    # Устаревшие данные (API недоступен) клиенту кэшировать не нужно
+    cache_control = "no-cache" if data.get("stale") else f"public, max-age={max_age}"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    matches = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in matches or "*" in matches:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+def weather_error_response(error: Exception) -> Response:
+    """Ответ на ошибку WeatherService.
+
+    503 с Retry-After, если API недоступно и устаревших данных нет; 400 для
+    неизвестного города и отклонённого API запроса.
+    """
+    if isinstance(error, UpstreamUnavailableError):
+        return Response(
+            {"error": str(error)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(error.retry_after)},
+        )
+    if isinstance(error, (CityNotFoundError, UpstreamRequestError)):
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(
+        {"error": "Город не найден или ошибка API"},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+
 class LocationViewSet(viewsets.ModelViewSet):
     serializer_class = LocationSerializer
     permission_classes = [IsAuthenticated]
@@ -30,24 +104,49 @@ class LocationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         city = serializer.validated_data.get("city")
         weather_service = WeatherService()
-        try:
-            weather_service.validate_city_name(city)
-        except ValueError as e:
-            raise serializers.ValidationError({"city": str(e)})
-        serializer.save(user=self.request.user)
+        # Город из справочника проверяется без обращения к API
+        if weather_service.resolve_city(city) is None:
+            if getattr(settings, "WEATHER_GAZETTEER_STRICT", False):
+                raise serializers.ValidationError({"city": "Город не найден"})
+            try:
+                weather_service.validate_city_name(city)
+            except ValueError as e:
+                raise serializers.ValidationError({"city": str(e)})
+        self._save_location(serializer, user=self.request.user)
+
+    def perform_update(self, serializer):
+        self._save_location(serializer)
+
+    def _save_location(self, serializer, **kwargs):
+        # Новая локация по умолчанию сменяет прежнюю, а не нарушает ограничение
+        if serializer.validated_data.get("is_default"):
+            del serializer.validated_data["is_default"]
+            Location.objects.set_default(serializer.save(**kwargs))
+        else:
+            serializer.save(**kwargs)
 
     @action(detail=True, methods=["post"])
     def set_default(self, request, pk=None):
-        location = self.get_object()
-        Location.objects.filter(user=request.user).update(is_default=False)
-        location.is_default = True
-        location.save()
+        Location.objects.set_default(self.get_object())
         return Response({"status": "default location set"})
 
+    @action(detail=True, methods=["get"])
+    def history(self, request, pk=None):
+        """История наблюдений погоды для локации (курсорная пагинация)"""
+        location = self.get_object()
+        paginator = WeatherHistoryPagination()
+        page = paginator.paginate_queryset(
+            WeatherData.objects.filter(location=location), request, view=self
+        )
+        serializer = WeatherObservationSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
 
 class WeatherViewSet(viewsets.ModelViewSet):
-    queryset = WeatherData.objects.all()
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    queryset = WeatherData.objects.select_related("location")
     serializer_class = WeatherDataSerializer
+    pagination_class = WeatherHistoryPagination
 
     @swagger_auto_schema(
         method="get",
@@ -68,12 +167,11 @@ class WeatherViewSet(viewsets.ModelViewSet):
         weather_service = WeatherService()
         try:
             weather_data = weather_service.get_current_weather(city)
-        except Exception:
-            return Response(
-                {"error": "Город не найден или ошибка API"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        return Response(weather_data)
+        except Exception as e:
+            return weather_error_response(e)
+        return conditional_response(
+            request, "weather", weather_data, weather_service.current_ttl
+        )
 
     @swagger_auto_schema(
         method="get",
@@ -91,23 +189,19 @@ class WeatherViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def search(self, request):
         city = request.query_params.get("q", "")
-        if not city.isalpha():
+        if not is_city_name(city):
             return Response(
-                {"error": "Название города должно содержать только буквы"},
+                {"error": "Название города должно состоять из букв"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         weather_service = WeatherService()
         try:
-            weather_service.validate_city_name(city)
             weather_data = weather_service.get_current_weather(city)
-            return Response(weather_data)
-        except ValueError as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception:
-            return Response(
-                {"error": "Город не найден или ошибка API"},
-                status=status.HTTP_400_BAD_REQUEST,
+            return conditional_response(
+                request, "weather", weather_data, weather_service.current_ttl
             )
+        except Exception as e:
+            return weather_error_response(e)
 
     @swagger_auto_schema(
         method="get",
@@ -124,20 +218,19 @@ class WeatherViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def forecast(self, request):
         city = request.query_params.get("city", "Moscow")
-        if not city.isalpha():
+        if not is_city_name(city):
             return Response(
-                {"error": "Название города должно содержать только буквы"},
+                {"error": "Название города должно состоять из букв"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         weather_service = WeatherService()
         try:
             forecast_data = weather_service.get_forecast(city)
-            return Response(forecast_data)
-        except Exception:
-            return Response(
-                {"error": "Город не найден или ошибка API"},
-                status=status.HTTP_400_BAD_REQUEST,
+            return conditional_response(
+                request, "forecast", forecast_data, weather_service.forecast_ttl
             )
+        except Exception as e:
+            return weather_error_response(e)
 
     @swagger_auto_schema(
         method="get",
@@ -168,28 +261,234 @@ class WeatherViewSet(viewsets.ModelViewSet):
                 {"error": "Latitude and longitude are required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        try:
+            lat, lon = float(lat), float(lon)
+        except ValueError:
+            return Response(
+                {"error": "Latitude and longitude must be numbers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Сравнения с nan ложны, так что nan и бесконечности тоже отклоняются
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return Response(
+                {"error": "Latitude must be within [-90, 90] and longitude within [-180, 180]"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         weather_service = WeatherService()
-        weather_data = weather_service.get_weather_by_coordinates(lat, lon)
-        return Response(weather_data)
+        try:
+            weather_data = weather_service.get_weather_by_coordinates(lat, lon)
+        except Exception as e:
+            return weather_error_response(e)
+        return conditional_response(
+            request, "weather", weather_data, weather_service.current_ttl
+        )
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAdminUser])
+    def metrics(self, request):
+        """Состояние кэша, квоты и размыкателя цепи OpenWeatherMap"""
+        return Response(collect_metrics())
+
+    @swagger_auto_schema(
+        method="post",
+        request_body=BatchRequestSerializer,
+        responses={200: "results: [{index, query, data | error}]"},
+    )
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """Погода для нескольких городов и/или координат одним запросом.
+
+        С stream=true результаты отдаются построчно в NDJSON по мере готовности.
+        """
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["items"]
+        weather_service = WeatherService()
+
+        if serializer.validated_data["stream"]:
+            # Под ASGI синхронный генератор буферизуется целиком
+            if isinstance(request._request, ASGIRequest):
+                lines = self._ndjson_lines(weather_service.aiter_batch(items))
+            else:
+                lines = (dumps_json(result) + b"\n" for result in weather_service.iter_batch(items))
+            return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        results = weather_service.iter_batch(items)
+        return Response(
+            {"results": sorted(results, key=lambda result: result["index"])}
+        )
+
+    @staticmethod
+    async def _ndjson_lines(results):
+        async for result in results:
+            yield dumps_json(result) + b"\n"
+
+
+class CityViewSet(viewsets.ViewSet):
+    """Справочник городов: подсказки без обращения к OpenWeatherMap"""
+
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "autocomplete"
+
+    @swagger_auto_schema(
+        method="get",
+        manual_parameters=[
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                description="Начало названия города на любом языке справочника",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Число подсказок (до 20)",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+        ],
+        responses={200: "results: [{id, name, local_name, country, lat, lon}]"},
+    )
+    @action(detail=False, methods=["get"])
+    def autocomplete(self, request):
+        """Города по началу названия или синонима, крупные первыми; с опечатками, если таких нет"""
+        gazetteer = get_gazetteer()
+        if gazetteer is None:
+            return Response(
+                {"error": "Справочник городов отключён"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 20)
+        except ValueError:
+            limit = 10
+        places = gazetteer.suggest(request.query_params.get("q", ""), limit)
+        return Response(
+            {"results": [place.as_dict() for place in places]},
+            headers={"Cache-Control": "public, max-age=86400"},
+        )
+
+
+def _fragment_ttl() -> int:
+    """Срок фрагментов погоды в кэше шаблонов ({% cache %}), сек; 0 - без кэша"""
+    return getattr(settings, "WEATHER_FRAGMENT_CACHE_TTL", 600)
 
 
 @login_required
-def home(request):
-    """Представление для главной страницы"""
+async def home(request):
+    """Представление для главной страницы.
+
+    Текущая погода и прогноз запрашиваются параллельно.
+    """
     context = {}
-    if request.user.is_authenticated:
-        try:
-            default_location = Location.objects.get(user=request.user, is_default=True)
-            weather_service = WeatherService()
-            weather_data = weather_service.get_current_weather(default_location.city)
-            forecast_data = weather_service.get_forecast(default_location.city)
-            context["current_weather"] = weather_data
-            context["forecast"] = forecast_data["forecasts"]
-        except Location.DoesNotExist:
+    user = await request.auser()
+    if user.is_authenticated:
+        default_location = await aget_default_location(user)
+        if default_location is None:
             context["error"] = "Сначала добавьте город в профиль"
-        except Exception as e:
-            context["error"] = "Город не найден или ошибка API"
-    return render(request, "weather/home.html", context)
+        else:
+            try:
+                weather_service = WeatherService()
+                weather_data, forecast_data = await weather_service.aget_current_and_forecast(
+                    default_location.city
+                )
+                context["current_weather"] = weather_data
+                context["forecast"] = forecast_data["forecasts"]
+            except (CityNotFoundError, UpstreamRequestError, UpstreamUnavailableError) as e:
+                context["error"] = str(e)
+            except Exception:
+                context["error"] = "Город не найден или ошибка API"
+    context["fragment_ttl"] = _fragment_ttl()
+    # Поток обновлений держит соединение открытым: под WSGI он занимал бы поток воркера
+    context["live_updates"] = isinstance(request, ASGIRequest)
+    # Контекст-процессоры обращаются к сессии и БД синхронно
+    return await sync_to_async(render)(request, "weather/home.html", context)
+
+
+def _sse_message(event: str, data) -> str:
+    encoded = data.encoded if isinstance(data, Result) and data.encoded is not None else dumps_json(data)
+    return f"event: {event}\ndata: {encoded.decode()}\n\n"
+
+
+async def live_weather(request):
+    """Поток обновлений текущей погоды (Server-Sent Events).
+
+    GET /api/weather/live/?city=Moscow&city=London. Требует ASGI-сервера:
+    соединение держится открытым, обновления приходят событием weather при
+    смене наблюдения, ошибка города - событием weather-error. Под WSGI -
+    501, сверх WEATHER_LIVE_MAX_STREAMS открытых потоков в процессе - 503.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "Поток обновлений доступен только под ASGI-сервером"},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Требуется авторизация"}, status=status.HTTP_403_FORBIDDEN)
+    cities = list(dict.fromkeys(city.strip() for city in request.GET.getlist("city") if city.strip()))
+    max_cities = getattr(settings, "WEATHER_LIVE_MAX_CITIES", 10)
+    if not cities or len(cities) > max_cities:
+        return JsonResponse(
+            {"error": f"Укажите от 1 до {max_cities} городов в параметре city"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    hub = get_live_hub()
+    if hub.streams >= getattr(settings, "WEATHER_LIVE_MAX_STREAMS", 1000):
+        response = JsonResponse(
+            {"error": "Слишком много открытых потоков обновлений"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+        response["Retry-After"] = str(getattr(settings, "WEATHER_LIVE_INTERVAL", 60))
+        return response
+
+    heartbeat = getattr(settings, "WEATHER_LIVE_HEARTBEAT", 15)
+
+    async def events():
+        queue = asyncio.Queue()
+        hub.streams += 1
+        for city in cities:
+            hub.subscribe(city, queue)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    # Не wait_for: в Python 3.11 он теряет отмену (отключение клиента),
+                    # если очередь выдала сообщение в тот же момент
+                    async with asyncio.timeout(heartbeat):
+                        event, data = await queue.get()
+                except TimeoutError:
+                    # Комментарий не даёт прокси закрыть простаивающее соединение
+                    yield ": ping\n\n"
+                    continue
+                yield _sse_message(event, data)
+        finally:
+            hub.streams -= 1
+            for city in cities:
+                hub.unsubscribe(city, queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def prometheus_metrics(request):
+    """Метрики процесса в формате Prometheus.
+
+    Доступны администраторам и по заголовку Authorization: Bearer с
+    WEATHER_METRICS_TOKEN (для сборщика метрик).
+    """
+    token = getattr(settings, "WEATHER_METRICS_TOKEN", "")
+    authorized = request.user.is_staff or (
+        token
+        and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+    )
+    if not authorized:
+        return HttpResponse(status=403)
+    body = get_registry().render(flatten_gauges(collect_metrics()))
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @login_required
@@ -197,14 +496,12 @@ def forecast_view(request):
     """Представление для страницы прогноза погоды"""
     context = {}
     if request.user.is_authenticated:
-        try:
-            default_location = Location.objects.get(user=request.user, is_default=True)
+        default_location = get_default_location(request.user)
+        if default_location is not None:
             weather_service = WeatherService()
             forecast_data = weather_service.get_forecast(default_location.city)
             context["forecast"] = forecast_data["forecasts"]
-        except Location.DoesNotExist:
-            pass
-
+    context["fragment_ttl"] = _fragment_ttl()
     return render(request, "weather/forecast.html", context)
 
 
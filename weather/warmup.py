@@ -0,0 +1,30 @@
+import logging
+import time
+
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> None:
+    """Загрузка модулей и общих объектов до старта воркеров.
+
+    Вызывается в главном процессе gunicorn при preload_app: воркеры
+    получают после fork уже импортированные представления, маршруты,
+    справочник городов и настроенный WeatherService, а не собирают их на
+    первом запросе. HTTP-сессия и пул потоков пересоздаются в воркере (они
+    привязаны к pid), к базе данных здесь не обращаемся: соединение,
+    открытое до fork, досталось бы всем воркерам сразу.
+    """
+    from .gazetteer import get_gazetteer
+    from .services import WeatherService
+
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    get_gazetteer()
+    try:
+        WeatherService()
+    except ValueError:
+        # Без ключа API сервис создать нельзя; воркеры сообщат об этом на запросе
+        logger.warning("OPENWEATHERMAP_API_KEY не задан, WeatherService не прогрет")
+    logger.info("Приложение прогрето за %.0f мс", (time.perf_counter() - start) * 1000)
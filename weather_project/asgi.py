@@ -11,6 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from weather.http import with_async_client
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
 
-application = get_asgi_application()
+application = with_async_client(get_asgi_application())
@@ -49,7 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'weather.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Статика из STATIC_ROOT: сжатые заранее .gz/.br и кэширование на год для файлов с хэшем
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,16 +86,43 @@ WSGI_APPLICATION = 'weather_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Пул соединений psycopg 3 (pip install "psycopg[binary,pool]") - в каждом процессе-воркере
+POSTGRES_POOL = os.getenv('POSTGRES_POOL', 'False') == 'True'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Бэкенд PostgreSQL Django с метриками времени получения соединения
+        'ENGINE': 'weather.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'weather_db'),
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.getenv('POSTGRES_HOST', 'db'),
         'PORT': os.getenv('POSTGRES_PORT', '5432'),
+        # Сколько держать соединение открытым между запросами, сек. Под ASGI каждый
+        # запрос выполняется в новом потоке и постоянные соединения копятся, поэтому
+        # по умолчанию они включены только для gthread; для uvicorn - пул
+        'CONN_MAX_AGE': 0 if POSTGRES_POOL else int(os.getenv(
+            'POSTGRES_CONN_MAX_AGE',
+            '60' if os.getenv('WEB_WORKER_CLASS', 'uvicorn') == 'gthread' else '0',
+        )),
+        # Проверка постоянного соединения перед первым запросом в новом HTTP-запросе
+        'CONN_HEALTH_CHECKS': os.getenv('POSTGRES_CONN_HEALTH_CHECKS', 'True') == 'True',
+        # PgBouncer в режиме transaction: серверные курсоры не переживают транзакцию
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('POSTGRES_PGBOUNCER', 'False') == 'True',
+        'OPTIONS': {},
     }
 }
+if POSTGRES_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', '1')),
+        # Всего соединений до WEB_CONCURRENCY * max_size; по умолчанию - по потоку воркера
+        # и потоку пула WEATHER_FETCH_WORKERS (пакетные запросы, запись наблюдений)
+        'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', str(
+            int(os.getenv('WEB_THREADS', '4')) + int(os.getenv('WEATHER_FETCH_WORKERS', '8'))
+        ))),
+        # Сколько ждать свободного соединения, сек, прежде чем вернуть ошибку
+        'timeout': float(os.getenv('POSTGRES_POOL_TIMEOUT', '10')),
+    }
 
 
 # Password validation
@@ -138,6 +168,20 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Без DEBUG collectstatic добавляет к именам хэш содержимого (staticfiles.json) и сжимает
+# файлы в gzip и brotli; без манифеста ссылки ведут на имена без хэша
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage'
+            if DEBUG else 'weather.storage.WeatherStaticFilesStorage'
+        ),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -153,7 +197,9 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',
-        'user': '10/minute'
+        'user': '10/minute',
+        # Подсказки городов запрашиваются на каждое нажатие клавиши и не обращаются к API
+        'autocomplete': os.getenv('WEATHER_AUTOCOMPLETE_RATE', '120/minute'),
     },
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.openapi.AutoSchema',
 }
@@ -162,11 +208,131 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 # OpenWeatherMap API settings
 OPENWEATHERMAP_API_KEY = os.getenv('OPENWEATHERMAP_API_KEY')
+OPENWEATHERMAP_BASE_URL = os.getenv('OPENWEATHERMAP_BASE_URL', 'http://api.openweathermap.org/data/2.5')
+# HTTP-клиент: размер пула соединений, число повторов на 5xx и таймауты (connect, read)
+OPENWEATHERMAP_POOL_SIZE = int(os.getenv('OPENWEATHERMAP_POOL_SIZE', '10'))
+OPENWEATHERMAP_RETRIES = int(os.getenv('OPENWEATHERMAP_RETRIES', '2'))
+OPENWEATHERMAP_BACKOFF = float(os.getenv('OPENWEATHERMAP_BACKOFF', '0.3'))
+# Асинхронный клиент под ASGI: 'httpx' (если установлен) или 'threads' - синхронные запросы
+# в пуле потоков; под WSGI всегда пул потоков
+OPENWEATHERMAP_ASYNC_CLIENT = os.getenv('OPENWEATHERMAP_ASYNC_CLIENT', 'httpx')
+# Размер пула потоков для параллельных запросов к API
+WEATHER_FETCH_WORKERS = int(os.getenv('WEATHER_FETCH_WORKERS', '8'))
+# Сколько элементов пакетного запроса /api/weather/batch/ запрашивать одновременно
+WEATHER_BATCH_CONCURRENCY = int(os.getenv('WEATHER_BATCH_CONCURRENCY', '8'))
+# Квота тарифа OpenWeatherMap; при общем кэше считается на все воркеры
+OPENWEATHERMAP_CALLS_PER_MINUTE = int(os.getenv('OPENWEATHERMAP_CALLS_PER_MINUTE', '60'))
+# Размыкатель цепи: ошибок подряд до размыкания и пауза до пробного запроса, сек
+WEATHER_BREAKER_FAILURE_THRESHOLD = int(os.getenv('WEATHER_BREAKER_FAILURE_THRESHOLD', '5'))
+WEATHER_BREAKER_RESET_TIMEOUT = float(os.getenv('WEATHER_BREAKER_RESET_TIMEOUT', '30'))
+OPENWEATHERMAP_TIMEOUTS = {
+    'default': (3.05, 10),
+    'weather': (3.05, 5),
+    'forecast': (3.05, 10),
+}
+
+# Кэш
+# При заданном REDIS_URL кэш Django общий для всех воркеров
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Кэш ответов OpenWeatherMap
+WEATHER_CACHE_CURRENT_TTL = int(os.getenv('WEATHER_CACHE_CURRENT_TTL', '600'))
+WEATHER_CACHE_FORECAST_TTL = int(os.getenv('WEATHER_CACHE_FORECAST_TTL', '1800'))
+# Сколько помнить, что город не найден (ответ 404)
+WEATHER_CACHE_NOT_FOUND_TTL = int(os.getenv('WEATHER_CACHE_NOT_FOUND_TTL', '300'))
+# Сколько ещё хранить данные после TTL, чтобы отдавать их при недоступном API
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', '3600'))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '1024'))
+# Поток обновлений погоды (SSE, только под ASGI): период опроса сервиса на город, сек,
+# интервал пинга открытого соединения, сек, максимум городов в одной подписке
+# и открытых потоков в процессе
+WEATHER_LIVE_INTERVAL = int(os.getenv('WEATHER_LIVE_INTERVAL', '60'))
+WEATHER_LIVE_HEARTBEAT = int(os.getenv('WEATHER_LIVE_HEARTBEAT', '15'))
+WEATHER_LIVE_MAX_CITIES = int(os.getenv('WEATHER_LIVE_MAX_CITIES', '10'))
+WEATHER_LIVE_MAX_STREAMS = int(os.getenv('WEATHER_LIVE_MAX_STREAMS', '1000'))
+# Хранить в кэше вместе с результатом его JSON, чтобы ответ API не сериализовался заново
+WEATHER_CACHE_ENCODED_RESPONSES = os.getenv('WEATHER_CACHE_ENCODED_RESPONSES', 'True') == 'True'
+# Быстрый JSON-рендерер WeatherViewSet (orjson, если установлен)
+WEATHER_FAST_JSON = os.getenv('WEATHER_FAST_JSON', 'True') == 'True'
+# Шаг сетки привязки координат, градусов (0.01 ~ 1 км)
+WEATHER_COORD_GRID = float(os.getenv('WEATHER_COORD_GRID', '0.01'))
+# Радиус, в котором погода известной точки используется для запроса по координатам, км
+WEATHER_GEO_REUSE_RADIUS_KM = float(os.getenv('WEATHER_GEO_REUSE_RADIUS_KM', '5'))
+# Как часто перечитывать сохранённые локации в геоиндекс, сек
+WEATHER_GEO_LOCATIONS_MAX_AGE = int(os.getenv('WEATHER_GEO_LOCATIONS_MAX_AGE', '300'))
+# Алиас из CACHES для общего уровня кэша; пустое значение - только память процесса
+WEATHER_CACHE_BACKEND = os.getenv('WEATHER_CACHE_BACKEND', '') or None
+# Объединение одновременных запросов одного ключа между процессами через блокировку
+# в общем кэше (нужен WEATHER_CACHE_BACKEND с атомарным add: Redis, Memcached)
+WEATHER_SINGLEFLIGHT_DISTRIBUTED = os.getenv('WEATHER_SINGLEFLIGHT_DISTRIBUTED', 'False') == 'True'
+WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT = float(os.getenv('WEATHER_SINGLEFLIGHT_LOCK_TIMEOUT', '10'))
+
+# Учёт времени запросов, обращений к API, кэшу и БД: /metrics и заголовок Server-Timing
+WEATHER_INSTRUMENTATION = os.getenv('WEATHER_INSTRUMENTATION', 'True') == 'True'
+WEATHER_SERVER_TIMING = os.getenv('WEATHER_SERVER_TIMING', 'True') == 'True'
+# Токен сборщика метрик для /metrics (Authorization: Bearer); без него - только администраторы
+WEATHER_METRICS_TOKEN = os.getenv('WEATHER_METRICS_TOKEN', '')
+
+# Фрагменты погоды главной страницы и страницы прогноза в кэше Django, сек (0 - без кэша).
+# Ключ фрагмента текущей погоды включает время наблюдения, и новые данные рендерятся
+# сразу. Ключ прогноза - время его первого слота (как у памяти ForecastAggregator):
+# обновлённый прогноз того же периода появится не позже чем через этот срок
+WEATHER_FRAGMENT_CACHE_TTL = int(os.getenv('WEATHER_FRAGMENT_CACHE_TTL', '600'))
+
+# Сколько хранить в кэше Django локацию по умолчанию пользователя, сек
+WEATHER_DEFAULT_LOCATION_TTL = int(os.getenv('WEATHER_DEFAULT_LOCATION_TTL', '300'))
+
+# Справочник городов (weather/data, manage.py build_gazetteer): проверка названий
+# без обращения к API, синонимы и запросы к API по координатам
+WEATHER_GAZETTEER = os.getenv('WEATHER_GAZETTEER', 'True') == 'True'
+# Каталог с cities.tsv и city_names.tsv, если справочник собран из GeoNames отдельно
+WEATHER_GAZETTEER_PATH = os.getenv('WEATHER_GAZETTEER_PATH', '')
+# True - города вне справочника не принимаются; False - проверяются запросом к API
+WEATHER_GAZETTEER_STRICT = os.getenv('WEATHER_GAZETTEER_STRICT', 'False') == 'True'
+
+# Фоновое обновление погоды (manage.py refresh_weather); период меньше TTL кэша
+WEATHER_REFRESH_INTERVAL = int(os.getenv('WEATHER_REFRESH_INTERVAL', '300'))
+WEATHER_REFRESH_CONCURRENCY = int(os.getenv('WEATHER_REFRESH_CONCURRENCY', '4'))
+WEATHER_REFRESH_JITTER = float(os.getenv('WEATHER_REFRESH_JITTER', '5'))
+
+# Запись наблюдений в WeatherData: размер пачки bulk_create и максимальная задержка записи, сек
+WEATHER_RECORD_OBSERVATIONS = os.getenv('WEATHER_RECORD_OBSERVATIONS', 'True') == 'True'
+WEATHER_RECORD_BATCH_SIZE = int(os.getenv('WEATHER_RECORD_BATCH_SIZE', '100'))
+WEATHER_RECORD_FLUSH_INTERVAL = float(os.getenv('WEATHER_RECORD_FLUSH_INTERVAL', '5'))
 
 # Настройки аутентификации
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
+# Пользователь сессии читается из кэша Django, а не из auth_user на каждом запросе.
+# ModelBackend остаётся для сессий, созданных до CachedModelBackend: в сессии
+# записан путь бэкенда, и без него в списке пользователей бы разлогинило
+AUTHENTICATION_BACKENDS = [
+    'weather.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Сколько хранить пользователя в кэше, сек (0 - не кэшировать). Сбрасывается при
+# сохранении пользователя и выходе, но только в общем кэше: с кэшем в памяти другие
+# воркеры видели бы прежнего пользователя (например, со старым паролем), поэтому
+# по умолчанию пользователь кэшируется только с REDIS_URL
+WEATHER_USER_CACHE_TTL = int(os.getenv('WEATHER_USER_CACHE_TTL', '60' if os.getenv('REDIS_URL') else '0'))
+# Хранилище сессий: db, cached_db (чтение из кэша, запись в БД) или cache (только кэш).
+# Кэш в памяти у каждого воркера свой, и сессия, удалённая при выходе в одном воркере,
+# оставалась бы в кэше остальных, поэтому по умолчанию кэш сессий - только с REDIS_URL
+WEATHER_SESSION_BACKEND = os.getenv('WEATHER_SESSION_BACKEND', 'cached_db' if os.getenv('REDIS_URL') else 'db')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{WEATHER_SESSION_BACKEND}'
 
 # Настройки сообщений
 from django.contrib.messages import constants as messages
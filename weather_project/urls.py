@@ -2,11 +2,10 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.schemas import get_schema_view
 from django.contrib.auth import views as auth_views
-from weather.views import WeatherViewSet, LocationViewSet, home, forecast_view, register
+from weather.views import CityViewSet, WeatherViewSet, LocationViewSet, home, forecast_view, live_weather, prometheus_metrics, register
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
@@ -14,6 +13,7 @@ from rest_framework import permissions
 router = DefaultRouter()
 router.register(r'locations', LocationViewSet, basename='location')
 router.register(r'weather', WeatherViewSet, basename='weather')
+router.register(r'cities', CityViewSet, basename='city')
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -27,7 +27,10 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # До роутера: иначе weather/live/ совпадёт с detail-маршрутом WeatherViewSet
+    path('api/weather/live/', live_weather, name='weather-live'),
     path('api/', include(router.urls)),
+    path('metrics', prometheus_metrics, name='prometheus-metrics'),
     path('api-auth/', include('rest_framework.urls')),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
@@ -41,11 +44,6 @@ urlpatterns = [
     path('register/', register, name='register'),
 ]
 
+# Без DEBUG статику отдаёт WhiteNoiseMiddleware, загружаемых файлов у приложения нет
 if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    urlpatterns += [
-        path('static/<path:path>', serve, {'document_root': settings.STATIC_ROOT}),
-        path('media/<path:path>', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file